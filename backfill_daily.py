@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+from datetime import datetime
+
+from data2sql import load_mysql_config, connect_database
+
+# 每批处理的设备数量
+DEFAULT_BATCH_DEVICES = 200
+
+def backfill_batch(connection, device_ids, start_day=None):
+    """
+    按 data 表重算一批设备的日汇总并覆盖 data_daily
+
+    窗口函数在全部历史读数上计算，开始日期只限制写入的日期，因此开始日期当天的第一条读数
+    也能和前一天的最后一条读数比较余额。
+
+    Args:
+        connection: 数据库连接
+        device_ids (list): 本批次的设备ID
+        start_day (str): 只重算该日期（YYYY-MM-DD）及之后的日汇总，为None时重算全部
+
+    Returns:
+        int: 影响行数（新增的日汇总计1，内容有变化的已有日汇总计2）
+    """
+    placeholders = ", ".join(["%s"] * len(device_ids))
+    params = list(device_ids)
+    date_filter = ""
+    if start_day is not None:
+        date_filter = "WHERE read_date >= %s"
+        params.append(start_day)
+    sql = f"""
+        INSERT INTO data_daily (device_id, read_date, last_read_time, last_total_reading, last_remaining_balance,
+                                daily_usage, topup_amount, reading_count, updated_at)
+        SELECT device_id, read_date, MAX(read_time), MAX(last_total_reading), MAX(last_remaining_balance),
+               COALESCE(SUM(diff_reading), 0),
+               COALESCE(SUM(CASE WHEN balance_delta > 0 THEN balance_delta END), 0),
+               COUNT(*), NOW()
+        FROM (
+            SELECT device_id, DATE(read_time) AS read_date, read_time, diff_reading,
+                   FIRST_VALUE(total_reading) OVER (PARTITION BY device_id, DATE(read_time) ORDER BY read_time DESC) AS last_total_reading,
+                   FIRST_VALUE(remainingBalance) OVER (PARTITION BY device_id, DATE(read_time) ORDER BY read_time DESC) AS last_remaining_balance,
+                   remainingBalance - LAG(remainingBalance) OVER (PARTITION BY device_id ORDER BY read_time) AS balance_delta
+            FROM data
+            WHERE device_id IN ({placeholders})
+        ) w
+        {date_filter}
+        GROUP BY device_id, read_date
+        ON DUPLICATE KEY UPDATE
+        last_read_time = VALUES(last_read_time),
+        last_total_reading = VALUES(last_total_reading),
+        last_remaining_balance = VALUES(last_remaining_balance),
+        daily_usage = VALUES(daily_usage),
+        topup_amount = VALUES(topup_amount),
+        reading_count = VALUES(reading_count),
+        updated_at = VALUES(updated_at)
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        affected = cursor.rowcount
+    connection.commit()
+    return affected
+
+def main():
+    # 检查命令行参数
+    if len(sys.argv) > 3:
+        print("用法: ./backfill_daily.py [每批设备数量] [开始日期YYYY-MM-DD]")
+        sys.exit(1)
+
+    batch_devices = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BATCH_DEVICES
+    start_day = sys.argv[2] if len(sys.argv) > 2 else None
+    if start_day is not None:
+        try:
+            datetime.strptime(start_day, '%Y-%m-%d')
+        except ValueError:
+            print("开始日期格式错误，应为 YYYY-MM-DD")
+            sys.exit(1)
+
+    # 加载MySQL配置
+    try:
+        mysql_config = load_mysql_config()
+        print("MySQL配置加载成功")
+    except Exception as e:
+        print(f"加载MySQL配置失败: {e}")
+        sys.exit(1)
+
+    # 连接数据库
+    connection = connect_database(mysql_config)
+    if not connection:
+        print("数据库连接失败")
+        sys.exit(1)
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT id FROM device ORDER BY id")
+            device_ids = [row[0] for row in cursor.fetchall()]
+
+        print(f"共 {len(device_ids)} 台设备，每批 {batch_devices} 台，重算范围: {start_day or '全部日期'}")
+        start_time = time.time()
+        total_affected = 0
+        for start in range(0, len(device_ids), batch_devices):
+            batch = device_ids[start:start + batch_devices]
+            try:
+                affected = backfill_batch(connection, batch, start_day)
+            except Exception as e:
+                print(f"重算第 {start + 1}-{start + len(batch)} 台设备失败: {e}")
+                connection.rollback()
+                continue
+            total_affected += affected
+            print(f"已处理 {start + len(batch)}/{len(device_ids)} 台设备，本批影响 {affected} 行")
+
+        print(f"重算完成，共影响 {total_affected} 行，耗时 {time.time() - start_time:.2f} 秒")
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    main()
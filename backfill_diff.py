@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+
+from data2sql import load_mysql_config, connect_database
+
+# 每批处理的设备数量
+DEFAULT_BATCH_DEVICES = 200
+
+def backfill_batch(connection, device_ids):
+    """
+    使用窗口函数回填一批设备的diff_reading
+    
+    Args:
+        connection: 数据库连接
+        device_ids (list): 本批次的设备ID
+        
+    Returns:
+        int: 更新的记录数
+    """
+    placeholders = ", ".join(["%s"] * len(device_ids))
+    sql = f"""
+        UPDATE data d
+        JOIN (
+            SELECT id,
+                   total_reading - LAG(total_reading) OVER (PARTITION BY device_id ORDER BY read_time) AS diff
+            FROM data
+            WHERE device_id IN ({placeholders})
+        ) w ON d.id = w.id
+        SET d.diff_reading = w.diff
+        WHERE d.diff_reading IS NULL AND w.diff IS NOT NULL
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, device_ids)
+        updated = cursor.rowcount
+    connection.commit()
+    return updated
+
+def main():
+    # 检查命令行参数
+    if len(sys.argv) > 2:
+        print("用法: ./backfill_diff.py [每批设备数量]")
+        sys.exit(1)
+    
+    batch_devices = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BATCH_DEVICES
+    
+    # 加载MySQL配置
+    try:
+        mysql_config = load_mysql_config()
+        print("MySQL配置加载成功")
+    except Exception as e:
+        print(f"加载MySQL配置失败: {e}")
+        sys.exit(1)
+    
+    # 连接数据库
+    connection = connect_database(mysql_config)
+    if not connection:
+        print("数据库连接失败")
+        sys.exit(1)
+    
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT id FROM device ORDER BY id")
+            device_ids = [row[0] for row in cursor.fetchall()]
+        
+        print(f"共 {len(device_ids)} 台设备，每批 {batch_devices} 台")
+        start_time = time.time()
+        total_updated = 0
+        for start in range(0, len(device_ids), batch_devices):
+            batch = device_ids[start:start + batch_devices]
+            try:
+                updated = backfill_batch(connection, batch)
+            except Exception as e:
+                print(f"回填第 {start + 1}-{start + len(batch)} 台设备失败: {e}")
+                connection.rollback()
+                continue
+            total_updated += updated
+            print(f"已处理 {start + len(batch)}/{len(device_ids)} 台设备，本批更新 {updated} 条记录")
+        
+        print(f"回填完成，共更新 {total_updated} 条记录，耗时 {time.time() - start_time:.2f} 秒")
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    main()
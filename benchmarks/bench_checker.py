@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+预警检查基准测试：逐个订阅查询最新读数（N+1）vs 一条关联查询
+
+使用 SQLite 临时库模拟 MySQL，生成大量订阅（多个订阅共享同一台设备），统计一轮预警检查
+需要的查询次数和耗时。逐个查询的方式与改造前的 email_checker.check_and_alert 一样使用
+10 个线程并发；可以通过 --latency-ms 为每次查询加入固定延迟，模拟数据库在另一台机器上的情况。
+
+用法: python3 benchmarks/bench_checker.py [--subscriptions 10000] [--devices 2000] [--latency-ms 0.5]
+"""
+
+import os
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+SCHEMA = """
+CREATE TABLE device (
+    id TEXT PRIMARY KEY,
+    equipmentName TEXT,
+    installationSite TEXT
+);
+CREATE TABLE device_latest (
+    device_id TEXT PRIMARY KEY,
+    read_time TEXT NOT NULL,
+    total_reading REAL,
+    remainingBalance REAL,
+    equipmentStatus INTEGER
+);
+CREATE TABLE email (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT NOT NULL,
+    device_id TEXT NOT NULL,
+    alarm_num INTEGER,
+    equipment_type INTEGER NOT NULL,
+    verifi_statu INTEGER DEFAULT 0,
+    change_device_statu INTEGER DEFAULT 0,
+    life_end_time TEXT NOT NULL
+);
+CREATE INDEX idx_email_device ON email (device_id);
+"""
+
+# 改造前：先查询所有活跃订阅，再逐个查询设备最新读数
+SUBSCRIPTIONS_SQL = """
+    SELECT e.email, e.device_id, e.alarm_num, e.equipment_type, d.equipmentName, d.installationSite
+    FROM email e
+    LEFT JOIN device d ON e.device_id = d.id
+    WHERE e.verifi_statu = 1
+    AND e.change_device_statu = 0
+    AND e.life_end_time > NOW()
+"""
+LATEST_SQL = """
+    SELECT total_reading, remainingBalance, equipmentStatus, read_time
+    FROM device_latest
+    WHERE device_id = %s
+"""
+
+# 改造后：与 server/email_checker.get_alert_candidates 相同的关联查询
+CANDIDATES_SQL = """
+    SELECT e.email, e.device_id, e.alarm_num, e.equipment_type, d.equipmentName, d.installationSite,
+           l.total_reading, l.remainingBalance, l.equipmentStatus, l.read_time
+    FROM email e
+    JOIN device_latest l ON l.device_id = e.device_id
+    LEFT JOIN device d ON e.device_id = d.id
+    WHERE e.verifi_statu = 1
+    AND e.change_device_statu = 0
+    AND e.life_end_time > NOW()
+    AND COALESCE(l.remainingBalance, 0) < e.alarm_num
+"""
+
+class Database:
+    """SQLite 临时库，每个线程使用自己的连接，统计查询次数"""
+
+    def __init__(self, path, latency):
+        self.path = path
+        self.latency = latency
+        self.queries = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def query(self, sql, params=()):
+        if not hasattr(self.local, 'conn'):
+            self.local.conn = sqlite3.connect(self.path)
+        with self.lock:
+            self.queries += 1
+        if self.latency:
+            time.sleep(self.latency)
+        sql = sql.replace('%s', '?').replace('NOW()', "datetime('now')")
+        return self.local.conn.execute(sql, params).fetchall()
+
+def populate(path, subscription_count, device_count):
+    """生成设备、最新读数和订阅数据"""
+    rng = random.Random(0)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany("INSERT INTO device VALUES (?, ?, ?)",
+                     [(f"D{i:06d}", f"设备{i}", f"{i // 100}栋") for i in range(device_count)])
+    conn.executemany("INSERT INTO device_latest VALUES (?, '2026-10-01 08:00:00', ?, ?, 1)",
+                     [(f"D{i:06d}", 1000.0 + i, rng.uniform(0, 100)) for i in range(device_count)])
+    conn.executemany(
+        "INSERT INTO email (email, device_id, alarm_num, equipment_type, verifi_statu, life_end_time) "
+        "VALUES (?, ?, ?, 0, 1, '2099-01-01 00:00:00')",
+        [(f"user{i}@example.com", f"D{rng.randrange(device_count):06d}", rng.choice((10, 20, 30)))
+         for i in range(subscription_count)]
+    )
+    conn.commit()
+    conn.close()
+
+def legacy_check(db):
+    """改造前的实现：活跃订阅查询 + 每个订阅一次最新读数查询"""
+    subscriptions = db.query(SUBSCRIPTIONS_SQL)
+
+    def process(row):
+        latest = db.query(LATEST_SQL, (row[1],))
+        if latest and (latest[0][1] or 0.0) < row[2]:
+            return row[0], row[1]
+        return None
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        return {alert for alert in pool.map(process, subscriptions) if alert}
+
+def batched_check(db):
+    """改造后的实现：一条关联查询直接得到需要预警的订阅"""
+    return {(row[0], row[1]) for row in db.query(CANDIDATES_SQL)}
+
+def measure(check, path, latency):
+    db = Database(path, latency)
+    start = time.perf_counter()
+    alerts = check(db)
+    return alerts, db.queries, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='预警检查基准测试')
+    parser.add_argument('--subscriptions', type=int, default=10000, help='活跃订阅数量')
+    parser.add_argument('--devices', type=int, default=2000, help='设备数量')
+    parser.add_argument('--latency-ms', type=float, default=0.5, help='每次查询的模拟延迟（毫秒）')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'bench.db')
+        populate(path, args.subscriptions, args.devices)
+        latency = args.latency_ms / 1000
+
+        legacy_alerts, legacy_queries, legacy_time = measure(legacy_check, path, latency)
+        batched_alerts, batched_queries, batched_time = measure(batched_check, path, latency)
+
+    print(f"订阅数量: {args.subscriptions}, 设备数量: {args.devices}, 模拟查询延迟: {args.latency_ms} ms")
+    print(f"逐个查询: {legacy_queries} 次查询 / {legacy_time * 1000:.1f} ms, 需要预警 {len(legacy_alerts)} 个订阅")
+    print(f"关联查询: {batched_queries} 次查询 / {batched_time * 1000:.1f} ms, 需要预警 {len(batched_alerts)} 个订阅")
+    print(f"预警结果一致: {legacy_alerts == batched_alerts}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+上游客户端基准测试：子进程调用链 vs 进程内客户端
+
+在本地启动一个模拟 sywap.funsine.com 的 HTTP 服务，分别用两种方式完成一次完整轮询
+（登录 -> 查询余额 -> 查询设备列表），统计平均耗时和新建TCP连接数。
+
+用法: python3 benchmarks/bench_client.py [轮询次数]
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from sany_client import SanyClient
+
+# 模拟接口返回的数据
+LOGIN_RESULT = {"code": 200, "msg": "操作成功", "user": {"appUserId": "10001", "roleId": 2}}
+ACCT_RESULT = {"code": 200, "rows": [{"acctName": "电表", "remainingBalance": 35.5}]}
+EQUIPMENT_RESULT = {"code": 200, "total": 1, "rows": [{"id": "1", "equipmentName": "7栋301"}]}
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connection_count += 1
+
+    def _reply(self, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if '/appUserAcct/list' in self.path:
+            self._reply(ACCT_RESULT)
+        else:
+            self._reply(EQUIPMENT_RESULT)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        self._reply(LOGIN_RESULT)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server():
+    """启动模拟上游服务，返回 (server, base_url)"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connection_count = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/prod-api"
+
+def run_script(script, *args, env=None):
+    """以子进程方式运行脚本并解析其JSON输出"""
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT_DIR, script)] + list(args),
+        capture_output=True, text=True, check=True, env=env, cwd=ROOT_DIR
+    )
+    return json.loads(result.stdout)
+
+def poll_subprocess(env):
+    """旧方式：每一步启动一个新解释器"""
+    login_result = run_script('login.py', '13800000000', 'password', env=env)
+    user = login_result['user']
+    run_script('get_data.py', user['appUserId'], str(user['roleId']), env=env)
+    run_script('check_data.py', user['appUserId'], str(user['roleId']), '1', '100', env=env)
+
+def poll_in_process(client):
+    """新方式：进程内直接调用，复用同一个会话"""
+    login_result = client.login('13800000000', 'password')
+    user = login_result['user']
+    client.get_utility_data(user['appUserId'], user['roleId'])
+    client.list_equipment(user['appUserId'], user['roleId'], 1, 100)
+
+def measure(server, rounds, poll):
+    """执行若干轮轮询，返回 (平均耗时毫秒, 新建连接数)"""
+    server.connection_count = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        poll()
+    elapsed = time.perf_counter() - start
+    return elapsed / rounds * 1000, server.connection_count
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    server, base_url = start_stub_server()
+    env = dict(os.environ, SANY_API_BASE_URL=base_url)
+
+    sub_ms, sub_conns = measure(server, rounds, lambda: poll_subprocess(env))
+    client = SanyClient(base_url=base_url)
+    inproc_ms, inproc_conns = measure(server, rounds, lambda: poll_in_process(client))
+    client.close()
+    server.shutdown()
+
+    print(f"轮询次数: {rounds}")
+    print(f"子进程调用链: 平均 {sub_ms:.2f} ms/次, 新建连接 {sub_conns}")
+    print(f"进程内客户端: 平均 {inproc_ms:.2f} ms/次, 新建连接 {inproc_conns}")
+    print(f"加速比: {sub_ms / inproc_ms:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+读数接口返回格式基准测试：逐行对象（format=rows）vs 按列数组（format=columnar）
+
+用 server.py 的格式化函数把模拟的读数（Decimal 和 datetime，与 pymysql 的返回类型相同）转换为两种格式，
+按服务器的方式编码，统计响应体字节数（原始、gzip、brotli）和客户端的解析耗时。逐行格式的解析耗时
+包括 json.loads 和对每个读数字段 float()（对应 main.js 原来的 parseFloat），按列格式只有 json.loads。
+浏览器中 JSON.parse 的耗时同样随字符数和对象数增长，这里的比例可以作为参考。
+
+用法: python3 benchmarks/bench_columnar.py [--points 1000] [--devices 20] [--repeat 50]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import argparse
+import contextlib
+from decimal import Decimal
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_server import DEVICE_ROW, load_server_module
+
+def make_rows(device_id, points, seed):
+    """生成一个设备的读数 (device_id, read_time, total_reading, remainingBalance, diff_reading)，读表时间倒序"""
+    rng = random.Random(seed)
+    rows = []
+    read_time = datetime(2026, 10, 1, 8, 0) - timedelta(seconds=rng.randint(0, 3600))
+    total = Decimal(rng.randint(100000, 900000)) / 100
+    balance = Decimal(rng.randint(1000, 30000)) / 100
+    for _ in range(points):
+        diff = Decimal(rng.randint(0, 300)) / 100
+        rows.append((device_id, read_time, total, balance, diff))
+        # 采集间隔约半小时，有抖动
+        read_time -= timedelta(seconds=1800 + rng.randint(-90, 90))
+        total -= diff
+        balance += (diff * Decimal('0.6')).quantize(Decimal('0.01'))
+    return rows
+
+def encode(data, columnar):
+    """按列格式与 server.py 现在的编码方式一致，逐行格式按原来的编码方式（默认分隔符）作为对比基准"""
+    if columnar:
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+def parse_rows(body, devices):
+    """逐行格式：解析后逐个读数字段转换为数值"""
+    data = json.loads(body)
+    for device in (data['devices'].values() if devices else [data]):
+        for row in device['rows']:
+            float(row['total_reading'])
+            float(row['remainingBalance'])
+            float(row['diff_reading'])
+    return data
+
+def parse_columnar(body, devices):
+    return json.loads(body)
+
+def time_calls(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+def main():
+    parser = argparse.ArgumentParser(description='读数接口返回格式基准测试')
+    parser.add_argument('--points', type=int, default=1000, help='每个设备的读数条数')
+    parser.add_argument('--devices', type=int, default=20, help='批量查询的设备数')
+    parser.add_argument('--repeat', type=int, default=50, help='解析次数')
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        module = load_server_module(tempfile.mkdtemp(), 1, 0, 0)
+    import response_cache
+
+    cases = []
+    rows = make_rows(DEVICE_ROW[8], args.points, 0)
+    for columnar in (False, True):
+        data = module.format_device_data(DEVICE_ROW, rows, module.format_reading_row,
+                                         module.format_reading_columns, columnar)
+        cases.append((f"check（1个设备 x {args.points} 条）", columnar, False, encode(data, columnar)))
+
+    device_ids = [f"D{i:06d}" for i in range(args.devices)]
+    infos = {device_id: DEVICE_ROW[:8] + (device_id,) for device_id in device_ids}
+    batch_rows = {device_id: make_rows(device_id, args.points, seed) for seed, device_id in enumerate(device_ids)}
+    for columnar in (False, True):
+        devices = {
+            device_id: module.format_device_data(infos[device_id], batch_rows[device_id], module.format_reading_row,
+                                                 module.format_reading_columns, columnar)
+            for device_id in device_ids
+        }
+        data = {"code": 200, "total": len(devices), "devices": devices, "missing": []}
+        cases.append((f"check_batch（{args.devices}个设备 x {args.points} 条）", columnar, True, encode(data, columnar)))
+
+    encodings = ['gzip'] + (['br'] if response_cache.brotli is not None else [])
+    if response_cache.brotli is None:
+        print("未安装 brotli 模块，只统计 gzip")
+    print(f"{'接口':<28} {'格式':<9} {'原始':>10} " + ' '.join(f'{name:>9}' for name in encodings) +
+          f" {'压缩耗时':>9} {'解析耗时':>9}")
+    baseline = {}
+    for name, columnar, devices, body in cases:
+        sizes = []
+        compress_time = 0.0
+        for encoding in encodings:
+            start = time.perf_counter()
+            sizes.append(len(response_cache.compress_body(body, encoding)))
+            compress_time = max(compress_time, time.perf_counter() - start)
+        parse = parse_columnar if columnar else parse_rows
+        parse_time = time_calls(lambda: parse(body, devices), args.repeat)
+        label = 'columnar' if columnar else 'rows'
+        print(f"{name:<28} {label:<9} {len(body) / 1024:>8.1f}KB " +
+              ' '.join(f'{size / 1024:>7.1f}KB' for size in sizes) +
+              f" {compress_time * 1000:>7.2f}ms {parse_time * 1000:>7.2f}ms")
+        if not columnar:
+            baseline[name] = (len(body), sizes, parse_time)
+        else:
+            raw, compressed, rows_parse = baseline[name]
+            print(f"  {'':<26} 原始 {raw / len(body):.1f} 倍，" +
+                  '，'.join(f'{encoding} 后比原逐行格式小 {raw / size:.1f} 倍'
+                           for encoding, size in zip(encodings, sizes)) +
+                  f"，解析快 {rows_parse / parse_time:.1f} 倍")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+读数入库基准测试：逐条查重插入 vs 基于唯一索引的批量幂等插入
+
+使用 SQLite 内存库模拟 MySQL，统计入库一页设备数据所需的数据库往返次数和耗时。
+可以通过 --latency-ms 为每次往返加入固定延迟，模拟数据库在另一台机器上的情况。
+pymysql 会把 executemany 合并成一条多行 INSERT，因此这里把一次 executemany 计为一次往返。
+
+用法: python3 benchmarks/bench_ingest.py [--devices 10000] [--latency-ms 0.5]
+"""
+
+import os
+import sys
+import re
+import time
+import sqlite3
+import argparse
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import data2sql
+
+SCHEMA = """
+CREATE TABLE data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_id TEXT NOT NULL,
+    read_time TEXT NOT NULL,
+    total_reading REAL,
+    diff_reading REAL,
+    remainingBalance REAL,
+    equipmentStatus INTEGER,
+    created_at TEXT NOT NULL,
+    remark TEXT,
+    unStandard INTEGER DEFAULT 0
+);
+CREATE UNIQUE INDEX uk_device_time ON data (device_id, read_time);
+CREATE TABLE device_latest (
+    device_id TEXT PRIMARY KEY,
+    read_time TEXT NOT NULL,
+    total_reading REAL,
+    diff_reading REAL,
+    remainingBalance REAL,
+    equipmentStatus INTEGER,
+    unStandard INTEGER DEFAULT 0,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE data_daily (
+    device_id TEXT NOT NULL,
+    read_date TEXT NOT NULL,
+    last_read_time TEXT NOT NULL,
+    last_total_reading REAL,
+    last_remaining_balance REAL,
+    daily_usage REAL NOT NULL DEFAULT 0,
+    topup_amount REAL NOT NULL DEFAULT 0,
+    reading_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (device_id, read_date)
+);
+CREATE TABLE reading_event (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_id TEXT NOT NULL,
+    read_time TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+"""
+
+# ON DUPLICATE KEY UPDATE 对应的 SQLite 冲突目标（各表的主键）
+CONFLICT_KEYS = {
+    'device_latest': 'device_id',
+    'data_daily': 'device_id, read_date',
+}
+
+class CountingCursor:
+    """把 pymysql 风格的SQL转换给 SQLite 执行，并统计往返次数"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.cursor = connection.raw.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cursor.close()
+
+    @staticmethod
+    def _translate(sql):
+        # SQLite 没有行锁，整个库同时只有一个写事务
+        sql = sql.replace('%s', '?').replace('NOW()', 'CURRENT_TIMESTAMP').replace('FOR UPDATE', '')
+        sql = sql.replace('ON DUPLICATE KEY UPDATE id = id', 'ON CONFLICT DO NOTHING')
+        table = re.search(r'INSERT INTO (\w+)', sql)
+        if table and table.group(1) in CONFLICT_KEYS:
+            sql = sql.replace('ON DUPLICATE KEY UPDATE', f'ON CONFLICT ({CONFLICT_KEYS[table.group(1)]}) DO UPDATE SET')
+        sql = re.sub(r'VALUES\((\w+)\)', r'excluded.\1', sql)
+        return sql.replace('IF(', 'IIF(').replace('GREATEST(', 'MAX(')
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    def execute(self, sql, params=()):
+        self.connection.round_trip()
+        self.cursor.execute(self._translate(sql), tuple(params))
+
+    def executemany(self, sql, seq_params):
+        self.connection.round_trip()
+        self.cursor.executemany(self._translate(sql), seq_params)
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+class CountingConnection:
+    """SQLite 连接包装，模拟 pymysql 连接的接口"""
+
+    def __init__(self, latency):
+        self.raw = sqlite3.connect(':memory:')
+        self.raw.executescript(SCHEMA)
+        self.latency = latency
+        self.round_trips = 0
+
+    def round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def cursor(self):
+        return CountingCursor(self)
+
+    def commit(self):
+        self.round_trip()
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+def legacy_insert_reading_data(connection, device_data):
+    """改造前的实现：每台设备先 SELECT COUNT(*) 再单独 INSERT"""
+    with connection.cursor() as cursor:
+        new_data_count = 0
+        for item in device_data:
+            row = data2sql.build_reading_row(item)
+            cursor.execute("SELECT COUNT(*) FROM data WHERE device_id = %s AND read_time = %s", (row[0], row[1]))
+            if cursor.fetchone()[0] == 0:
+                cursor.execute("""
+                    INSERT INTO data (device_id, read_time, total_reading, remainingBalance,
+                                     equipmentStatus, created_at, unStandard)
+                    VALUES (%s, %s, %s, %s, %s, NOW(), %s)
+                """, row[:5] + (row[5],))
+                new_data_count += 1
+        if new_data_count > 0:
+            connection.commit()
+
+def make_devices(count, round_no):
+    """生成模拟的一页设备数据"""
+    return [{
+        'id': f"D{i:06d}",
+        'currentDealDate': f"2026-10-{round_no:02d} 08:00:00",
+        'equipmentCurrentLarge': str(1000 + i),
+        'remainingBalance': str(50 + i % 30),
+        'equipmentStatus': '开'
+    } for i in range(count)]
+
+def measure(insert_func, devices, latency):
+    """首次入库（全部为新数据）后再重复入库一次（全部重复），返回每次的 (往返次数, 耗时)"""
+    connection = CountingConnection(latency)
+    results = []
+    for _ in range(2):
+        connection.round_trips = 0
+        start = time.perf_counter()
+        insert_func(connection, devices)
+        results.append((connection.round_trips, time.perf_counter() - start))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='读数入库基准测试')
+    parser.add_argument('--devices', type=int, default=10000, help='设备数量')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='每次数据库往返的模拟延迟（毫秒）')
+    args = parser.parse_args()
+
+    devices = make_devices(args.devices, 1)
+    latency = args.latency_ms / 1000
+
+    # 屏蔽入库函数的输出
+    devnull = open(os.devnull, 'w')
+    stdout, sys.stdout = sys.stdout, devnull
+    try:
+        legacy = measure(legacy_insert_reading_data, devices, latency)
+        bulk = measure(data2sql.insert_reading_data, devices, latency)
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+
+    print(f"设备数量: {args.devices}, 模拟往返延迟: {args.latency_ms} ms")
+    for label, (first, second) in (("逐条查重插入", legacy), ("批量幂等插入", bulk)):
+        print(f"{label}: 首次入库 {first[0]} 次往返 / {first[1] * 1000:.1f} ms, "
+              f"重复入库 {second[0]} 次往返 / {second[1] * 1000:.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+数据库连接池基准测试：原来的 Queue 连接池（启动时建满连接，取出和归还各 ping 一次）
+vs server/db_pool.py（按需建立连接，只检查空闲过久的连接）
+
+模拟连接的每次 ping 和查询都休眠一个网络往返时间（--rtt-ms），建立连接休眠 --connect-ms。
+多个线程反复“取连接、执行一条查询、归还”，统计启动耗时、每个请求的耗时和数据库往返次数。
+
+用法: python3 benchmarks/bench_pool.py [--threads 16] [--requests 4000] [--rtt-ms 0.5] [--connect-ms 20]
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+from queue import Queue
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'server'))
+
+from db_pool import ConnectionPool
+
+class FakeConnection:
+    """ping 和查询各休眠一个往返时间，并统计往返次数"""
+
+    open = True
+
+    def __init__(self, stats, rtt, connect_time):
+        self.stats = stats
+        self.rtt = rtt
+        time.sleep(connect_time)
+
+    def round_trip(self, kind):
+        time.sleep(self.rtt)
+        with self.stats['lock']:
+            self.stats[kind] += 1
+
+    def ping(self, reconnect=False):
+        self.round_trip('pings')
+
+    def query(self):
+        self.round_trip('queries')
+
+    def close(self):
+        pass
+
+class LegacyPool:
+    """原来 server.py 的连接池：启动时建立全部连接，取出和归还时都 ping"""
+
+    def __init__(self, connect, size):
+        self.pool = Queue(maxsize=size)
+        for _ in range(size):
+            self.pool.put(connect())
+
+    def acquire(self):
+        conn = self.pool.get(timeout=2)
+        conn.ping(reconnect=True)
+        return conn
+
+    def release(self, conn):
+        conn.ping(reconnect=True)
+        self.pool.put_nowait(conn)
+
+def run(make_pool, threads, requests, rtt, connect_time):
+    stats = {'lock': threading.Lock(), 'pings': 0, 'queries': 0}
+    start = time.perf_counter()
+    pool = make_pool(lambda: FakeConnection(stats, rtt, connect_time))
+    startup = time.perf_counter() - start
+
+    per_thread = requests // threads
+    def worker():
+        for _ in range(per_thread):
+            conn = pool.acquire()
+            try:
+                conn.query()
+            finally:
+                pool.release(conn)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return pool, startup, elapsed, per_thread * threads, stats
+
+def report(name, threads, startup, elapsed, count, stats):
+    print(f"{name}: 启动 {startup * 1000:.0f} ms，{count / elapsed:.0f} 请求/秒，"
+          f"平均每个请求 {elapsed / count * threads * 1000:.2f} ms，"
+          f"每个请求 {(stats['pings'] + stats['queries']) / count:.1f} 次数据库往返（ping {stats['pings']} 次）")
+
+def main():
+    parser = argparse.ArgumentParser(description='数据库连接池基准测试')
+    parser.add_argument('--threads', type=int, default=16, help='并发线程数')
+    parser.add_argument('--requests', type=int, default=4000, help='总请求数')
+    parser.add_argument('--pool-size', type=int, default=30, help='连接池大小')
+    parser.add_argument('--rtt-ms', type=float, default=0.5, help='数据库网络往返时间（毫秒）')
+    parser.add_argument('--connect-ms', type=float, default=20, help='建立一个连接的耗时（毫秒）')
+    args = parser.parse_args()
+    rtt = args.rtt_ms / 1000
+    connect_time = args.connect_ms / 1000
+
+    print(f"并发线程: {args.threads}, 总请求数: {args.requests}, 连接池大小: {args.pool_size}, "
+          f"往返 {args.rtt_ms} ms, 建立连接 {args.connect_ms} ms")
+    _, *legacy = run(lambda connect: LegacyPool(connect, args.pool_size),
+                     args.threads, args.requests, rtt, connect_time)
+    report("原连接池（每次取出和归还各 ping 一次）", args.threads, *legacy)
+    pool, *shared = run(lambda connect: ConnectionPool(connect, args.pool_size),
+                        args.threads, args.requests, rtt, connect_time)
+    report("db_pool.ConnectionPool", args.threads, *shared)
+    stats = pool.stats()
+    print(f"  建立 {stats['counters']['created']} 个连接，使用中峰值 {stats['peak_in_use']}，"
+          f"等待 {stats['counters']['waits']} 次")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+设备搜索基准测试：LIKE '%关键词%' 全表扫描 vs 内存 bigram 倒排索引（server/device_index.py）
+
+生成模拟的楼栋、房间设备档案，放入 SQLite 内存库执行改造前的查询（两个双百分号 LIKE，
+没有 LIMIT），再用同样的数据建立倒排索引，按关键词统计单次查询的 p50/p99 延迟，
+并核对两者匹配到的设备集合一致。SQLite 与进程在同一台机器上，实际 MySQL 的全表扫描
+还要加上网络往返和结果集传输，因此这里是改造前耗时的下限。
+最后统计输入联想（mode=suggest 使用的安装位置前缀查询）的单次耗时。
+
+用法: python3 benchmarks/bench_search.py [--devices 50000] [--repeat 50]
+"""
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'server'))
+
+from device_index import DeviceIndex
+
+# 覆盖不同选择性的关键词：单个房间、整层、整栋、常见设备类型、没有结果
+KEYWORDS = ['7栋601', '12栋3楼', '7栋', '饮水机', '楼道中间', '宿舍电表', 'a区', '不存在的设备']
+
+# 输入联想的前缀：用户逐字输入楼栋和房间号的过程
+SUGGEST_PREFIXES = ['7', '7栋', '7栋3', '7栋3楼', '7栋3楼30', 'a区12栋5', 'ａ区１２栋', '不存在']
+
+LEGACY_SQL = """
+    SELECT equipmentName, installationSite, id, equipmentType, status
+    FROM device WHERE equipmentName LIKE ? OR installationSite LIKE ?
+"""
+
+def make_devices(count, seed=1):
+    """生成模拟设备档案 (设备ID, 设备名称, 安装位置, 设备类型, 状态)"""
+    rng = random.Random(seed)
+    rows = []
+    zones = ['A区', 'B区', 'C区', '']
+    while len(rows) < count:
+        building = rng.randint(1, 80)
+        floor = rng.randint(1, 20)
+        zone = rng.choice(zones)
+        kind = rng.random()
+        if kind < 0.7:
+            room = rng.randint(1, 40)
+            name = f"{zone}{building}栋{floor}{room:02d}宿舍{'电表' if rng.random() < 0.6 else '水表'}"
+            site = f"{zone}{building}栋{floor}楼{floor}{room:02d}"
+        elif kind < 0.9:
+            name = f"{zone}{building}栋{floor}楼楼道中间大厅饮水机"
+            site = f"{zone}{building}栋{floor}楼楼道中间大厅"
+        else:
+            name = f"{zone}{building}栋{floor}楼公共照明"
+            site = f"{zone}{building}栋配电房"
+        rows.append((f"{len(rows) + 24000}", name, site, 0 if '电' in name or '照明' in name else 1, 1))
+    return rows
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def time_calls(func, repeat):
+    """重复调用并返回每次的耗时（秒）和最后一次的结果"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+def main():
+    parser = argparse.ArgumentParser(description='设备搜索基准测试')
+    parser.add_argument('--devices', type=int, default=50000, help='设备数量')
+    parser.add_argument('--repeat', type=int, default=50, help='每个关键词的查询次数')
+    parser.add_argument('--page-size', type=int, default=50, help='索引查询每页返回的设备数')
+    parser.add_argument('--suggest-repeat', type=int, default=2000, help='每个联想前缀的查询次数')
+    args = parser.parse_args()
+
+    rows = make_devices(args.devices)
+
+    db = sqlite3.connect(':memory:')
+    db.execute("""CREATE TABLE device (id TEXT PRIMARY KEY, equipmentName TEXT, installationSite TEXT,
+                                      equipmentType INTEGER, status INTEGER)""")
+    db.executemany("INSERT INTO device VALUES (?, ?, ?, ?, ?)", rows)
+
+    start = time.perf_counter()
+    index = DeviceIndex(rows)
+    build_time = time.perf_counter() - start
+
+    # tracemalloc 会明显拖慢建索引，内存单独再建一次统计
+    tracemalloc.start()
+    traced_index = DeviceIndex(rows)
+    index_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del traced_index
+
+    print(f"设备数量: {args.devices}, 每个关键词查询 {args.repeat} 次")
+    print(f"建立索引耗时 {build_time * 1000:.0f} ms，占用内存约 {index_bytes / 1024 / 1024:.1f} MB，"
+          f"{len(index.postings)} 个 bigram")
+    print(f"{'关键词':<10} {'匹配数':>7} {'LIKE p50':>10} {'LIKE p99':>10} {'索引 p50':>10} {'索引 p99':>10}")
+
+    legacy_all = []
+    indexed_all = []
+    for keyword in KEYWORDS:
+        term = f"%{keyword}%"
+        legacy_timings, legacy_rows = time_calls(lambda: db.execute(LEGACY_SQL, (term, term)).fetchall(), args.repeat)
+        indexed_timings, (total, _) = time_calls(lambda: index.search(keyword, 0, args.page_size), args.repeat)
+
+        # 核对匹配到的设备集合与 LIKE 一致
+        _, all_matches = index.search(keyword, 0, len(rows))
+        if {row[2] for row in legacy_rows} != {row[0] for row in all_matches} or total != len(legacy_rows):
+            print(f"关键词 {keyword} 的索引结果与 LIKE 不一致")
+            sys.exit(1)
+
+        legacy_all.extend(legacy_timings)
+        indexed_all.extend(indexed_timings)
+        print(f"{keyword:<10} {total:>7} {percentile(legacy_timings, 0.5) * 1000:>8.2f}ms "
+              f"{percentile(legacy_timings, 0.99) * 1000:>8.2f}ms {percentile(indexed_timings, 0.5) * 1000:>8.3f}ms "
+              f"{percentile(indexed_timings, 0.99) * 1000:>8.3f}ms")
+
+    print(f"全部关键词: LIKE p50 {percentile(legacy_all, 0.5) * 1000:.2f} ms / p99 {percentile(legacy_all, 0.99) * 1000:.2f} ms，"
+          f"索引 p50 {percentile(indexed_all, 0.5) * 1000:.3f} ms / p99 {percentile(indexed_all, 0.99) * 1000:.3f} ms")
+
+    print(f"\n输入联想（{len(index.site_keys)} 个不同的安装位置，每个前缀查询 {args.suggest_repeat} 次，返回前10个）")
+    suggest_all = []
+    for prefix in SUGGEST_PREFIXES:
+        timings, (more, results) = time_calls(lambda: index.suggest(prefix, 10), args.suggest_repeat)
+        suggest_all.extend(timings)
+        first = results[0][0] if results else '-'
+        print(f"  {prefix:<10} {len(results):>2} 个{'+' if more else ' '} 首项 {first:<16} "
+              f"p50 {percentile(timings, 0.5) * 1e6:6.1f} µs, p99 {percentile(timings, 0.99) * 1e6:6.1f} µs")
+    print(f"全部前缀: p50 {percentile(suggest_all, 0.5) * 1e6:.1f} µs / p99 {percentile(suggest_all, 0.99) * 1e6:.1f} µs")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+server/server.py 压力测试：单线程 HTTPServer vs 有上限的多线程服务器 + keep-alive vs 再加响应缓存
+
+把 server/server.py 复制到临时目录并生成指向不可达数据库的 server.ini 后导入，再把数据库连接
+替换为本地模拟连接：每次查询按类型休眠固定时间（check_daily_range 的查询按 --slow-query-ms 休眠，
+模拟偶发的慢查询）并返回固定数据，模拟数据库在另一台机器上的情况。多个客户端线程使用持久连接并发请求，
+按接口统计每秒请求数和 p50/p99 延迟，最后列出服务器端记录的各阶段平均耗时（/metrics 的直方图）。
+
+用法: python3 benchmarks/bench_server.py [--clients 16] [--requests 2000] [--query-ms 2] [--slow-query-ms 100]
+"""
+
+import os
+import sys
+import time
+import shutil
+import random
+import argparse
+import tempfile
+import threading
+import http.client
+import importlib.util
+from contextlib import nullcontext
+from datetime import datetime, date
+from http.server import HTTPServer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 指向本机不存在的端口；连接池按需建立连接，导入 server.py 时不会连接数据库
+SERVER_INI = """
+[mysql]
+mysql_server = 127.0.0.1
+mysql_port = 1
+login_user = bench
+login_passwd = bench
+db_schema = bench
+connection_pool_size = {pool_size}
+
+[server]
+port = 0
+max_workers = {max_workers}
+keepalive_timeout = 5
+
+[config]
+first_screen_count = 6
+"""
+
+DEVICE_ROW = ("7栋301", "7栋", 0, 1.0, 0.6, "A0001", 1, datetime(2026, 10, 1, 8, 0), "D000001")
+
+class FakeCursor:
+    """按SQL类型休眠并返回固定数据"""
+
+    # 导入 server.py 后换成 request_metrics.phase，与 TimedCursor 一样计入请求的 query 阶段
+    phase = staticmethod(nullcontext)
+
+    def __init__(self, latency, slow_latency):
+        self.latency = latency
+        self.slow_latency = slow_latency
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, sql, params=()):
+        with self.phase('query'):
+            self.run(sql)
+
+    def run(self, sql):
+        if 'FROM data_daily' in sql:
+            time.sleep(self.slow_latency)
+            self.rows = [("D000001", date(2026, 9, day), datetime(2026, 9, day, 23, 0), 1000.0 + day, 50.0 - day, 1.0, 0.0)
+                         for day in range(30, 0, -1)]
+        else:
+            time.sleep(self.latency)
+            if 'FROM device WHERE id' in sql:
+                self.rows = [DEVICE_ROW]
+            elif 'updated_at FROM device_latest' in sql:
+                self.rows = [(f"D{i:06d}", datetime(2026, 10, 1, 8, 0)) for i in range(1000)]
+            elif sql == 'SELECT id FROM device':
+                self.rows = [(f"D{i:06d}",) for i in range(1000)]
+            else:
+                self.rows = [("D000001", datetime(2026, 10, 1, 8, 0), 1000.0, 35.5, 1.2)]
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+class FakeConnection:
+    open = True
+
+    def __init__(self, latency, slow_latency):
+        self.latency = latency
+        self.slow_latency = slow_latency
+
+    def cursor(self):
+        return FakeCursor(self.latency, self.slow_latency)
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        pass
+
+def load_server_module(tmpdir, max_workers, latency, slow_latency):
+    """在临时目录中导入 server.py，并把连接池换成模拟连接"""
+    shutil.copy(os.path.join(ROOT_DIR, 'server', 'server.py'), tmpdir)
+    shutil.copy(os.path.join(ROOT_DIR, 'server', 'response_cache.py'), tmpdir)
+    shutil.copy(os.path.join(ROOT_DIR, 'server', 'device_index.py'), tmpdir)
+    shutil.copy(os.path.join(ROOT_DIR, 'server', 'request_metrics.py'), tmpdir)
+    shutil.copy(os.path.join(ROOT_DIR, 'server', 'db_pool.py'), tmpdir)
+    sys.path.insert(0, tmpdir)
+    with open(os.path.join(tmpdir, 'server.ini'), 'w', encoding='utf-8') as f:
+        f.write(SERVER_INI.format(pool_size=max_workers, max_workers=max_workers))
+
+    spec = importlib.util.spec_from_file_location('bench_server_module', os.path.join(tmpdir, 'server.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    FakeCursor.phase = staticmethod(module.phase)
+    module.DatabaseManager.create_connection = staticmethod(lambda: FakeConnection(latency, slow_latency))
+    return module
+
+class LegacyHTTPServer(HTTPServer):
+    """改造前的单线程服务器"""
+
+    def saturated(self):
+        return False
+
+def make_legacy_handler(module):
+    """改造前的行为：HTTP/1.0，每个响应后关闭连接"""
+    class LegacyHandler(module.RequestHandler):
+        protocol_version = 'HTTP/1.0'
+        timeout = None
+        disable_nagle_algorithm = False
+    return LegacyHandler
+
+def run_load(port, clients, total_requests, slow_ratio):
+    """
+    并发请求并统计延迟
+
+    Returns:
+        tuple: (总耗时秒数, {接口: [延迟秒数]}, 失败请求数)
+    """
+    latencies = {'check': [], 'check_daily_range': []}
+    errors = []
+    lock = threading.Lock()
+    per_client = total_requests // clients
+
+    def client(seed):
+        rng = random.Random(seed)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        local = {'check': [], 'check_daily_range': []}
+        failed = 0
+        for _ in range(per_client):
+            if rng.random() < slow_ratio:
+                mode = 'check_daily_range'
+                path = '/?mode=check_daily_range&device_id=D000001&start_day=2026-09-01&end_day=2026-09-30'
+            else:
+                mode = 'check'
+                path = f'/?mode=check&device_id=D{rng.randrange(1000):06d}&data_num=1'
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                # 监听队列溢出时连接会被重置，下一次请求重新建立连接
+                failed += 1
+                conn.close()
+                continue
+            local[mode].append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            for mode, values in local.items():
+                latencies[mode].extend(values)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, latencies, sum(errors)
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def measure(server, clients, total_requests, slow_ratio):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        return run_load(server.server_address[1], clients, total_requests, slow_ratio)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def report(name, elapsed, latencies, errors):
+    count = sum(len(values) for values in latencies.values())
+    print(f"{name}: {count / elapsed:.0f} 请求/秒，失败 {errors} 次")
+    for mode, values in latencies.items():
+        print(f"  {mode:<18} {len(values):>5} 次, p50 {percentile(values, 0.5) * 1000:7.1f} ms, "
+              f"p99 {percentile(values, 0.99) * 1000:7.1f} ms")
+
+def report_phases(request_metrics):
+    """服务器端记录的各接口各阶段平均耗时"""
+    histograms = request_metrics.metrics.histograms
+    for (name, labels), histogram in sorted(histograms.items()):
+        if name != 'http_request_duration_seconds':
+            continue
+        endpoint = labels[0][1]
+        fields = [f"总计 {histogram.sum / histogram.count * 1000:.2f}"]
+        for phase in request_metrics.PHASES:
+            phase_histogram = histograms.get(('http_request_phase_seconds', labels + (('phase', phase),)))
+            if phase_histogram is not None:
+                # 按请求数平均，没有经过该阶段的请求（例如命中缓存不查询）按0计
+                fields.append(f"{phase} {phase_histogram.sum / histogram.count * 1000:.2f}")
+        print(f"  {endpoint:<18} {histogram.count:>5} 次, 平均 ms: {', '.join(fields)}")
+
+def main():
+    parser = argparse.ArgumentParser(description='server.py 压力测试')
+    parser.add_argument('--clients', type=int, default=16, help='并发客户端数')
+    parser.add_argument('--requests', type=int, default=2000, help='总请求数')
+    parser.add_argument('--query-ms', type=float, default=2, help='普通查询的模拟延迟（毫秒）')
+    parser.add_argument('--slow-query-ms', type=float, default=100, help='每日数据查询的模拟延迟（毫秒）')
+    parser.add_argument('--slow-ratio', type=float, default=0.1, help='每日数据请求所占比例')
+    parser.add_argument('--max-workers', type=int, default=30, help='多线程服务器的处理线程上限')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # server.py 每个请求输出一行日志，压测期间丢弃
+        stdout, stderr = sys.stdout, sys.stderr
+        with open(os.devnull, 'w') as devnull:
+            sys.stdout = sys.stderr = devnull
+            try:
+                module = load_server_module(tmpdir, args.max_workers, args.query_ms / 1000, args.slow_query_ms / 1000)
+                module.RequestHandler.log_message = lambda self, *a: None
+                import request_metrics
+
+                # 前两组只比较服务器的并发处理能力，关闭响应缓存（字节上限为0时不缓存任何响应）
+                module.response_cache = module.ResponseCache(0)
+
+                legacy = LegacyHTTPServer(('127.0.0.1', 0), make_legacy_handler(module))
+                legacy_result = measure(legacy, args.clients, args.requests, args.slow_ratio)
+
+                threaded = module.BoundedThreadingHTTPServer(('127.0.0.1', 0), module.RequestHandler, args.max_workers)
+                threaded_result = measure(threaded, args.clients, args.requests, args.slow_ratio)
+
+                module.response_cache = module.ResponseCache(module.CACHE_MAX_BYTES, module.CACHE_TTL)
+                # 阶段耗时只统计最后一组
+                request_metrics.metrics = request_metrics.RequestMetrics()
+                cached = module.BoundedThreadingHTTPServer(('127.0.0.1', 0), module.RequestHandler, args.max_workers)
+                cached_result = measure(cached, args.clients, args.requests, args.slow_ratio)
+                cache_stats = module.response_cache.stats()
+                pool_stats = module.db_pool.stats()
+            finally:
+                sys.stdout, sys.stderr = stdout, stderr
+
+    print(f"并发客户端: {args.clients}, 总请求数: {args.requests}, 普通查询 {args.query_ms} ms, "
+          f"每日数据查询 {args.slow_query_ms} ms（占 {args.slow_ratio:.0%}）")
+    report("单线程 HTTPServer（HTTP/1.0，每次请求新建连接）", *legacy_result)
+    report(f"多线程服务器（最多 {args.max_workers} 个连接，HTTP/1.1 keep-alive）", *threaded_result)
+    report("多线程服务器 + 响应缓存", *cached_result)
+    print(f"  缓存命中率 {cache_stats['hit_ratio']:.1%}，{cache_stats['entries']} 条，{cache_stats['bytes']} 字节")
+    print("服务器端各阶段耗时（多线程服务器 + 响应缓存）")
+    report_phases(request_metrics)
+    print(f"连接池: 建立 {pool_stats['counters']['created']} 个连接，使用中峰值 {pool_stats['peak_in_use']}/{pool_stats['max_size']}，"
+          f"取连接 {pool_stats['counters']['acquires']} 次，其中等待 {pool_stats['counters']['waits']} 次")
+
+if __name__ == '__main__':
+    main()
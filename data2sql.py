@@ -4,10 +4,24 @@
 import sys
 import json
 import configparser
-import subprocess
+import time
+import hashlib
 import pymysql
 from datetime import datetime
 
+from sany_client import get_client
+
+# 从数据库加载最近读数时每条SQL包含的最大设备数
+SEED_CHUNK_SIZE = 1000
+
+# 各设备上一次成功入库时的指纹 {device_id: {'reading': 读数指纹, 'metadata': 档案哈希}}
+# 常驻进程（scheduler.py）中跨轮次保留，未变化的设备不再产生数据库写入
+device_fingerprints = {}
+
+# 参与档案哈希计算的静态字段，对应device表中的列
+METADATA_FIELDS = ('addr', 'equipmentName', 'installationSite', 'equipmentType',
+                   'ratio', 'rate', 'acctId', 'equipmentStatus')
+
 def load_mysql_config():
     """加载MySQL配置"""
     config = configparser.ConfigParser()
@@ -22,22 +36,12 @@ def load_mysql_config():
     }
 
 def get_device_data(app_user_id, role_id, page_num=1, page_size=100):
-    """调用check_data.py获取设备数据"""
-    try:
-        # 调用check_data.py，使用指定的pageNum和pageSize
-        result = subprocess.run(
-            ['./check_data.py', app_user_id, role_id, str(page_num), str(page_size)],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return json.loads(result.stdout)
-    except subprocess.CalledProcessError as e:
-        print(f"调用check_data.py失败: {e}")
-        return None
-    except json.JSONDecodeError as e:
-        print(f"解析JSON数据失败: {e}")
+    """通过上游客户端获取设备数据"""
+    result = get_client().list_equipment(app_user_id, role_id, page_num, page_size)
+    if result.get('code') == -1:
+        print(f"获取设备数据失败: {result.get('msg')}")
         return None
+    return result
 
 def connect_database(config):
     """连接数据库"""
@@ -63,14 +67,15 @@ def insert_device_data(connection, device_data):
             sql = """
             INSERT INTO device (id, addr, equipmentName, installationSite, equipmentType, 
                                ratio, rate, acctId, status, created_at, updated_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW())
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             ON DUPLICATE KEY UPDATE
             addr=VALUES(addr), equipmentName=VALUES(equipmentName), installationSite=VALUES(installationSite),
             equipmentType=VALUES(equipmentType), ratio=VALUES(ratio), rate=VALUES(rate),
             acctId=VALUES(acctId), status=VALUES(status), updated_at=NOW()
             """
             
-            # 批量处理设备数据
+            # 批量处理设备数据（时间作为参数传入，使executemany合并为一条多行INSERT）
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             device_values = []
             for item in device_data:
                 # 直接从JSON数据中获取设备类型
@@ -92,92 +97,353 @@ def insert_device_data(connection, device_data):
                     float(item.get('ratio')) if item.get('ratio') else None,
                     float(item.get('rate')) if item.get('rate') else None,
                     item.get('acctId'),
-                    status
+                    status,
+                    now,
+                    now
                 ))
             
             if device_values:
                 cursor.executemany(sql, device_values)
                 connection.commit()
                 print(f"成功插入/更新 {len(device_values)} 条设备数据")
+            return True
             
     except Exception as e:
         print(f"插入设备数据失败: {e}")
         connection.rollback()
+        return False
+
+def build_reading_row(item):
+    """
+    将接口返回的单条设备数据转换为data表的一行
+    
+    Returns:
+        tuple: (device_id, read_time, total_reading, remainingBalance, equipmentStatus, unStandard)
+    """
+    read_time = item.get('currentDealDate')
+    
+    # 检查currentDealDate是否为null，如果是则标记为unStandard并设置为当前时间
+    un_standard = 0
+    if read_time is None or read_time == '':
+        un_standard = 1
+        read_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    # 处理设备状态
+    status = None
+    if item.get('equipmentStatus') == '开':
+        status = 1
+    elif item.get('equipmentStatus') == '关':
+        status = 0
+    
+    return (
+        item.get('id'),
+        str(read_time),
+        float(item.get('equipmentCurrentLarge')) if item.get('equipmentCurrentLarge') else None,
+        float(item.get('remainingBalance')) if item.get('remainingBalance') else None,
+        status,
+        un_standard
+    )
+
+def format_read_time(value):
+    """将数据库返回的read_time统一为 YYYY-MM-DD HH:MM:SS 字符串，便于和接口数据比较"""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return str(value)
+
+def lock_last_readings(cursor, device_ids):
+    """
+    在当前事务中锁定并读取各设备在 device_latest 表中的最近一次读数（按主键查询）
+    
+    使用加锁读（FOR UPDATE），读到的是最新提交的值，并行入库同一设备的事务在此排队到本事务提交，
+    不会基于同一条旧读数各自计算用量和日汇总。
+    
+    Args:
+        cursor: 数据库游标
+        device_ids (iterable): 本批次的设备ID
+        
+    Returns:
+        dict: {device_id: (read_time, total_reading, remainingBalance)}，没有历史读数的设备为None
+    """
+    device_ids = sorted(set(device_ids))
+    readings = dict.fromkeys(device_ids)
+    for start in range(0, len(device_ids), SEED_CHUNK_SIZE):
+        chunk = device_ids[start:start + SEED_CHUNK_SIZE]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        sql = f"""
+            SELECT device_id, read_time, total_reading, remainingBalance
+            FROM device_latest WHERE device_id IN ({placeholders})
+            FOR UPDATE
+        """
+        cursor.execute(sql, chunk)
+        for device_id, read_time, total_reading, remaining_balance in cursor.fetchall():
+            readings[str(device_id)] = (
+                format_read_time(read_time),
+                float(total_reading) if total_reading is not None else None,
+                float(remaining_balance) if remaining_balance is not None else None
+            )
+    return readings
+
+def compute_diff_reading(row, previous):
+    """
+    计算相对该设备上一次读数的用量
+    
+    Args:
+        row (tuple): build_reading_row 返回的读数行
+        previous (tuple): 该设备上一次的 (read_time, total_reading, remainingBalance)，没有历史读数时为None
+        
+    Returns:
+        float: 距上次用量，无法计算时返回None
+    """
+    if previous is None:
+        return None
+    previous_time, previous_total = previous[0], previous[1]
+    # 只对比上一次更新的读数计算用量，乱序或重复的读数留给回填任务处理
+    if row[1] <= previous_time or row[2] is None or previous_total is None:
+        return None
+    return round(row[2] - previous_total, 2)
+
+def accumulate_daily(daily, row, previous, diff_reading):
+    """
+    把一条新读数累加到所在日期的日汇总中
+    
+    只应对比上一次更新的读数调用；余额比上一次读数高的部分计为充值金额。
+    
+    Args:
+        daily (dict): {(device_id, read_date): 日汇总列表}，就地更新
+        row (tuple): build_reading_row 返回的读数行
+        previous (tuple): 该设备上一次的 (read_time, total_reading, remainingBalance)，没有历史读数时为None
+        diff_reading (float): compute_diff_reading 计算出的用量
+    """
+    key = (str(row[0]), row[1][:10])
+    topup = 0.0
+    if previous is not None and previous[2] is not None and row[3] is not None and row[3] > previous[2]:
+        topup = round(row[3] - previous[2], 6)
+    entry = daily.get(key)
+    if entry is None:
+        # [device_id, read_date, last_read_time, last_total_reading, last_remaining_balance, daily_usage, topup_amount, reading_count]
+        entry = daily[key] = [key[0], key[1], None, None, None, 0.0, 0.0, 0]
+    entry[2:5] = [row[1], row[2], row[3]]
+    entry[5] = round(entry[5] + (diff_reading or 0.0), 2)
+    entry[6] = round(entry[6] + topup, 6)
+    entry[7] += 1
 
 def insert_reading_data(connection, device_data):
-    """插入读数数据到data表，避免重复插入相同read_time的数据"""
-    from datetime import datetime
+    """
+    插入读数数据到data表
     
+    依赖 data 表上 (device_id, read_time) 的唯一索引去重：已存在的记录在
+    ON DUPLICATE KEY 中原样保留，因此无需事先查询，多个入库进程并行执行也不会产生重复数据。
+    事务开始时锁定并读取各设备在 device_latest 表中的最近一次读数，diff_reading 据此计算。
+    同一事务中更新 device_latest 表，只有读表时间晚于已有记录时才覆盖，
+    并为每台有新读数的设备写入一条 reading_event，预警检查服务据此只检查受影响的设备。
+    比 device_latest 更新的读数同时累加进 data_daily 日汇总表（当日最后读数、用量和充值金额）。
+    device_latest 与 data 在同一事务中写入，比它更新的读数一定是本次新插入的，而加锁读让并行入库
+    同一设备的事务依次执行，因此重复的批次或重叠的入库进程不会重复累加；乱序或补录的读数不计入，
+    由 backfill_daily.py 重算。
+    """
     try:
         with connection.cursor() as cursor:
-            # 统计需要插入的数据条数
-            new_data_count = 0
+            rows = [build_reading_row(item) for item in device_data]
             
-            for item in device_data:
-                device_id = item.get('id')
-                read_time = item.get('currentDealDate')
+            if rows:
+                last_readings = lock_last_readings(cursor, [str(row[0]) for row in rows])
+                
+                # 计算用量，同一批次中同一设备的多条读数按时间顺序依次计算
+                latest = {}
+                latest_values = {}
+                daily = {}
+                values = []
+                created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                for row in sorted(rows, key=lambda r: r[1]):
+                    device_id = str(row[0])
+                    previous = latest.get(device_id, last_readings[device_id])
+                    diff_reading = compute_diff_reading(row, previous)
+                    if previous is None or row[1] > previous[0]:
+                        accumulate_daily(daily, row, previous, diff_reading)
+                        latest[device_id] = (row[1], row[2], row[3])
+                    value = row[:3] + (diff_reading,) + row[3:] + (created_at,)
+                    values.append(value)
+                    # 按时间升序遍历，最后写入的就是本批次中该设备最新的读数
+                    latest_values[device_id] = value
                 
-                # 检查currentDealDate是否为null，如果是则标记为unStandard并设置为当前时间
-                un_standard = 0
-                if read_time is None or read_time == '':
-                    un_standard = 1
-                    read_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                # 注意：VALUES中只能出现占位符，pymysql才会把executemany合并为一条多行INSERT
+                insert_sql = """
+                INSERT INTO data (device_id, read_time, total_reading, diff_reading, remainingBalance, 
+                                 equipmentStatus, unStandard, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE id = id
+                """
+                cursor.executemany(insert_sql, values)
+                # 重复记录不计入影响行数
+                new_data_count = cursor.rowcount
                 
-                # 检查是否已存在相同的device_id和read_time记录
-                check_sql = "SELECT COUNT(*) FROM data WHERE device_id = %s AND read_time = %s"
-                cursor.execute(check_sql, (device_id, read_time))
-                count = cursor.fetchone()[0]
+                # 列的更新按书写顺序执行，read_time 必须最后更新，前面的条件才能和旧值比较；
+                # 只有更新的读数才覆盖，重复入库同一读数不改变 updated_at（响应缓存和 ETag 的版本号）
+                latest_sql = """
+                INSERT INTO device_latest (device_id, read_time, total_reading, diff_reading, remainingBalance, 
+                                          equipmentStatus, unStandard, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                total_reading = IF(VALUES(read_time) > read_time, VALUES(total_reading), total_reading),
+                diff_reading = IF(VALUES(read_time) > read_time, VALUES(diff_reading), diff_reading),
+                remainingBalance = IF(VALUES(read_time) > read_time, VALUES(remainingBalance), remainingBalance),
+                equipmentStatus = IF(VALUES(read_time) > read_time, VALUES(equipmentStatus), equipmentStatus),
+                unStandard = IF(VALUES(read_time) > read_time, VALUES(unStandard), unStandard),
+                updated_at = IF(VALUES(read_time) > read_time, VALUES(updated_at), updated_at),
+                read_time = GREATEST(read_time, VALUES(read_time))
+                """
+                cursor.executemany(latest_sql, list(latest_values.values()))
                 
-                # 如果不存在相同记录，则插入新数据
-                if count == 0:
-                    # 处理设备状态
-                    status = None
-                    if item.get('equipmentStatus') == '开':
-                        status = 1
-                    elif item.get('equipmentStatus') == '关':
-                        status = 0
-                    
-                    # 插入读数数据
-                    insert_sql = """
-                    INSERT INTO data (device_id, read_time, total_reading, remainingBalance, 
-                                     equipmentStatus, created_at, unStandard)
-                    VALUES (%s, %s, %s, %s, %s, NOW(), %s)
-                    """
-                    
-                    cursor.execute(insert_sql, (
-                        device_id,
-                        read_time,
-                        float(item.get('equipmentCurrentLarge')) if item.get('equipmentCurrentLarge') else None,
-                        float(item.get('remainingBalance')) if item.get('remainingBalance') else None,
-                        status,
-                        un_standard
-                    ))
-                    
-                    new_data_count += 1
+                # 日汇总：用量、充值金额和读数条数累加，最后读数只用更新的读数覆盖，read_time 同样最后更新
+                daily_sql = """
+                INSERT INTO data_daily (device_id, read_date, last_read_time, last_total_reading, last_remaining_balance,
+                                        daily_usage, topup_amount, reading_count, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                last_total_reading = IF(VALUES(last_read_time) >= last_read_time, VALUES(last_total_reading), last_total_reading),
+                last_remaining_balance = IF(VALUES(last_read_time) >= last_read_time, VALUES(last_remaining_balance), last_remaining_balance),
+                daily_usage = daily_usage + VALUES(daily_usage),
+                topup_amount = topup_amount + VALUES(topup_amount),
+                reading_count = reading_count + VALUES(reading_count),
+                updated_at = VALUES(updated_at),
+                last_read_time = GREATEST(last_read_time, VALUES(last_read_time))
+                """
+                if daily:
+                    cursor.executemany(daily_sql, [tuple(entry) + (created_at,) for entry in daily.values()])
+                
+                # 新读数事件与读数一起提交，预警检查服务不会看到未提交的读数；
+                # 只为读数比已有最新读数更新的设备写入，重复或乱序的读数不触发检查
+                event_sql = """
+                INSERT INTO reading_event (device_id, read_time, created_at)
+                VALUES (%s, %s, %s)
+                """
+                if latest:
+                    cursor.executemany(event_sql, [
+                        (device_id, reading[0], created_at) for device_id, reading in latest.items()
+                    ])
+                connection.commit()
+            else:
+                new_data_count = 0
             
             if new_data_count > 0:
-                connection.commit()
                 print(f"成功插入 {new_data_count} 条新读数数据")
             else:
                 print("没有新的读数数据需要插入")
+            return True
             
     except Exception as e:
         print(f"插入读数数据失败: {e}")
         connection.rollback()
+        return False
 
-def main():
-    # 检查命令行参数
-    if len(sys.argv) < 3 or len(sys.argv) > 5:
-        print("用法: ./data2sql.py <appUserId> <roleId> [pageNum] [pageSize]")
-        sys.exit(1)
+def reading_fingerprint(item):
+    """读数指纹：表底时间、表底读数和余额"""
+    return (item.get('currentDealDate'), item.get('equipmentCurrentLarge'), item.get('remainingBalance'))
+
+def metadata_hash(item):
+    """设备静态档案的哈希"""
+    metadata = json.dumps([item.get(field) for field in METADATA_FIELDS], ensure_ascii=False, default=str)
+    return hashlib.md5(metadata.encode('utf-8')).hexdigest()
+
+def ingest_devices(connection, device_data):
+    """
+    变化检测后入库一批设备数据
     
-    # 获取命令行参数
-    app_user_id = sys.argv[1]
-    role_id = sys.argv[2]
-    page_num = int(sys.argv[3]) if len(sys.argv) > 3 else 1
-    page_size = int(sys.argv[4]) if len(sys.argv) > 4 else 100  # 默认页面大小改为100
+    与上次成功入库时的指纹比较，只有档案变化的设备写入device表，只有读数或余额变化的设备
+    写入data表。写入成功后才更新指纹，失败的设备下一轮会重新写入。
+    
+    Returns:
+        dict: 本批次统计 {'total': 设备数, 'device_skipped': 档案未变化数, 'reading_skipped': 读数未变化数}
+    """
+    changed_devices = []
+    changed_readings = []
+    metadata_updates = {}
+    reading_updates = {}
+    for item in device_data:
+        device_id = str(item.get('id'))
+        previous = device_fingerprints.get(device_id, {})
+        
+        metadata = metadata_hash(item)
+        if previous.get('metadata') != metadata:
+            changed_devices.append(item)
+            metadata_updates[device_id] = metadata
+        
+        reading = reading_fingerprint(item)
+        if previous.get('reading') != reading:
+            changed_readings.append(item)
+            reading_updates[device_id] = reading
+    
+    if changed_devices and insert_device_data(connection, changed_devices):
+        for device_id, metadata in metadata_updates.items():
+            device_fingerprints.setdefault(device_id, {})['metadata'] = metadata
     
-    print(f"开始处理数据: appUserId={app_user_id}, roleId={role_id}, pageNum={page_num}, pageSize={page_size}")
+    if changed_readings and insert_reading_data(connection, changed_readings):
+        for device_id, reading in reading_updates.items():
+            device_fingerprints.setdefault(device_id, {})['reading'] = reading
+    
+    stats = {
+        'total': len(device_data),
+        'device_skipped': len(device_data) - len(changed_devices),
+        'reading_skipped': len(device_data) - len(changed_readings)
+    }
+    print(format_skip_stats(stats))
+    return stats
+
+def format_skip_stats(stats):
+    """格式化跳过比例"""
+    total = stats['total'] or 1
+    return (f"变化检测: 共 {stats['total']} 台设备，"
+            f"读数未变化跳过 {stats['reading_skipped']} 台（{stats['reading_skipped'] / total:.1%}），"
+            f"档案未变化跳过 {stats['device_skipped']} 台（{stats['device_skipped'] / total:.1%}）")
+
+def crawl_all_pages(connection, app_user_id, role_id, page_size):
+    """
+    全量抓取模式：并发抓取所有分页，每页到达后立即入库
+    
+    Returns:
+        int: 成功入库的设备条数
+    """
+    client = get_client()
+    start_time = time.time()
+    stored_count = 0
+    failed_pages = []
+    run_stats = {'total': 0, 'device_skipped': 0, 'reading_skipped': 0}
+    
+    for page_num, result in client.crawl_equipment(app_user_id, role_id, page_size):
+        if result.get('code') != 200:
+            print(f"第 {page_num} 页获取失败，错误代码: {result.get('code')}, 错误信息: {result.get('msg')}")
+            failed_pages.append(page_num)
+            continue
+        
+        device_data = result.get('rows', [])
+        print(f"第 {page_num} 页获取到 {len(device_data)} 条设备数据（共 {result.get('total')} 条）")
+        if device_data:
+            page_stats = ingest_devices(connection, device_data)
+            for key in run_stats:
+                run_stats[key] += page_stats[key]
+            stored_count += len(device_data)
+    
+    print(f"全量抓取完成，处理 {stored_count} 条设备数据，耗时 {time.time() - start_time:.2f} 秒")
+    print(f"本轮{format_skip_stats(run_stats)}")
+    if failed_pages:
+        print(f"以下页面重试后仍然失败: {sorted(failed_pages)}")
+    return stored_count
+
+def run(app_user_id, role_id, page_num=1, page_size=100, crawl_all=False):
+    """
+    执行一次入库任务，供命令行和 scheduler.py 调用
+    
+    Args:
+        app_user_id (str): 用户ID
+        role_id (str): 角色ID
+        page_num (int): 页码，crawl_all 为 True 时忽略
+        page_size (int): 每页数量
+        crawl_all (bool): 是否全量抓取所有分页
+        
+    Returns:
+        bool: 是否成功
+    """
+    print(f"开始处理数据: appUserId={app_user_id}, roleId={role_id}, pageNum={'all' if crawl_all else page_num}, pageSize={page_size}")
     
     # 加载MySQL配置
     try:
@@ -185,22 +451,36 @@ def main():
         print("MySQL配置加载成功")
     except Exception as e:
         print(f"加载MySQL配置失败: {e}")
-        sys.exit(1)
+        return False
+    
+    if crawl_all:
+        # 全量抓取模式，边抓取边入库
+        connection = connect_database(mysql_config)
+        if not connection:
+            print("数据库连接失败")
+            return False
+        try:
+            if crawl_all_pages(connection, app_user_id, role_id, page_size) == 0:
+                print("没有获取到设备数据")
+                return False
+        finally:
+            connection.close()
+        return True
     
     # 获取设备数据
     result = get_device_data(app_user_id, role_id, page_num, page_size)
     if not result:
-        print("调用check_data.py失败，返回结果为空")
-        sys.exit(1)
+        print("获取设备数据失败，返回结果为空")
+        return False
     
     if result.get('code') != 200:
         print(f"获取设备数据失败，错误代码: {result.get('code')}, 错误信息: {result.get('msg')}")
-        sys.exit(1)
+        return False
     
     device_data = result.get('rows', [])
     if not device_data:
         print("没有获取到设备数据")
-        sys.exit(1)
+        return False
     
     print(f"获取到 {len(device_data)} 条设备数据")
     
@@ -208,18 +488,33 @@ def main():
     connection = connect_database(mysql_config)
     if not connection:
         print("数据库连接失败")
-        sys.exit(1)
+        return False
     
     try:
-        # 插入设备数据
-        insert_device_data(connection, device_data)
-        
-        # 插入读数数据
-        insert_reading_data(connection, device_data)
+        # 只写入档案或读数发生变化的设备
+        ingest_devices(connection, device_data)
         
         print("数据插入完成")
     finally:
         connection.close()
+    
+    return True
+
+def main():
+    # 检查命令行参数
+    if len(sys.argv) < 3 or len(sys.argv) > 5:
+        print("用法: ./data2sql.py <appUserId> <roleId> [pageNum|all] [pageSize]")
+        sys.exit(1)
+    
+    # 获取命令行参数
+    app_user_id = sys.argv[1]
+    role_id = sys.argv[2]
+    crawl_all = len(sys.argv) > 3 and sys.argv[3] == 'all'
+    page_num = int(sys.argv[3]) if len(sys.argv) > 3 and not crawl_all else 1
+    page_size = int(sys.argv[4]) if len(sys.argv) > 4 else 100  # 默认页面大小改为100
+    
+    if not run(app_user_id, role_id, page_num, page_size, crawl_all):
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
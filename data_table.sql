@@ -1,2 +1,2 @@
 Table	Create Table
-data	CREATE TABLE `data` (\n  `id` bigint(20) NOT NULL AUTO_INCREMENT,\n  `device_id` varchar(32) NOT NULL,\n  `read_time` datetime NOT NULL,\n  `total_reading` decimal(15,2) DEFAULT NULL,\n  `diff_reading` decimal(15,2) DEFAULT NULL,\n  `remainingBalance` decimal(15,6) DEFAULT NULL,\n  `equipmentStatus` tinyint(1) DEFAULT NULL,\n  `created_at` datetime NOT NULL,\n  `remark` varchar(255) DEFAULT NULL,\n  `unStandard` tinyint(1) DEFAULT 0,\n  PRIMARY KEY (`id`),\n  KEY `idx_device_time` (`device_id`,`read_time`),\n  CONSTRAINT `data_ibfk_1` FOREIGN KEY (`device_id`) REFERENCES `device` (`id`)\n) ENGINE=InnoDB AUTO_INCREMENT=4593 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+data	CREATE TABLE `data` (\n  `id` bigint(20) NOT NULL AUTO_INCREMENT,\n  `device_id` varchar(32) NOT NULL,\n  `read_time` datetime NOT NULL,\n  `total_reading` decimal(15,2) DEFAULT NULL,\n  `diff_reading` decimal(15,2) DEFAULT NULL,\n  `remainingBalance` decimal(15,6) DEFAULT NULL,\n  `equipmentStatus` tinyint(1) DEFAULT NULL,\n  `created_at` datetime NOT NULL,\n  `remark` varchar(255) DEFAULT NULL,\n  `unStandard` tinyint(1) DEFAULT 0,\n  PRIMARY KEY (`id`),\n  UNIQUE KEY `uk_device_time` (`device_id`,`read_time`),\n  CONSTRAINT `data_ibfk_1` FOREIGN KEY (`device_id`) REFERENCES `device` (`id`)\n) ENGINE=InnoDB AUTO_INCREMENT=4593 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
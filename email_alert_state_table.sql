@@ -0,0 +1,15 @@
+-- 创建 email_alert_state 表（每个订阅的预警状态，由 server/email_checker.py 读写）
+-- 用法: mysql -h [服务器地址] -u [用户名] -p your_database_name < email_alert_state_table.sql
+CREATE TABLE IF NOT EXISTS `email_alert_state` (
+  `subscription_id` bigint(20) NOT NULL COMMENT 'email表中订阅记录的id',
+  `state` tinyint(1) NOT NULL DEFAULT 0 COMMENT '0=待触发，1=已预警（充值后余额回升才重新进入待触发）',
+  `alert_count` int(11) NOT NULL DEFAULT 0 COMMENT '累计预警次数',
+  `last_alert_at` datetime DEFAULT NULL,
+  `last_alert_balance` decimal(15,6) DEFAULT NULL,
+  `last_alert_read_time` datetime DEFAULT NULL,
+  `rearmed_at` datetime DEFAULT NULL,
+  `updated_at` datetime NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+  PRIMARY KEY (`subscription_id`),
+  KEY `idx_state` (`state`),
+  CONSTRAINT `email_alert_state_ibfk_1` FOREIGN KEY (`subscription_id`) REFERENCES `email` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci COMMENT='订阅预警状态表';
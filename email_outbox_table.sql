@@ -0,0 +1,26 @@
+-- 创建 email_outbox 表（待发送邮件队列，由 server/email_outbox.py 读写）
+-- 用法: mysql -h [服务器地址] -u [用户名] -p your_database_name < email_outbox_table.sql
+CREATE TABLE IF NOT EXISTS `email_outbox` (
+  `id` bigint(20) NOT NULL AUTO_INCREMENT,
+  `idempotency_key` char(32) NOT NULL COMMENT '幂等键，同一封邮件重复入队只保留一条',
+  `kind` varchar(32) NOT NULL COMMENT '邮件类型：验证码、解绑验证码、注册庆祝、预警',
+  `to_email` varchar(255) NOT NULL,
+  `template_id` varchar(64) NOT NULL,
+  `template_data` longtext CHARACTER SET utf8mb4 COLLATE utf8mb4_bin DEFAULT NULL CHECK (json_valid(`template_data`)),
+  `status` tinyint(1) NOT NULL DEFAULT 0 COMMENT '0=待发送，1=发送中，2=已发送，3=死信',
+  `attempts` int(11) NOT NULL DEFAULT 0,
+  `next_attempt_at` datetime NOT NULL DEFAULT current_timestamp(),
+  `claim_token` char(32) DEFAULT NULL,
+  `claimed_at` datetime DEFAULT NULL,
+  `last_error` varchar(255) DEFAULT NULL,
+  `created_at` datetime NOT NULL DEFAULT current_timestamp(),
+  `sent_at` datetime DEFAULT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uk_idempotency_key` (`idempotency_key`),
+  KEY `idx_status_next` (`status`, `next_attempt_at`),
+  KEY `idx_claim_token` (`claim_token`),
+  KEY `idx_to_email_created` (`to_email`, `created_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- 已有的表补充按收件人统计当日入队数的索引（入队时检查每日发送上限）
+ALTER TABLE `email_outbox` ADD INDEX IF NOT EXISTS `idx_to_email_created` (`to_email`, `created_at`);
\ No newline at end of file
@@ -35,6 +35,42 @@ CREATE TABLE `data` (
   `remark` varchar(255) DEFAULT NULL,
   `unStandard` tinyint(1) DEFAULT 0,
   PRIMARY KEY (`id`),
-  KEY `idx_device_time` (`device_id`,`read_time`),
+  UNIQUE KEY `uk_device_time` (`device_id`,`read_time`),
   CONSTRAINT `data_ibfk_1` FOREIGN KEY (`device_id`) REFERENCES `device` (`id`)
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
\ No newline at end of file
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- 创建 device_latest 表（各设备最新读数，由 data2sql.py 与 data 表在同一事务中维护）
+CREATE TABLE `device_latest` (
+  `device_id` varchar(32) NOT NULL,
+  `read_time` datetime NOT NULL,
+  `total_reading` decimal(15,2) DEFAULT NULL,
+  `diff_reading` decimal(15,2) DEFAULT NULL,
+  `remainingBalance` decimal(15,6) DEFAULT NULL,
+  `equipmentStatus` tinyint(1) DEFAULT NULL,
+  `unStandard` tinyint(1) DEFAULT 0,
+  `updated_at` datetime NOT NULL,
+  PRIMARY KEY (`device_id`),
+  CONSTRAINT `device_latest_ibfk_1` FOREIGN KEY (`device_id`) REFERENCES `device` (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+-- 创建 data_daily 表（各设备每日汇总，由 data2sql.py 与 data 表在同一事务中累加，backfill_daily.py 可按 data 表重算）
+CREATE TABLE `data_daily` (
+  `device_id` varchar(32) NOT NULL,
+  `read_date` date NOT NULL,
+  `last_read_time` datetime NOT NULL COMMENT '当日最后一次读表时间',
+  `last_total_reading` decimal(15,2) DEFAULT NULL COMMENT '当日最后表底读数',
+  `last_remaining_balance` decimal(15,6) DEFAULT NULL COMMENT '当日最后余额',
+  `daily_usage` decimal(15,2) NOT NULL DEFAULT 0.00 COMMENT '当日各读数diff_reading之和',
+  `topup_amount` decimal(15,6) NOT NULL DEFAULT 0.000000 COMMENT '当日余额上升金额之和',
+  `reading_count` int(11) NOT NULL DEFAULT 0 COMMENT '当日读数条数',
+  `updated_at` datetime NOT NULL,
+  PRIMARY KEY (`device_id`, `read_date`),
+  CONSTRAINT `data_daily_ibfk_1` FOREIGN KEY (`device_id`) REFERENCES `device` (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+-- 创建 reading_event 表（新读数事件，由 data2sql.py 与 data 表在同一事务中写入，server/email_checker.py 消费后删除）
+CREATE TABLE `reading_event` (
+  `id` bigint(20) NOT NULL AUTO_INCREMENT,
+  `device_id` varchar(32) NOT NULL,
+  `read_time` datetime NOT NULL,
+  `created_at` datetime NOT NULL,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
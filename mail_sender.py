@@ -2,14 +2,14 @@
 # -*- coding: utf-8 -*-
 
 import sys
-import json
-import subprocess
 import configparser
 import smtplib
 from email.mime.text import MIMEText
 from email.header import Header
 from email.utils import formataddr
 
+from sany_client import get_client
+
 def load_mail_config():
     """
     加载邮件配置
@@ -65,7 +65,7 @@ def load_mail_template():
 
 def call_login_script(phone_num, password):
     """
-    调用登录脚本获取用户信息
+    登录获取用户信息
     
     Args:
         phone_num (str): 手机号码
@@ -74,25 +74,11 @@ def call_login_script(phone_num, password):
     Returns:
         dict: 登录结果
     """
-    try:
-        result = subprocess.run(
-            [sys.executable, 'login.py', phone_num, password],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return json.loads(result.stdout)
-    except subprocess.CalledProcessError as e:
-        print(f"登录脚本执行失败: {e}")
-        print(f"错误输出: {e.stderr}")
-        return None
-    except json.JSONDecodeError as e:
-        print(f"解析登录结果失败: {e}")
-        return None
+    return get_client().cached_login(phone_num, password)
 
 def call_get_data_script(app_user_id, role_id):
     """
-    调用数据获取脚本获取水电费信息
+    获取水电费信息
     
     Args:
         app_user_id (str): 用户ID
@@ -101,21 +87,7 @@ def call_get_data_script(app_user_id, role_id):
     Returns:
         dict: 水电费数据
     """
-    try:
-        result = subprocess.run(
-            [sys.executable, 'get_data.py', app_user_id, str(role_id)],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return json.loads(result.stdout)
-    except subprocess.CalledProcessError as e:
-        print(f"数据获取脚本执行失败: {e}")
-        print(f"错误输出: {e.stderr}")
-        return None
-    except json.JSONDecodeError as e:
-        print(f"解析数据结果失败: {e}")
-        return None
+    return get_client().get_utility_data(app_user_id, str(role_id))
 
 def format_mail_content(template, data):
     """
@@ -193,6 +165,38 @@ def send_mail(config, subject, content):
         print(f"邮件发送失败: {e}")
         return False
 
+def send_report(data_result):
+    """
+    根据已获取的水电费数据格式化并发送邮件
+    
+    Args:
+        data_result (dict): 水电费数据
+        
+    Returns:
+        bool: 是否发送成功
+    """
+    # 加载邮件配置和模板
+    print("正在加载邮件配置和模板...")
+    try:
+        mail_config = load_mail_config()
+        mail_template = load_mail_template()
+    except Exception as e:
+        print(f"加载邮件配置或模板失败: {e}")
+        return False
+    
+    # 格式化邮件内容
+    print("正在格式化邮件内容...")
+    mail_content = format_mail_content(mail_template, data_result)
+    mail_subject = "三一工学院宿舍水电费信息"
+    
+    # 发送邮件
+    print("正在发送邮件...")
+    if send_mail(mail_config, mail_subject, mail_content):
+        print("邮件已成功发送")
+        return True
+    print("邮件发送失败")
+    return False
+
 def main():
     # 检查命令行参数
     if len(sys.argv) != 3:
@@ -203,7 +207,7 @@ def main():
     phone_num = sys.argv[1]
     password = sys.argv[2]
     
-    # 调用登录脚本
+    # 登录
     print("正在登录...")
     login_result = call_login_script(phone_num, password)
     
@@ -223,7 +227,7 @@ def main():
     
     print(f"登录成功，用户ID: {app_user_id}，角色ID: {role_id}")
     
-    # 调用数据获取脚本
+    # 获取水电费数据
     print("正在获取水电费数据...")
     data_result = call_get_data_script(app_user_id, role_id)
     
@@ -234,26 +238,8 @@ def main():
     
     print("数据获取成功")
     
-    # 加载邮件配置和模板
-    print("正在加载邮件配置和模板...")
-    try:
-        mail_config = load_mail_config()
-        mail_template = load_mail_template()
-    except Exception as e:
-        print(f"加载邮件配置或模板失败: {e}")
-        sys.exit(1)
-    
-    # 格式化邮件内容
-    print("正在格式化邮件内容...")
-    mail_content = format_mail_content(mail_template, data_result)
-    mail_subject = "三一工学院宿舍水电费信息"
-    
     # 发送邮件
-    print("正在发送邮件...")
-    if send_mail(mail_config, mail_subject, mail_content):
-        print("邮件已成功发送")
-    else:
-        print("邮件发送失败")
+    if not send_report(data_result):
         sys.exit(1)
 
 if __name__ == "__main__":
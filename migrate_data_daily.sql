@@ -0,0 +1,18 @@
+-- 创建 data_daily 表（各设备每日汇总，data2sql.py 入库时累加，server/server.py 的 check_daily_range 读取）
+-- 适用于由旧版 import.sql 创建的数据库，可重复执行；必须在新版 data2sql.py 运行前执行
+-- 建表后运行 ./backfill_daily.py 从 data 表生成历史日汇总
+-- 用法: mysql -h [服务器地址] -u [用户名] -p your_database_name < migrate_data_daily.sql
+
+CREATE TABLE IF NOT EXISTS `data_daily` (
+  `device_id` varchar(32) NOT NULL,
+  `read_date` date NOT NULL,
+  `last_read_time` datetime NOT NULL COMMENT '当日最后一次读表时间',
+  `last_total_reading` decimal(15,2) DEFAULT NULL COMMENT '当日最后表底读数',
+  `last_remaining_balance` decimal(15,6) DEFAULT NULL COMMENT '当日最后余额',
+  `daily_usage` decimal(15,2) NOT NULL DEFAULT 0.00 COMMENT '当日各读数diff_reading之和',
+  `topup_amount` decimal(15,6) NOT NULL DEFAULT 0.000000 COMMENT '当日余额上升金额之和',
+  `reading_count` int(11) NOT NULL DEFAULT 0 COMMENT '当日读数条数',
+  `updated_at` datetime NOT NULL,
+  PRIMARY KEY (`device_id`, `read_date`),
+  CONSTRAINT `data_daily_ibfk_1` FOREIGN KEY (`device_id`) REFERENCES `device` (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
@@ -0,0 +1,15 @@
+-- 为 data 表的 (device_id, read_time) 增加唯一约束
+-- 适用于由旧版 import.sql 创建的数据库，执行前请先备份 data 表
+-- 用法: mysql -h [服务器地址] -u [用户名] -p your_database_name < migrate_data_unique.sql
+
+-- 删除重复的读数记录，同一设备同一读表时间只保留id最小的一条
+DELETE d1 FROM data d1
+JOIN data d2
+  ON d1.device_id = d2.device_id
+ AND d1.read_time = d2.read_time
+ AND d1.id > d2.id;
+
+-- 用唯一索引替换原有的普通索引（在同一条语句中完成，保证外键 data_ibfk_1 始终有可用的索引）
+ALTER TABLE `data`
+  ADD UNIQUE KEY `uk_device_time` (`device_id`, `read_time`),
+  DROP KEY `idx_device_time`;
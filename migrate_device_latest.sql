@@ -0,0 +1,33 @@
+-- 创建 device_latest 表并从 data 表回填各设备的最新读数
+-- 适用于由旧版 import.sql 创建的数据库，可重复执行
+-- 用法: mysql -h [服务器地址] -u [用户名] -p your_database_name < migrate_device_latest.sql
+
+CREATE TABLE IF NOT EXISTS `device_latest` (
+  `device_id` varchar(32) NOT NULL,
+  `read_time` datetime NOT NULL,
+  `total_reading` decimal(15,2) DEFAULT NULL,
+  `diff_reading` decimal(15,2) DEFAULT NULL,
+  `remainingBalance` decimal(15,6) DEFAULT NULL,
+  `equipmentStatus` tinyint(1) DEFAULT NULL,
+  `unStandard` tinyint(1) DEFAULT 0,
+  `updated_at` datetime NOT NULL,
+  PRIMARY KEY (`device_id`),
+  CONSTRAINT `device_latest_ibfk_1` FOREIGN KEY (`device_id`) REFERENCES `device` (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- 回填：每台设备取 read_time 最大的一条读数，已有相同或更新记录的设备保持不变（不改变 updated_at）
+INSERT INTO device_latest (device_id, read_time, total_reading, diff_reading, remainingBalance,
+                           equipmentStatus, unStandard, updated_at)
+SELECT d.device_id, d.read_time, d.total_reading, d.diff_reading, d.remainingBalance,
+       d.equipmentStatus, d.unStandard, NOW()
+FROM data d
+JOIN (SELECT device_id, MAX(read_time) AS read_time FROM data GROUP BY device_id) m
+  ON d.device_id = m.device_id AND d.read_time = m.read_time
+ON DUPLICATE KEY UPDATE
+total_reading = IF(VALUES(read_time) > read_time, VALUES(total_reading), total_reading),
+diff_reading = IF(VALUES(read_time) > read_time, VALUES(diff_reading), diff_reading),
+remainingBalance = IF(VALUES(read_time) > read_time, VALUES(remainingBalance), remainingBalance),
+equipmentStatus = IF(VALUES(read_time) > read_time, VALUES(equipmentStatus), equipmentStatus),
+unStandard = IF(VALUES(read_time) > read_time, VALUES(unStandard), unStandard),
+updated_at = IF(VALUES(read_time) > read_time, VALUES(updated_at), updated_at),
+read_time = GREATEST(read_time, VALUES(read_time));
@@ -0,0 +1,11 @@
+-- 创建 reading_event 表（新读数事件，data2sql.py 入库时写入，server/email_checker.py 消费）
+-- 适用于由旧版 import.sql 创建的数据库，可重复执行；必须在新版 data2sql.py 运行前执行
+-- 用法: mysql -h [服务器地址] -u [用户名] -p your_database_name < migrate_reading_event.sql
+
+CREATE TABLE IF NOT EXISTS `reading_event` (
+  `id` bigint(20) NOT NULL AUTO_INCREMENT,
+  `device_id` varchar(32) NOT NULL,
+  `read_time` datetime NOT NULL,
+  `created_at` datetime NOT NULL,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
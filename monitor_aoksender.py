@@ -3,12 +3,13 @@
 
 import sys
 import json
-import subprocess
 import configparser
 import time
 import requests
 import os
 
+from sany_client import get_client, LoginCache, LOGIN_CACHE_TTL, AUTH_FAILURE_CODES
+
 def load_aoksend_config():
     """
     加载Aoksend邮件配置
@@ -38,13 +39,14 @@ def load_aoksend_config():
         'data': config.get('aoksender', 'data', fallback=None),
         'attachment': config.get('aoksender', 'attachment', fallback=None),
         'monitor_timer': config.getint('monitor', 'monitor_timer', fallback=3600),
+        'login_cache_ttl': config.getint('monitor', 'login_cache_ttl', fallback=LOGIN_CACHE_TTL),
         'monitor_keyword': config.get('monitor', 'monitor_keyword', fallback='remainingBalance'),
         'monitor_start': config.getfloat('monitor', 'monitor_start', fallback=10.0)
     }
 
 def call_login_script(phone_num, password):
     """
-    调用登录脚本获取用户信息
+    登录获取用户信息
     
     Args:
         phone_num (str): 手机号码
@@ -53,25 +55,11 @@ def call_login_script(phone_num, password):
     Returns:
         dict: 登录结果
     """
-    try:
-        result = subprocess.run(
-            [sys.executable, 'login.py', phone_num, password],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return json.loads(result.stdout)
-    except subprocess.CalledProcessError as e:
-        print(f"登录脚本执行失败: {e}")
-        print(f"错误输出: {e.stderr}")
-        return None
-    except json.JSONDecodeError as e:
-        print(f"解析登录结果失败: {e}")
-        return None
+    return get_client().cached_login(phone_num, password)
 
 def call_get_data_script(app_user_id, role_id):
     """
-    调用数据获取脚本获取水电费信息
+    获取水电费信息
     
     Args:
         app_user_id (str): 用户ID
@@ -80,21 +68,7 @@ def call_get_data_script(app_user_id, role_id):
     Returns:
         dict: 水电费数据
     """
-    try:
-        result = subprocess.run(
-            [sys.executable, 'get_data.py', app_user_id, str(role_id)],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return json.loads(result.stdout)
-    except subprocess.CalledProcessError as e:
-        print(f"数据获取脚本执行失败: {e}")
-        print(f"错误输出: {e.stderr}")
-        return None
-    except json.JSONDecodeError as e:
-        print(f"解析数据结果失败: {e}")
-        return None
+    return get_client().get_utility_data(app_user_id, str(role_id))
 
 def check_threshold(data, config):
     """
@@ -172,6 +146,79 @@ def send_aoksend_mail(config, device_data):
         print(f"请求失败: {str(e)}")
         return False
 
+def check_once(phone_num, password, aoksend_config):
+    """
+    执行一轮检查：登录、获取数据、逐个设备检查余额并发送Aoksend邮件
+    
+    Args:
+        phone_num (str): 手机号
+        password (str): 密码
+        aoksend_config (dict): Aoksend配置
+        
+    Returns:
+        bool: 本轮检查是否成功完成
+    """
+    print("开始检查水电费数据...")
+    
+    # 登录
+    print("正在登录...")
+    login_result = call_login_script(phone_num, password)
+    
+    if not login_result or login_result.get('code') != 200:
+        print("登录失败")
+        print(login_result)
+        return False
+    
+    # 提取用户信息
+    user = login_result.get('user', {})
+    app_user_id = user.get('appUserId')
+    role_id = user.get('roleId')
+    
+    if not app_user_id or not role_id:
+        print("无法获取用户ID或角色ID")
+        return False
+    
+    print(f"登录成功，用户ID: {app_user_id}，角色ID: {role_id}")
+    cache_stats = get_client().login_cache.stats()
+    print(f"登录缓存: 命中 {cache_stats['hits']} 次，未命中 {cache_stats['misses']} 次")
+    
+    # 获取水电费数据
+    print("正在获取水电费数据...")
+    data_result = call_get_data_script(app_user_id, role_id)
+    
+    if not data_result or data_result.get('code') != 200:
+        print("数据获取失败")
+        print(data_result)
+        # 登录身份失效时作废缓存，下一轮重新登录
+        if data_result and data_result.get('code') in AUTH_FAILURE_CODES:
+            print("登录身份已失效，清除登录缓存")
+            get_client().invalidate_login(phone_num)
+        return False
+    
+    print("数据获取成功")
+    
+    # 逐个检查设备是否达到阈值
+    rows = data_result.get('rows', [])
+    sent_count = 0
+    
+    for device in rows:
+        # 检查当前设备是否达到阈值
+        value = device.get(aoksend_config['monitor_keyword'], float('inf'))
+        if isinstance(value, (int, float)) and value <= aoksend_config['monitor_start']:
+            print(f"检测到设备 '{device.get('acctName', '未知设备')}' 余额低于阈值，准备发送邮件通知...")
+            # 如果达到阈值，使用Aoksend API发送邮件
+            if send_aoksend_mail(aoksend_config, device):
+                sent_count += 1
+        else:
+            print(f"设备 '{device.get('acctName', '未知设备')}' 余额正常，无需发送邮件")
+    
+    if sent_count > 0:
+        print(f"本轮检查共发送 {sent_count} 封邮件")
+    else:
+        print("本轮检查未发现需要发送邮件的设备")
+    
+    return True
+
 def main():
     # 检查命令行参数
     if len(sys.argv) != 3:
@@ -192,62 +239,11 @@ def main():
     
     print(f"Aoksend配置加载成功，检查周期: {aoksend_config['monitor_timer']} 秒")
     
+    # 登录身份缓存，重启或下一轮检查时复用，只有过期或失效时才重新登录
+    get_client().login_cache = LoginCache(ttl=aoksend_config['login_cache_ttl'])
+    
     while True:
-        print("开始检查水电费数据...")
-        
-        # 调用登录脚本
-        print("正在登录...")
-        login_result = call_login_script(phone_num, password)
-        
-        if not login_result or login_result.get('code') != 200:
-            print("登录失败")
-            print(login_result)
-            time.sleep(aoksend_config['monitor_timer'])
-            continue
-        
-        # 提取用户信息
-        user = login_result.get('user', {})
-        app_user_id = user.get('appUserId')
-        role_id = user.get('roleId')
-        
-        if not app_user_id or not role_id:
-            print("无法获取用户ID或角色ID")
-            time.sleep(aoksend_config['monitor_timer'])
-            continue
-        
-        print(f"登录成功，用户ID: {app_user_id}，角色ID: {role_id}")
-        
-        # 调用数据获取脚本
-        print("正在获取水电费数据...")
-        data_result = call_get_data_script(app_user_id, role_id)
-        
-        if not data_result or data_result.get('code') != 200:
-            print("数据获取失败")
-            print(data_result)
-            time.sleep(aoksend_config['monitor_timer'])
-            continue
-        
-        print("数据获取成功")
-        
-        # 逐个检查设备是否达到阈值
-        rows = data_result.get('rows', [])
-        sent_count = 0
-        
-        for device in rows:
-            # 检查当前设备是否达到阈值
-            value = device.get(aoksend_config['monitor_keyword'], float('inf'))
-            if isinstance(value, (int, float)) and value <= aoksend_config['monitor_start']:
-                print(f"检测到设备 '{device.get('acctName', '未知设备')}' 余额低于阈值，准备发送邮件通知...")
-                # 如果达到阈值，使用Aoksend API发送邮件
-                if send_aoksend_mail(aoksend_config, device):
-                    sent_count += 1
-            else:
-                print(f"设备 '{device.get('acctName', '未知设备')}' 余额正常，无需发送邮件")
-        
-        if sent_count > 0:
-            print(f"本轮检查共发送 {sent_count} 封邮件")
-        else:
-            print("本轮检查未发现需要发送邮件的设备")
+        check_once(phone_num, password, aoksend_config)
         
         # 等待下一个检查周期
         print(f"等待 {aoksend_config['monitor_timer']} 秒后进行下一次检查...")
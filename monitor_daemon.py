@@ -2,11 +2,12 @@
 # -*- coding: utf-8 -*-
 
 import sys
-import json
-import subprocess
 import configparser
 import time
 
+import mail_sender
+from sany_client import get_client, LoginCache, LOGIN_CACHE_TTL, AUTH_FAILURE_CODES
+
 def load_monitor_config():
     """
     加载监控配置
@@ -19,6 +20,7 @@ def load_monitor_config():
     
     return {
         'check_round': config.getint('data', 'check_round'),
+        'login_cache_ttl': config.getint('data', 'login_cache_ttl', fallback=LOGIN_CACHE_TTL),
         'ele_keyword': config.get('data', 'ele_keyword'),
         'ele_num': config.getfloat('data', 'ele_num'),
         'water_keyword': config.get('data', 'water_keyword'),
@@ -27,7 +29,7 @@ def load_monitor_config():
 
 def call_login_script(phone_num, password):
     """
-    调用登录脚本获取用户信息
+    登录获取用户信息
     
     Args:
         phone_num (str): 手机号码
@@ -36,25 +38,11 @@ def call_login_script(phone_num, password):
     Returns:
         dict: 登录结果
     """
-    try:
-        result = subprocess.run(
-            [sys.executable, 'login.py', phone_num, password],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return json.loads(result.stdout)
-    except subprocess.CalledProcessError as e:
-        print(f"登录脚本执行失败: {e}")
-        print(f"错误输出: {e.stderr}")
-        return None
-    except json.JSONDecodeError as e:
-        print(f"解析登录结果失败: {e}")
-        return None
+    return get_client().cached_login(phone_num, password)
 
 def call_get_data_script(app_user_id, role_id):
     """
-    调用数据获取脚本获取水电费信息
+    获取水电费信息
     
     Args:
         app_user_id (str): 用户ID
@@ -63,21 +51,7 @@ def call_get_data_script(app_user_id, role_id):
     Returns:
         dict: 水电费数据
     """
-    try:
-        result = subprocess.run(
-            [sys.executable, 'get_data.py', app_user_id, str(role_id)],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return json.loads(result.stdout)
-    except subprocess.CalledProcessError as e:
-        print(f"数据获取脚本执行失败: {e}")
-        print(f"错误输出: {e.stderr}")
-        return None
-    except json.JSONDecodeError as e:
-        print(f"解析数据结果失败: {e}")
-        return None
+    return get_client().get_utility_data(app_user_id, str(role_id))
 
 def check_threshold(data, config):
     """
@@ -106,39 +80,81 @@ def check_threshold(data, config):
     
     return False
 
-def call_mail_sender(phone_num, password):
+def call_mail_sender(data_result):
     """
-    调用邮件发送脚本
+    使用已获取的数据发送邮件
     
     Args:
-        phone_num (str): 手机号码
-        password (str): 密码
+        data_result (dict): 水电费数据
     """
     try:
-        result = subprocess.run(
-            [sys.executable, 'mail_sender.py', phone_num, password],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        print("邮件发送脚本执行成功")
-        if result.stdout:
-            print(result.stdout)
-    except subprocess.CalledProcessError as e:
-        print(f"邮件发送脚本执行失败: {e}")
-        print(f"返回码: {e.returncode}")
-        if e.stdout:
-            print(f"标准输出: {e.stdout}")
-        if e.stderr:
-            print(f"错误输出: {e.stderr}")
-        # 如果没有错误输出，尝试获取更多详细信息
-        if not e.stderr and not e.stdout:
-            print("没有捕获到详细的错误信息，尝试直接运行查看错误详情...")
-            # 再次运行但不捕获输出，让错误直接显示到控制台
-            try:
-                subprocess.run([sys.executable, 'mail_sender.py', phone_num, password])
-            except Exception as inner_e:
-                print(f"再次尝试时发生错误: {inner_e}")
+        if mail_sender.send_report(data_result):
+            print("邮件发送成功")
+        else:
+            print("邮件发送失败")
+    except Exception as e:
+        print(f"邮件发送时发生错误: {e}")
+
+def check_once(phone_num, password, monitor_config):
+    """
+    执行一轮检查：登录、获取数据、余额低于阈值时发送邮件
+    
+    Args:
+        phone_num (str): 手机号
+        password (str): 密码
+        monitor_config (dict): 监控配置
+        
+    Returns:
+        bool: 本轮检查是否成功完成
+    """
+    print("开始检查水电费数据...")
+    
+    # 登录
+    print("正在登录...")
+    login_result = call_login_script(phone_num, password)
+    
+    if not login_result or login_result.get('code') != 200:
+        print("登录失败")
+        print(login_result)
+        return False
+    
+    # 提取用户信息
+    user = login_result.get('user', {})
+    app_user_id = user.get('appUserId')
+    role_id = user.get('roleId')
+    
+    if not app_user_id or not role_id:
+        print("无法获取用户ID或角色ID")
+        return False
+    
+    print(f"登录成功，用户ID: {app_user_id}，角色ID: {role_id}")
+    cache_stats = get_client().login_cache.stats()
+    print(f"登录缓存: 命中 {cache_stats['hits']} 次，未命中 {cache_stats['misses']} 次")
+    
+    # 获取水电费数据
+    print("正在获取水电费数据...")
+    data_result = call_get_data_script(app_user_id, role_id)
+    
+    if not data_result or data_result.get('code') != 200:
+        print("数据获取失败")
+        print(data_result)
+        # 登录身份失效时作废缓存，下一轮重新登录
+        if data_result and data_result.get('code') in AUTH_FAILURE_CODES:
+            print("登录身份已失效，清除登录缓存")
+            get_client().invalidate_login(phone_num)
+        return False
+    
+    print("数据获取成功")
+    
+    # 检查是否达到阈值
+    if check_threshold(data_result, monitor_config):
+        print("检测到余额低于阈值，准备发送邮件通知...")
+        # 如果达到阈值，直接复用本轮数据发送邮件
+        call_mail_sender(data_result)
+    else:
+        print("余额正常，无需发送邮件")
+    
+    return True
 
 def main():
     # 检查命令行参数
@@ -160,50 +176,11 @@ def main():
     
     print(f"监控配置加载成功，检查周期: {monitor_config['check_round']} 秒")
     
+    # 登录身份缓存，重启或下一轮检查时复用，只有过期或失效时才重新登录
+    get_client().login_cache = LoginCache(ttl=monitor_config['login_cache_ttl'])
+    
     while True:
-        print("开始检查水电费数据...")
-        
-        # 调用登录脚本
-        print("正在登录...")
-        login_result = call_login_script(phone_num, password)
-        
-        if not login_result or login_result.get('code') != 200:
-            print("登录失败")
-            print(login_result)
-            time.sleep(monitor_config['check_round'])
-            continue
-        
-        # 提取用户信息
-        user = login_result.get('user', {})
-        app_user_id = user.get('appUserId')
-        role_id = user.get('roleId')
-        
-        if not app_user_id or not role_id:
-            print("无法获取用户ID或角色ID")
-            time.sleep(monitor_config['check_round'])
-            continue
-        
-        print(f"登录成功，用户ID: {app_user_id}，角色ID: {role_id}")
-        
-        # 调用数据获取脚本
-        print("正在获取水电费数据...")
-        data_result = call_get_data_script(app_user_id, role_id)
-        
-        if not data_result or data_result.get('code') != 200:
-            print("数据获取失败")
-            print(data_result)
-            time.sleep(monitor_config['check_round'])
-            continue
-        
-        print("数据获取成功")
-        
-        # 检查是否达到阈值
-        if check_threshold(data_result, monitor_config):
-            print("检测到余额低于阈值，准备发送邮件通知...")
-            # 如果达到阈值，调用邮件发送脚本
-            call_mail_sender(phone_num, password)
-        else:
-            print("余额正常，无需发送邮件")
+        check_once(phone_num, password, monitor_config)
         
         # 等待下一个检查周期
         print(f"等待 {monitor_config['check_round']} 秒后进行下一次检查...")
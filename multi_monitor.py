@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+多账号水电费监控（asyncio）
+
+在一个事件循环里轮询 config/accounts.ini 中登记的所有账号，替代每个账号单独运行一个
+monitor_aoksender.py 进程。所有账号共用一个 aiohttp 会话（复用到上游主机的 keep-alive 连接），
+并通过全局信号量限制同时进行的请求数。签名算法与 sany_client.generate_sign 完全一致。
+"""
+
+import sys
+import time
+import asyncio
+import configparser
+import aiohttp
+
+import monitor_aoksender
+from sany_client import (
+    BASE_URL, CHANNEL_ID, REQUEST_TIMEOUT, DEFAULT_HEADERS, AUTH_FAILURE_CODES,
+    LOGIN_CACHE_TTL, LoginCache, generate_sign, get_timestamp, md5_encrypt
+)
+
+# 账号名单配置文件
+ROSTER_FILE = 'config/accounts.ini'
+
+def load_roster(path=ROSTER_FILE):
+    """
+    加载账号名单
+
+    Returns:
+        tuple: (轮询配置字典, 账号列表)
+    """
+    config = configparser.ConfigParser()
+    if not config.read(path, encoding='utf-8'):
+        raise FileNotFoundError(f"无法读取 {path} 配置文件，请检查文件是否存在且可访问")
+
+    poller_config = {
+        'round_time': config.getint('poller', 'round_time', fallback=3600),
+        'concurrency': config.getint('poller', 'concurrency', fallback=8),
+        'login_cache_ttl': config.getint('poller', 'login_cache_ttl', fallback=LOGIN_CACHE_TTL)
+    }
+
+    accounts = []
+    for section in config.sections():
+        if not section.startswith('account.'):
+            continue
+        accounts.append({
+            'name': section[len('account.'):],
+            'phone': config.get(section, 'phone'),
+            'password': config.get(section, 'password'),
+            'to': config.get(section, 'to', fallback='')
+        })
+
+    return poller_config, accounts
+
+class AsyncSanyClient:
+    """上游接口的异步客户端，所有账号共享一个会话和并发上限"""
+
+    def __init__(self, session, semaphore, base_url=BASE_URL, login_cache=None):
+        self.session = session
+        self.semaphore = semaphore
+        self.base_url = base_url.rstrip('/')
+        self.login_cache = login_cache if login_cache is not None else LoginCache()
+
+    async def _request(self, method, path, **kwargs):
+        """发送请求并解析JSON，失败时返回 code=-1 的结果"""
+        url = self.base_url + path
+        try:
+            async with self.semaphore:
+                async with self.session.request(method, url, **kwargs) as response:
+                    return await response.json(content_type=None)
+        except Exception as e:
+            return {"code": -1, "msg": f"请求失败: {str(e)}"}
+
+    async def login(self, phone_num, password):
+        """用户登录"""
+        login_params = {
+            "phoneNum": phone_num,
+            "password": md5_encrypt(password),
+            "channelid": CHANNEL_ID,
+            "timestamp": get_timestamp()
+        }
+        signed_params = generate_sign(login_params, trailing_separator=False)
+        return await self._request('POST', '/external/appUser/login', json=signed_params)
+
+    async def cached_login(self, phone_num, password):
+        """
+        优先使用缓存的登录身份，缓存未命中或过期时才真正登录
+
+        登录缓存的读写包含密码摘要计算和文件写入，放到线程池中执行，不阻塞事件循环
+        """
+        loop = asyncio.get_running_loop()
+        cached = await loop.run_in_executor(None, self.login_cache.get, phone_num, password)
+        if cached is not None:
+            return cached
+
+        result = await self.login(phone_num, password)
+        if result.get('code') == 200:
+            await loop.run_in_executor(None, self.login_cache.put, phone_num, password, result)
+        return result
+
+    async def invalidate_login(self, phone_num):
+        """作废指定账号的登录缓存（写文件放到线程池中执行）"""
+        await asyncio.get_running_loop().run_in_executor(None, self.login_cache.invalidate, phone_num)
+
+    async def get_utility_data(self, app_user_id, role_id):
+        """获取水电费数据"""
+        query_params = {
+            "appUserId": app_user_id,
+            "channelid": CHANNEL_ID,
+            "roleId": role_id,
+            "timestamp": get_timestamp()
+        }
+        signed_params = generate_sign(query_params)
+        return await self._request('GET', '/external/appUserAcct/list', params=signed_params)
+
+async def poll_account(client, account, aoksend_config):
+    """
+    检查单个账号，余额低于阈值的设备逐个发送Aoksend邮件
+
+    Returns:
+        int: 本轮发送的邮件数量
+    """
+    name = account['name']
+    login_result = await client.cached_login(account['phone'], account['password'])
+    if login_result.get('code') != 200:
+        print(f"[{name}] 登录失败: {login_result}")
+        return 0
+
+    user = login_result.get('user', {})
+    app_user_id = user.get('appUserId')
+    role_id = user.get('roleId')
+    if not app_user_id or not role_id:
+        print(f"[{name}] 无法获取用户ID或角色ID")
+        return 0
+
+    data_result = await client.get_utility_data(app_user_id, role_id)
+    if data_result.get('code') != 200:
+        print(f"[{name}] 数据获取失败: {data_result}")
+        # 登录身份失效时作废缓存，下一轮重新登录
+        if data_result.get('code') in AUTH_FAILURE_CODES:
+            await client.invalidate_login(account['phone'])
+        return 0
+
+    # 每个账号使用自己的收件人地址
+    account_config = dict(aoksend_config, to=account['to'] or aoksend_config['to'])
+    loop = asyncio.get_running_loop()
+    sent_count = 0
+    for device in monitor_aoksender.check_threshold(data_result, account_config):
+        print(f"[{name}] 设备 '{device.get('acctName', '未知设备')}' 余额低于阈值，发送邮件通知")
+        # 邮件发送是阻塞调用，放到线程池中执行，不阻塞其他账号的轮询
+        if await loop.run_in_executor(None, monitor_aoksender.send_aoksend_mail, account_config, device):
+            sent_count += 1
+
+    return sent_count
+
+async def poll_round(client, accounts, aoksend_config):
+    """并发检查所有账号"""
+    start_time = time.time()
+    results = await asyncio.gather(
+        *(poll_account(client, account, aoksend_config) for account in accounts),
+        return_exceptions=True
+    )
+
+    sent_count = 0
+    for account, result in zip(accounts, results):
+        if isinstance(result, Exception):
+            print(f"[{account['name']}] 检查时出错: {result}")
+        else:
+            sent_count += result
+
+    cache_stats = client.login_cache.stats()
+    print(f"本轮检查 {len(accounts)} 个账号，发送 {sent_count} 封邮件，耗时 {time.time() - start_time:.2f} 秒，"
+          f"登录缓存命中 {cache_stats['hits']} 次，未命中 {cache_stats['misses']} 次")
+
+async def run(poller_config, accounts, aoksend_config):
+    """创建共享会话并循环轮询"""
+    connector = aiohttp.TCPConnector(limit=poller_config['concurrency'], keepalive_timeout=60)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    semaphore = asyncio.Semaphore(poller_config['concurrency'])
+    login_cache = LoginCache(ttl=poller_config['login_cache_ttl'])
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=DEFAULT_HEADERS) as session:
+        client = AsyncSanyClient(session, semaphore, login_cache=login_cache)
+        while True:
+            await poll_round(client, accounts, aoksend_config)
+            print(f"等待 {poller_config['round_time']} 秒后进行下一次检查...")
+            await asyncio.sleep(poller_config['round_time'])
+
+def main():
+    # 检查命令行参数
+    roster_file = sys.argv[1] if len(sys.argv) > 1 else ROSTER_FILE
+
+    # 加载账号名单和Aoksend配置
+    try:
+        poller_config, accounts = load_roster(roster_file)
+        aoksend_config = monitor_aoksender.load_aoksend_config()
+    except Exception as e:
+        print(f"加载配置失败: {e}")
+        sys.exit(1)
+
+    if not accounts:
+        print(f"{roster_file} 中没有登记任何账号")
+        sys.exit(1)
+
+    print(f"共 {len(accounts)} 个账号，并发上限 {poller_config['concurrency']}，检查周期 {poller_config['round_time']} 秒")
+
+    try:
+        asyncio.run(run(poller_config, accounts, aoksend_config))
+    except KeyboardInterrupt:
+        print("收到中断信号，退出")
+
+if __name__ == "__main__":
+    main()
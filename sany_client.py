@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+上游接口客户端（sywap.funsine.com）
+
+login.py / get_data.py / check_data.py 以及各个守护进程共用的进程内客户端。
+内部持有一个 requests.Session，同一进程内的多次请求复用同一条 keep-alive 连接，
+不再需要每次启动新的 Python 解释器并重新建立 TCP 连接。
+"""
+
+import os
+import json
+import time
+import math
+import random
+import hmac
+import hashlib
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+
+# 签名密钥
+SIGN_KEY = "DJKSBNW123"
+
+# 渠道ID（硬编码）
+CHANNEL_ID = "1003"
+
+# 接口根地址，可通过环境变量覆盖（便于测试）
+BASE_URL = os.environ.get('SANY_API_BASE_URL', 'http://sywap.funsine.com/prod-api')
+
+# 请求超时时间，单位为秒
+REQUEST_TIMEOUT = 30
+
+# 登录缓存文件路径及默认有效期（秒）
+LOGIN_CACHE_FILE = os.environ.get('SANY_LOGIN_CACHE_FILE', 'config/login_cache.json')
+LOGIN_CACHE_TTL = 86400
+
+# 登录缓存中密码摘要的 PBKDF2 迭代次数
+LOGIN_CACHE_DIGEST_ITERATIONS = 100000
+
+# 表示登录身份失效的返回码，遇到时需要作废缓存并重新登录
+AUTH_FAILURE_CODES = {401, 403}
+
+# 全量抓取设备列表时的默认并发数、每秒请求数上限和单页重试次数
+CRAWL_WORKERS = 4
+CRAWL_RATE = 5.0
+CRAWL_RETRIES = 3
+
+# 默认请求头
+DEFAULT_HEADERS = {
+    "Content-Type": "application/json;charset=UTF-8",
+    "Accept": "application/json, text/plain, */*",
+    "User-Agent": "Mozilla/5.0 (Linux; Android 6.0; Nexus 5 Build/MRA58N) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Mobile Safari/537.36 Edg/141.0.0.0"
+}
+
+def generate_sign(params, trailing_separator=True):
+    """
+    生成签名，模拟JavaScript中的签名生成过程
+
+    Args:
+        params (dict): 请求参数字典
+        trailing_separator (bool): 每个参数后是否都带 '&'（KEY=VALUE&KEY=VALUE&密钥）。
+            登录接口历史上使用不带末尾 '&' 的拼接方式（KEY=VALUE&KEY=VALUE密钥），保持原样
+
+    Returns:
+        dict: 包含签名的参数字典（参数值均转换为字符串）
+    """
+    # 按照参数名的字典序排序，并将参数值转为字符串
+    signed = {key: str(params[key]) for key in sorted(params.keys())}
+
+    # 拼接参数字符串，参数名和参数值都转换为大写
+    pairs = ["{}={}".format(key.upper(), value.upper()) for key, value in signed.items()]
+    if trailing_separator:
+        param_str = "".join(pair + "&" for pair in pairs)
+    else:
+        param_str = "&".join(pairs)
+
+    # 添加密钥并MD5加密
+    signed['sign'] = md5_encrypt(param_str + SIGN_KEY)
+
+    return signed
+
+def get_timestamp():
+    """
+    获取当前时间戳，格式为YYYYMMDDHHmmss
+
+    Returns:
+        str: 时间戳字符串
+    """
+    return time.strftime("%Y%m%d%H%M%S")
+
+def md5_encrypt(text):
+    """
+    MD5加密
+
+    Args:
+        text (str): 待加密文本
+
+    Returns:
+        str: 加密后的MD5值
+    """
+    md5 = hashlib.md5()
+    md5.update(text.encode('utf-8'))
+    return md5.hexdigest()
+
+class RateLimiter:
+    """令牌桶限速器，同一主机的所有请求共享一个实例"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """阻塞直到取得一个令牌"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# 按主机划分的限速器
+_host_limiters = {}
+_host_limiters_lock = threading.Lock()
+
+def get_host_limiter(url, rate):
+    """
+    获取指定URL所属主机的限速器
+
+    Args:
+        url (str): 请求地址
+        rate (float): 每秒请求数上限（仅在首次创建时生效）
+
+    Returns:
+        RateLimiter: 限速器
+    """
+    host = urlparse(url).netloc
+    with _host_limiters_lock:
+        if host not in _host_limiters:
+            _host_limiters[host] = RateLimiter(rate)
+        return _host_limiters[host]
+
+class LoginCache:
+    """
+    登录身份缓存（内存 + 磁盘），按手机号存储 appUserId/roleId
+
+    缓存条目带有密码摘要（每个条目随机加盐的 PBKDF2），密码变更后旧条目自动失效；
+    超过 TTL 或遇到身份失效返回码时也会重新登录。缓存文件只对所有者可读写。
+
+    PBKDF2 在锁外计算；验证通过的摘要记在进程内（以进程随机密钥的 HMAC 作为键，不保存明文密码），
+    同一账号再次命中时只比较摘要，不再重复计算 PBKDF2。
+    """
+
+    def __init__(self, path=LOGIN_CACHE_FILE, ttl=LOGIN_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = self._load()
+        # 进程内已验证的密码：{HMAC(账号:密码): 条目的密码摘要}
+        self._process_key = os.urandom(32)
+        self._verified = {}
+
+    def _load(self):
+        """从磁盘加载缓存，文件不存在或损坏时返回空缓存"""
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取登录缓存失败，忽略缓存: {e}")
+            return {}
+
+    def _save(self):
+        """原子地写回磁盘，文件权限为 0600"""
+        if not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            # 临时文件已存在时 os.open 不会修改其权限
+            os.fchmod(fd, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"写入登录缓存失败: {e}")
+
+    @staticmethod
+    def _password_digest(phone_num, password, salt):
+        """
+        计算密码摘要
+
+        Args:
+            phone_num (str): 手机号码
+            password (str): 密码（明文）
+            salt (str): 十六进制的随机盐
+
+        Returns:
+            str: 十六进制的 PBKDF2-SHA256 摘要
+        """
+        return hashlib.pbkdf2_hmac('sha256', f"{phone_num}:{password}".encode('utf-8'),
+                                   bytes.fromhex(salt), LOGIN_CACHE_DIGEST_ITERATIONS).hex()
+
+    def _verified_key(self, phone_num, password):
+        """进程内已验证密码表的键"""
+        return hmac.new(self._process_key, f"{phone_num}:{password}".encode('utf-8'), hashlib.sha256).digest()
+
+    def _password_matches(self, entry, phone_num, password):
+        """缓存条目的密码摘要是否与给定密码一致，旧版本的无盐条目视为不一致"""
+        expected = str(entry.get('digest', ''))
+        verified_key = self._verified_key(phone_num, password)
+        if expected and self._verified.get(verified_key) == expected:
+            return True
+        try:
+            digest = self._password_digest(phone_num, password, entry['salt'])
+        except (KeyError, TypeError, ValueError):
+            return False
+        if not hmac.compare_digest(digest, expected):
+            return False
+        self._verified[verified_key] = expected
+        return True
+
+    def get(self, phone_num, password):
+        """
+        读取缓存的登录结果
+
+        Returns:
+            dict: 缓存的登录结果，未命中时返回None
+        """
+        with self._lock:
+            entry = self._entries.get(phone_num)
+        hit = (entry is not None
+               and time.time() - entry.get('cached_at', 0) < self.ttl
+               and self._password_matches(entry, phone_num, password))
+        with self._lock:
+            if hit:
+                self.hits += 1
+                return entry['result']
+            self.misses += 1
+            return None
+
+    def put(self, phone_num, password, login_result):
+        """写入登录结果（仅缓存成功的登录）"""
+        salt = os.urandom(16).hex()
+        digest = self._password_digest(phone_num, password, salt)
+        self._verified[self._verified_key(phone_num, password)] = digest
+        with self._lock:
+            self._entries[phone_num] = {
+                'salt': salt,
+                'digest': digest,
+                'cached_at': time.time(),
+                'result': login_result
+            }
+            self._save()
+
+    def invalidate(self, phone_num):
+        """作废指定手机号的缓存"""
+        with self._lock:
+            if self._entries.pop(phone_num, None) is not None:
+                self._save()
+
+    def stats(self):
+        """
+        获取命中统计
+
+        Returns:
+            dict: 命中次数、未命中次数和命中率
+        """
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0
+        }
+
+class SanyClient:
+    """上游接口客户端，持有持久化的 requests.Session"""
+
+    def __init__(self, base_url=BASE_URL, timeout=REQUEST_TIMEOUT, login_cache=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        self.login_cache = login_cache
+        self.adapter = None
+        self.pool_maxsize = 0
+        self._mount_adapter(CRAWL_WORKERS)
+
+    def _mount_adapter(self, pool_maxsize):
+        """
+        为上游主机挂载连接池，替换时关闭原来的连接池
+
+        Args:
+            pool_maxsize (int): 连接池容量
+        """
+        old_adapter = self.adapter
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.pool_maxsize = pool_maxsize
+        self.session.mount(self.base_url, self.adapter)
+        if old_adapter is not None:
+            old_adapter.close()
+
+    def _request(self, method, path, **kwargs):
+        """发送请求并解析JSON，失败时返回 code=-1 的结果"""
+        url = self.base_url + path
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            return response.json()
+        except Exception as e:
+            return {"code": -1, "msg": f"请求失败: {str(e)}"}
+
+    def login(self, phone_num, password):
+        """
+        用户登录
+
+        Args:
+            phone_num (str): 手机号码
+            password (str): 密码（明文）
+
+        Returns:
+            dict: 登录结果
+        """
+        login_params = {
+            "phoneNum": phone_num,
+            "password": md5_encrypt(password),
+            "channelid": CHANNEL_ID,
+            "timestamp": get_timestamp()
+        }
+        signed_params = generate_sign(login_params, trailing_separator=False)
+        return self._request('POST', '/external/appUser/login', json=signed_params)
+
+    def cached_login(self, phone_num, password):
+        """
+        优先使用缓存的登录身份，缓存未命中或过期时才真正登录
+
+        Args:
+            phone_num (str): 手机号码
+            password (str): 密码（明文）
+
+        Returns:
+            dict: 登录结果
+        """
+        if self.login_cache is None:
+            self.login_cache = LoginCache()
+
+        cached = self.login_cache.get(phone_num, password)
+        if cached is not None:
+            return cached
+
+        result = self.login(phone_num, password)
+        if result.get('code') == 200:
+            self.login_cache.put(phone_num, password, result)
+        return result
+
+    def invalidate_login(self, phone_num):
+        """作废指定账号的登录缓存，下次调用 cached_login 时重新登录"""
+        if self.login_cache is not None:
+            self.login_cache.invalidate(phone_num)
+
+    def get_utility_data(self, app_user_id, role_id):
+        """
+        获取水电费数据
+
+        Args:
+            app_user_id (str): 用户ID
+            role_id (str): 角色ID
+
+        Returns:
+            dict: 水电费数据
+        """
+        query_params = {
+            "appUserId": app_user_id,
+            "channelid": CHANNEL_ID,
+            "roleId": role_id,
+            "timestamp": get_timestamp()
+        }
+        signed_params = generate_sign(query_params)
+        return self._request('GET', '/external/appUserAcct/list', params=signed_params)
+
+    def list_equipment(self, app_user_id, role_id, page_num=1, page_size=15):
+        """
+        分页获取设备数据
+
+        Args:
+            app_user_id (str): 用户ID
+            role_id (str): 角色ID
+            page_num (int): 页码，默认为1
+            page_size (int): 每页条数，默认为15
+
+        Returns:
+            dict: 设备数据
+        """
+        query_params = {
+            "appUserId": app_user_id,
+            "channelid": CHANNEL_ID,
+            "pageNum": page_num,
+            "pageSize": page_size,
+            "roleKey": role_id,
+            "timestamp": get_timestamp()
+        }
+        signed_params = generate_sign(query_params)
+        return self._request('GET', '/external/equipment/list', params=signed_params)
+
+    def fetch_equipment_page(self, app_user_id, role_id, page_num, page_size, limiter=None, retries=CRAWL_RETRIES):
+        """
+        获取单页设备数据，失败时按指数退避重试
+
+        Returns:
+            dict: 设备数据，重试耗尽后返回最后一次的失败结果
+        """
+        result = None
+        for attempt in range(retries + 1):
+            if limiter is not None:
+                limiter.acquire()
+            result = self.list_equipment(app_user_id, role_id, page_num, page_size)
+            if result.get('code') == 200:
+                return result
+            if attempt < retries:
+                delay = 0.5 * (2 ** attempt) + random.uniform(0, 0.5)
+                print(f"第 {page_num} 页获取失败（{result.get('msg')}），{delay:.1f} 秒后重试")
+                time.sleep(delay)
+        return result
+
+    def crawl_equipment(self, app_user_id, role_id, page_size=100, max_workers=CRAWL_WORKERS, rate=CRAWL_RATE):
+        """
+        全量抓取设备列表：先读取第1页得到 total，再并发抓取其余页
+
+        每页数据一到达就立即产出，调用方可以边抓取边入库。
+
+        Args:
+            app_user_id (str): 用户ID
+            role_id (str): 角色ID
+            page_size (int): 每页条数
+            max_workers (int): 并发抓取的线程数
+            rate (float): 对上游主机的每秒请求数上限
+
+        Yields:
+            tuple: (页码, 该页的结果字典)
+        """
+        limiter = get_host_limiter(self.base_url, rate)
+
+        first_page = self.fetch_equipment_page(app_user_id, role_id, 1, page_size, limiter)
+        yield 1, first_page
+        if first_page.get('code') != 200:
+            return
+
+        total = int(first_page.get('total') or 0)
+        page_count = math.ceil(total / page_size) if page_size else 1
+        if page_count <= 1:
+            return
+
+        # 保证连接池足够容纳所有并发线程，避免反复新建连接；容量足够时沿用已挂载的连接池
+        if max_workers > self.pool_maxsize:
+            self._mount_adapter(max_workers)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                pool.submit(self.fetch_equipment_page, app_user_id, role_id, page_num, page_size, limiter): page_num
+                for page_num in range(2, page_count + 1)
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+    def close(self):
+        """关闭会话"""
+        self.session.close()
+
+# 进程内共享的默认客户端
+_default_client = None
+
+def get_client():
+    """
+    获取进程内共享的客户端实例
+
+    Returns:
+        SanyClient: 客户端实例
+    """
+    global _default_client
+    if _default_client is None:
+        _default_client = SanyClient()
+    return _default_client
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+常驻任务调度器
+
+替代 daemon.sh 的 eval + sleep 循环。从 config/daemon.ini 读取多个任务，在同一个进程内按固定
+频率（以启动时刻为基准，不会因任务耗时累积漂移）加随机抖动执行入库、监控和邮件检查任务。
+每个任务在自己的线程中串行执行，同一任务不会重叠运行；上一次运行超时错过的周期会合并为一次
+立即执行并计入跳过次数。每次运行后输出该任务的耗时直方图。
+"""
+
+import os
+import sys
+import time
+import random
+import signal
+import threading
+import subprocess
+import configparser
+from datetime import datetime
+
+from sany_client import get_client, LoginCache, LOGIN_CACHE_TTL
+
+# 调度配置文件
+SCHEDULER_CONFIG_FILE = 'config/daemon.ini'
+
+# 预警检查任务（全量检查和事件驱动检查）共用的锁：同时运行时可能选中同一订阅并重复记录预警次数
+CHECKER_LOCK = threading.Lock()
+
+# 耗时直方图的桶上界，单位为秒
+DURATION_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, float('inf'))
+
+def log(message):
+    """带时间戳输出日志"""
+    print(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}: {message}", flush=True)
+
+class DurationHistogram:
+    """按固定桶统计任务耗时"""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        """记录一次耗时"""
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """按桶上界估算分位数"""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return self.max if bound == float('inf') else bound
+        return self.max
+
+    def summary(self):
+        """
+        生成直方图摘要
+
+        Returns:
+            str: 形如 "次数 3, 平均 1.20s, p50≤1s, p95≤2s, 最大 1.80s | ≤1s:2 ≤2s:1" 的文本
+        """
+        if self.count == 0:
+            return "尚未运行"
+        buckets = ' '.join(
+            f"{'>' + str(self.buckets[i - 1]) if bound == float('inf') else '≤' + str(bound)}s:{count}"
+            for i, (bound, count) in enumerate(zip(self.buckets, self.counts)) if count
+        )
+        return (f"次数 {self.count}, 平均 {self.total / self.count:.2f}s, "
+                f"p50≤{self.quantile(0.5):g}s, p95≤{self.quantile(0.95):g}s, 最大 {self.max:.2f}s | {buckets}")
+
+class Job:
+    """一个按固定频率执行的任务"""
+
+    def __init__(self, name, interval, jitter, func):
+        """
+        Args:
+            name (str): 任务名
+            interval (float): 执行周期，单位为秒
+            jitter (float): 每次执行前额外等待的随机时间上限，单位为秒
+            func (callable): 任务函数，返回 False 表示失败
+        """
+        self.name = name
+        self.interval = interval
+        self.jitter = jitter
+        self.func = func
+        self.histogram = DurationHistogram()
+        self.failures = 0
+        self.skipped = 0
+
+    def run_once(self):
+        """执行一次任务并记录耗时"""
+        log(f"[{self.name}] 开始执行")
+        start = time.monotonic()
+        try:
+            ok = self.func() is not False
+        except Exception as e:
+            log(f"[{self.name}] 执行出错: {e}")
+            ok = False
+        duration = time.monotonic() - start
+        self.histogram.observe(duration)
+        if not ok:
+            self.failures += 1
+
+        log(f"[{self.name}] 执行{'成功' if ok else '失败'}，耗时 {duration:.2f} 秒，"
+            f"累计失败 {self.failures} 次，跳过周期 {self.skipped} 次")
+        log(f"[{self.name}] 耗时分布: {self.histogram.summary()}")
+
+    def loop(self, stop_event):
+        """按固定频率循环执行，直到 stop_event 被设置"""
+        next_slot = time.monotonic()
+        while not stop_event.is_set():
+            delay = next_slot + random.uniform(0, self.jitter) - time.monotonic()
+            if delay > 0 and stop_event.wait(delay):
+                break
+
+            self.run_once()
+
+            # 以计划时刻而非结束时刻推算下一次执行，避免漂移
+            next_slot += self.interval
+            now = time.monotonic()
+            if now > next_slot:
+                # 本次运行超过了周期，错过的周期合并为一次立即执行
+                missed = int((now - next_slot) // self.interval)
+                if missed > 0:
+                    self.skipped += missed
+                    log(f"[{self.name}] 运行时间超过执行周期，跳过 {missed} 个周期")
+                next_slot += missed * self.interval
+            else:
+                log(f"[{self.name}] 下一次执行在 {next_slot - now:.0f} 秒后")
+
+def make_ingest_job(section):
+    """data2sql 入库任务"""
+    import data2sql
+
+    app_user_id = section.get('app_user_id')
+    role_id = section.get('role_id')
+    page_num = section.get('page_num', fallback='1')
+    page_size = section.getint('page_size', fallback=100)
+    crawl_all = page_num == 'all'
+
+    def run():
+        return data2sql.run(app_user_id, role_id, 1 if crawl_all else int(page_num), page_size, crawl_all)
+    return run
+
+def make_monitor_job(section):
+    """SMTP 余额监控任务"""
+    import monitor_daemon
+
+    phone_num = section.get('phone')
+    password = section.get('password')
+    monitor_config = monitor_daemon.load_monitor_config()
+
+    def run():
+        return monitor_daemon.check_once(phone_num, password, monitor_config)
+    return run
+
+def make_aoksend_job(section):
+    """Aoksend 余额监控任务"""
+    import monitor_aoksender
+
+    phone_num = section.get('phone')
+    password = section.get('password')
+    aoksend_config = monitor_aoksender.load_aoksend_config()
+
+    def run():
+        return monitor_aoksender.check_once(phone_num, password, aoksend_config)
+    return run
+
+def make_checker_job(section):
+    """
+    server/email_checker.py 的订阅预警检查任务，events = true 时只检查有新读数事件的设备
+
+    同一进程中的多个预警检查任务通过 CHECKER_LOCK 依次执行，与 email_checker.py 单独运行时一致
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server'))
+    import email_checker
+
+    if section.getboolean('events', fallback=False):
+        def run():
+            with CHECKER_LOCK:
+                email_checker.process_reading_events()
+        return run
+
+    def run():
+        with CHECKER_LOCK:
+            email_checker.check_and_alert()
+    return run
+
+def make_command_job(section):
+    """兼容旧配置：在子进程中执行一条 shell 命令"""
+    command = section.get('command').strip().strip('"\'')
+
+    def run():
+        return subprocess.run(command, shell=True).returncode == 0
+    return run
+
+JOB_TYPES = {
+    'ingest': make_ingest_job,
+    'monitor': make_monitor_job,
+    'aoksend': make_aoksend_job,
+    'checker': make_checker_job,
+    'command': make_command_job
+}
+
+def load_jobs(path=SCHEDULER_CONFIG_FILE):
+    """
+    加载调度配置
+
+    支持 [job.<名称>] 形式的多个任务；只有旧的 [daemon] 段时按原 daemon.sh 的
+    rec_time/command 创建一个命令任务。
+
+    Returns:
+        tuple: (调度配置字典, 任务列表)
+    """
+    config = configparser.ConfigParser(interpolation=None)
+    if not config.read(path, encoding='utf-8'):
+        raise FileNotFoundError(f"无法读取 {path} 配置文件，请检查文件是否存在且可访问")
+
+    scheduler_config = {
+        'login_cache_ttl': config.getint('scheduler', 'login_cache_ttl', fallback=LOGIN_CACHE_TTL)
+    }
+
+    jobs = []
+    for section_name in config.sections():
+        if not section_name.startswith('job.'):
+            continue
+        section = config[section_name]
+        job_type = section.get('type', fallback='command')
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"任务 {section_name} 的类型 {job_type} 无效，可选: {', '.join(JOB_TYPES)}")
+        jobs.append(Job(
+            section_name[len('job.'):],
+            section.getfloat('interval'),
+            section.getfloat('jitter', fallback=0),
+            JOB_TYPES[job_type](section)
+        ))
+
+    if not jobs and config.has_section('daemon'):
+        section = config['daemon']
+        if section.get('command', fallback='').strip().strip('"\''):
+            jobs.append(Job('daemon', section.getfloat('rec_time'), 0, make_command_job(section)))
+
+    return scheduler_config, jobs
+
+def main():
+    # 检查命令行参数
+    config_file = sys.argv[1] if len(sys.argv) > 1 else SCHEDULER_CONFIG_FILE
+
+    try:
+        scheduler_config, jobs = load_jobs(config_file)
+    except Exception as e:
+        print(f"加载调度配置失败: {e}")
+        sys.exit(1)
+
+    if not jobs:
+        print(f"{config_file} 中没有配置任何任务")
+        sys.exit(1)
+
+    # 所有进程内任务共用一个上游客户端和登录缓存
+    get_client().login_cache = LoginCache(ttl=scheduler_config['login_cache_ttl'])
+
+    print("调度器启动")
+    for job in jobs:
+        print(f"任务 {job.name}: 周期 {job.interval:g} 秒，随机抖动 {job.jitter:g} 秒")
+    print("按 Ctrl+C 停止调度器")
+    print("----------------------------------------")
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+
+    threads = [threading.Thread(target=job.loop, args=(stop_event,), name=job.name, daemon=True) for job in jobs]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while not stop_event.wait(1):
+            pass
+    except KeyboardInterrupt:
+        stop_event.set()
+
+    log("收到停止信号，等待正在执行的任务结束")
+    for thread in threads:
+        thread.join()
+
+    for job in jobs:
+        print(f"任务 {job.name}: 失败 {job.failures} 次，跳过周期 {job.skipped} 次，耗时分布: {job.histogram.summary()}")
+
+if __name__ == "__main__":
+    main()
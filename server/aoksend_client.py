@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+进程内 Aoksend 邮件发送客户端
+
+替代每封邮件启动一次 aoksend-api-cli.py 子进程的方式：所有邮件复用同一个 requests 会话
+（keep-alive 连接池，不必每次重新建立 TLS 连接）。send_sync() 由发送队列（email_outbox.py）的
+工作线程调用，调用方不需要等待邮件服务商的响应。请求参数与 aoksend-api-cli.py 完全一致。
+"""
+
+import os
+import json
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Aoksend API默认URL
+DEFAULT_API_URL = "https://www.aoksend.com/index/api/send_email"
+
+# 默认同时发送的邮件数（连接池大小）
+DEFAULT_MAX_WORKERS = 4
+
+# 单次请求超时时间，单位为秒
+REQUEST_TIMEOUT = 30
+
+# 支持的附件文件类型
+SUPPORTED_FILE_TYPES = {
+    "zip", "rar", "pdf", "jpg", "png", "gif", "mp4", "txt", "doc", "xls",
+    "ppt", "docx", "xlsx", "pptx", "jpeg", "csv"
+}
+
+# 返回码对照
+RESPONSE_CODES = {
+    200: "请求成功",
+    40001: "API密钥不能为空",
+    40002: "认证失败API密钥错误",
+    40003: "模板ID错误",
+    40004: "收件人地址to不能为空",
+    40005: "收件人地址to格式不正确",
+    40006: "默认回复地址reply_to格式不正确",
+    40007: "余额不足或账号被禁用",
+    40008: "data格式错误",
+    40009: "不支持的文件类型或附件大小不能超过1MB"
+}
+
+def validate_email(email):
+    """简单的邮箱格式验证"""
+    return "@" in email and "." in email
+
+def validate_file(file_path):
+    """验证文件是否存在、大小不超过1MB且类型受支持"""
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"文件不存在: {file_path}")
+
+    if os.path.getsize(file_path) > 1024 * 1024:
+        raise ValueError("附件大小不能超过1MB")
+
+    file_extension = os.path.splitext(file_path)[1][1:].lower()
+    if file_extension not in SUPPORTED_FILE_TYPES:
+        raise ValueError(f"不支持的文件类型: {file_extension}")
+
+    return True
+
+def describe_result(result):
+    """返回码对应的说明"""
+    return RESPONSE_CODES.get(result.get("code"), result.get("message", "未知错误"))
+
+class AoksendClient:
+    """复用HTTP会话的 Aoksend 客户端，可以被多个发送线程同时调用"""
+
+    def __init__(self, app_key, api_url=DEFAULT_API_URL, reply_to=None, alias=None,
+                 attachment=None, max_workers=DEFAULT_MAX_WORKERS, timeout=REQUEST_TIMEOUT):
+        """
+        Args:
+            app_key (str): API密钥
+            api_url (str): API地址，为空时使用默认地址
+            reply_to (str): 默认回复地址
+            alias (str): 发件人名称
+            attachment (str): 附件文件路径
+            max_workers (int): 同时发送的邮件数（发送队列的工作线程数），决定连接池大小
+            timeout (int): 单次请求超时时间（秒）
+        """
+        self.app_key = app_key
+        self.api_url = api_url.strip() if api_url and api_url.strip() else DEFAULT_API_URL
+        self.reply_to = reply_to or None
+        self.alias = alias or None
+        self.attachment = attachment or None
+        self.timeout = timeout
+
+        # 连接池大小与发送线程数一致，每个发送线程都能复用一条 keep-alive 连接
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+
+    def send_sync(self, to, template_id, data=None):
+        """
+        同步发送一封模板邮件
+
+        Args:
+            to (str): 收件人邮箱
+            template_id (str): 模板ID
+            data (dict): 模板数据
+
+        Returns:
+            dict: 接口返回结果，code 为 200 表示成功
+        """
+        if not to or not validate_email(to):
+            result = {"code": 40005, "message": RESPONSE_CODES[40005]}
+        else:
+            payload = {
+                'app_key': self.app_key,
+                'template_id': template_id,
+                'to': to
+            }
+            if self.reply_to:
+                payload['reply_to'] = self.reply_to
+            if self.alias:
+                payload['alias'] = self.alias
+            if data:
+                # 使用default=str来处理不能序列化的对象（Decimal、datetime等）
+                payload['data'] = json.dumps(data, ensure_ascii=False, default=str)
+
+            try:
+                if self.attachment:
+                    validate_file(self.attachment)
+                    with open(self.attachment, 'rb') as f:
+                        response = self.session.post(self.api_url, data=payload,
+                                                     files={'attachment': f}, timeout=self.timeout)
+                else:
+                    response = self.session.post(self.api_url, data=payload, timeout=self.timeout)
+                result = response.json()
+            except Exception as e:
+                result = {"code": 500, "message": f"请求失败: {str(e)}"}
+
+        with self.lock:
+            if result.get("code") == 200:
+                self.sent += 1
+            else:
+                self.failed += 1
+        return result
+
+    def stats(self):
+        """发送统计"""
+        with self.lock:
+            return {'sent': self.sent, 'failed': self.failed}
+
+    def close(self):
+        """关闭会话"""
+        self.session.close()
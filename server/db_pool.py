@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+数据库连接池，server.py、email_api.py 与 email_checker.py 共用
+
+连接按需创建：启动时不建立连接，取连接时没有空闲连接且未达到上限才新建一个，数据库慢或不可用时
+不会拖慢服务启动。空闲连接后进先出，最近用过的连接最先被取出，多余的连接长时间空闲。
+
+取连接和归还连接都不再访问数据库：只有空闲超过 validate_after 秒的连接在取出时 ping 一次（期间
+可能被数据库的 wait_timeout 或网络设备断开），建立超过 max_lifetime 秒的连接在取出时关闭重建。
+归还时只检查连接的套接字是否还在，查询中出现连接错误的连接由 connection() 直接丢弃。
+
+连接全部被占用时最多等待 timeout 秒，超时后临时新建一个池外连接（与原来的行为一致），归还时关闭。
+stats() 返回连接数、使用率、等待次数与累计等待时间等指标。
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+
+import pymysql
+
+from request_metrics import phase, render_gauges, log_debug, log_warn
+
+# 空闲超过该秒数的连接取出时先 ping 一次
+DEFAULT_VALIDATE_AFTER = 30
+
+# 连接建立超过该秒数后关闭重建
+DEFAULT_MAX_LIFETIME = 3600
+
+class ConnectionPool:
+    """按需创建、空闲时间检查、定期重建的连接池"""
+
+    def __init__(self, connect, max_size, timeout=2, validate_after=DEFAULT_VALIDATE_AFTER,
+                 max_lifetime=DEFAULT_MAX_LIFETIME):
+        """
+        Args:
+            connect (callable): 新建一个数据库连接的函数
+            max_size (int): 池内连接数上限
+            timeout (float): 连接全部被占用时的最长等待秒数
+            validate_after (float): 空闲超过该秒数的连接取出时 ping 一次
+            max_lifetime (float): 连接建立超过该秒数后关闭重建
+        """
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.validate_after = validate_after
+        self.max_lifetime = max_lifetime
+        self.cond = threading.Condition()
+        # 空闲连接栈 [(连接, 建立时间, 归还时间)]
+        self.idle = []
+        # 使用中的连接 {连接: (建立时间, 是否为池外连接)}
+        self.in_use = {}
+        # 池内已建立或正在建立的连接数（空闲加使用中，不含池外连接）
+        self.opened = 0
+        self.peak_in_use = 0
+        self.wait_seconds = 0.0
+        self.max_wait = 0.0
+        self.closed = False
+        self.counters = {
+            'acquires': 0,             # 取连接次数
+            'waits': 0,                # 需要等待其他请求归还连接的次数
+            'timeouts': 0,             # 等待超时、临时新建池外连接的次数
+            'created': 0,              # 新建连接数（含池外连接）
+            'connect_errors': 0,       # 新建连接失败次数
+            'validations': 0,          # 空闲过久、取出时 ping 的次数
+            'validation_failures': 0,  # ping 失败、关闭重建的次数
+            'recycled': 0,             # 超过最长使用时间、关闭重建的次数
+            'discarded': 0             # 归还时连接已断开或查询出错而丢弃的次数
+        }
+
+    def _create(self):
+        """新建一个连接，失败时抛出异常"""
+        try:
+            conn = self.connect()
+        except Exception:
+            with self.cond:
+                self.counters['connect_errors'] += 1
+            raise
+        with self.cond:
+            self.counters['created'] += 1
+        return conn
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _forget(self):
+        """池内连接关闭或建立失败后释放名额"""
+        with self.cond:
+            self.opened -= 1
+            self.cond.notify()
+
+    def acquire(self, timeout=None):
+        """
+        取出一个连接，用完后必须调用 release 归还
+
+        Args:
+            timeout (float): 最长等待秒数，为 None 时使用连接池的默认值
+
+        Returns:
+            连接对象，新建连接失败时抛出异常
+        """
+        timeout = self.timeout if timeout is None else timeout
+        overflow = False
+        conn = None
+        last_used = None
+        with phase('pool_acquire'):
+            start = time.monotonic()
+            with self.cond:
+                self.counters['acquires'] += 1
+                waited = False
+                while True:
+                    if self.idle:
+                        conn, created, last_used = self.idle.pop()
+                        break
+                    if self.opened < self.max_size:
+                        # 先占用名额，在锁外建立连接
+                        self.opened += 1
+                        break
+                    remaining = start + timeout - time.monotonic()
+                    if remaining <= 0 or self.closed:
+                        self.counters['timeouts'] += 1
+                        overflow = True
+                        break
+                    waited = True
+                    self.cond.wait(remaining)
+                if waited:
+                    wait = time.monotonic() - start
+                    self.counters['waits'] += 1
+                    self.wait_seconds += wait
+                    self.max_wait = max(self.max_wait, wait)
+
+            if overflow:
+                log_warn(f"连接池 {self.max_size} 个连接全部被占用，等待 {timeout} 秒超时，临时新建连接")
+                conn = self._create()
+                created = time.monotonic()
+            elif conn is None:
+                try:
+                    conn = self._create()
+                except Exception:
+                    self._forget()
+                    raise
+                created = time.monotonic()
+                log_debug("连接池新建连接，当前 %s 个", self.opened)
+
+        if not overflow:
+            conn, created = self._check(conn, created, last_used)
+
+        with self.cond:
+            self.in_use[conn] = (created, overflow)
+            pooled = len(self.in_use) - sum(1 for _, is_overflow in self.in_use.values() if is_overflow)
+            self.peak_in_use = max(self.peak_in_use, pooled)
+        return conn
+
+    def _check(self, conn, created, last_used):
+        """
+        取出的空闲连接超过最长使用时间时重建，空闲过久时 ping 一次，失败则重建；新建的连接（last_used 为 None）不检查
+
+        Returns:
+            tuple: (可用的连接, 建立时间)
+        """
+        if last_used is None:
+            return conn, created
+        now = time.monotonic()
+        if now - created > self.max_lifetime:
+            with self.cond:
+                self.counters['recycled'] += 1
+            log_debug("连接已使用 %.0f 秒，关闭重建", now - created)
+        elif now - last_used > self.validate_after:
+            with self.cond:
+                self.counters['validations'] += 1
+            try:
+                with phase('ping'):
+                    conn.ping(reconnect=False)
+                return conn, created
+            except Exception as e:
+                with self.cond:
+                    self.counters['validation_failures'] += 1
+                log_warn(f"空闲连接已失效，创建新连接: {str(e)}")
+        else:
+            return conn, created
+
+        self._close(conn)
+        try:
+            with phase('pool_acquire'):
+                conn = self._create()
+        except Exception:
+            self._forget()
+            raise
+        return conn, time.monotonic()
+
+    def release(self, conn, discard=False):
+        """
+        归还连接
+
+        Args:
+            conn: acquire 取出的连接，为 None 时忽略
+            discard (bool): 为 True 时关闭连接而不放回连接池（查询中出现连接错误时）
+        """
+        if conn is None:
+            return
+        with self.cond:
+            info = self.in_use.pop(conn, None)
+        if info is None:
+            # 不是从连接池取出的连接
+            self._close(conn)
+            return
+        created, overflow = info
+        if overflow:
+            self._close(conn)
+            return
+        if discard or self.closed or not getattr(conn, 'open', True):
+            self._close(conn)
+            with self.cond:
+                self.counters['discarded'] += 1
+            self._forget()
+            return
+        with self.cond:
+            self.idle.append((conn, created, time.monotonic()))
+            self.cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """取出连接的上下文管理器，查询中出现连接错误时丢弃该连接"""
+        conn = self.acquire(timeout)
+        discard = False
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard)
+
+    def close(self):
+        """关闭所有空闲连接，使用中的连接归还时关闭"""
+        with self.cond:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.opened -= len(idle)
+            self.cond.notify_all()
+        for conn, _, _ in idle:
+            self._close(conn)
+
+    def stats(self):
+        """
+        连接池指标
+
+        Returns:
+            dict: 连接数、使用率、等待统计和各计数器
+        """
+        with self.cond:
+            overflow = sum(1 for _, is_overflow in self.in_use.values() if is_overflow)
+            in_use = len(self.in_use) - overflow
+            return {
+                'max_size': self.max_size,
+                'open': self.opened,
+                'idle': len(self.idle),
+                'in_use': in_use,
+                'overflow_in_use': overflow,
+                'peak_in_use': self.peak_in_use,
+                'utilization': round(in_use / self.max_size, 4) if self.max_size else 0,
+                'wait_seconds_total': round(self.wait_seconds, 6),
+                'max_wait_ms': round(self.max_wait * 1000, 1),
+                'counters': dict(self.counters)
+            }
+
+    def metric_lines(self):
+        """
+        Prometheus 文本格式的连接池指标
+
+        Returns:
+            list: 文本行
+        """
+        stats = self.stats()
+        lines = []
+        for name, help_text in (('max_size', '连接池连接数上限'), ('open', '池内已建立的连接数'),
+                                ('idle', '空闲连接数'), ('in_use', '使用中的池内连接数'),
+                                ('overflow_in_use', '使用中的池外临时连接数'), ('peak_in_use', '使用中连接数的峰值'),
+                                ('utilization', '使用中连接数占上限的比例')):
+            lines += render_gauges(f'db_pool_{name}', help_text, [((), stats[name])])
+        lines += render_gauges('db_pool_wait_seconds_total', '等待其他请求归还连接的累计秒数',
+                               [((), stats['wait_seconds_total'])], metric_type='counter')
+        lines += render_gauges('db_pool_events_total', '连接池计数',
+                               [((('event', name),), value) for name, value in sorted(stats['counters'].items())],
+                               metric_type='counter')
+        return lines
+
+def create_pool(config, connect, default_size, default_timeout):
+    """
+    按配置文件 [mysql] 段创建连接池
+
+    Args:
+        config (ConfigParser): 服务的配置
+        connect (callable): 新建一个数据库连接的函数
+        default_size (int): connection_pool_size 的默认值
+        default_timeout (float): pool_timeout 的默认值
+
+    Returns:
+        ConnectionPool: 连接池
+    """
+    return ConnectionPool(
+        connect,
+        config.getint('mysql', 'connection_pool_size', fallback=default_size),
+        timeout=config.getfloat('mysql', 'pool_timeout', fallback=default_timeout),
+        validate_after=config.getfloat('mysql', 'pool_validate_after', fallback=DEFAULT_VALIDATE_AFTER),
+        max_lifetime=config.getfloat('mysql', 'pool_max_lifetime', fallback=DEFAULT_MAX_LIFETIME)
+    )
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+设备搜索的内存倒排索引
+
+按设备名称和安装位置的相邻两个字符（bigram）建立倒排表，适合“7栋”“301”这类楼栋、房间名。
+查询时取关键词中文档数最少的一个 bigram 的倒排表作为候选，再逐个确认关键词确实是名称或
+位置的子串，结果与 LIKE '%关键词%' 一致（不区分大小写）。建索引时设备按名称加位置的长度和
+设备ID预先排好序，倒排表天然有序，查询时只需按匹配档次分桶，不必对结果排序。
+
+输入联想使用安装位置的有序数组：位置规范化（全角转半角、统一大小写、去掉空白）后去重排序，
+前缀查询用二分查找定位第一个匹配项再顺序取前 k 个，耗时 O(log n + k)。字典序下“7栋3楼”
+排在“7栋3楼301”之前，上级位置先于下级位置出现。
+
+索引建好后只读，重建时整体替换。
+"""
+
+import re
+import bisect
+import unicodedata
+
+# 每页默认返回的设备数
+DEFAULT_PAGE_SIZE = 50
+
+# 输入联想默认返回的位置数
+DEFAULT_SUGGEST_LIMIT = 10
+
+def normalize(text):
+    """统一大小写，与数据库的 _ci 排序规则一致"""
+    return (text or '').lower()
+
+def suggest_key(text):
+    """输入联想用的规范化：全角转半角、统一大小写、去掉空白，“７栋 3”与“7栋3”相同"""
+    return re.sub(r'\s+', '', unicodedata.normalize('NFKC', text or '').lower())
+
+def bigrams(text):
+    """返回字符串中所有相邻两个字符组成的集合"""
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+class DeviceIndex:
+    """设备名称和安装位置的 bigram 倒排索引"""
+
+    def __init__(self, rows):
+        """
+        Args:
+            rows (iterable): (设备ID, 设备名称, 安装位置, 设备类型, 状态) 元组
+        """
+        # 同一匹配档次内名称和位置越短越靠前，再按设备ID排序保证分页稳定
+        docs = sorted(
+            ((normalize(row[1]), normalize(row[2]), row) for row in rows),
+            key=lambda doc: (len(doc[0]) + len(doc[1]), str(doc[2][0]))
+        )
+        self.names = [doc[0] for doc in docs]
+        self.sites = [doc[1] for doc in docs]
+        self.rows = [doc[2] for doc in docs]
+        self.postings = {}
+        postings = self.postings
+        for doc, (name, site, _) in enumerate(docs):
+            # 名称和位置分别切分，不产生跨字段的 bigram
+            for gram in bigrams(name) | bigrams(site):
+                posting = postings.get(gram)
+                if posting is None:
+                    postings[gram] = [doc]
+                else:
+                    posting.append(doc)
+        
+        # 输入联想：规范化后的位置有序数组，以及对应的 (显示用的位置, 设备数)
+        sites = {}
+        for row in self.rows:
+            key = suggest_key(row[2])
+            if not key:
+                continue
+            entry = sites.get(key)
+            if entry is None:
+                sites[key] = [row[2].strip(), 1]
+            else:
+                entry[1] += 1
+        self.site_keys = sorted(sites)
+        self.site_entries = [tuple(sites[key]) for key in self.site_keys]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def candidates(self, keyword):
+        """关键词中文档数最少的 bigram 的倒排表，关键词不足两个字符时为全部设备"""
+        grams = bigrams(keyword)
+        if not grams:
+            return range(len(self.rows))
+        postings = [self.postings.get(gram) for gram in grams]
+        if any(posting is None for posting in postings):
+            return []
+        return min(postings, key=len)
+
+    def search(self, keyword, offset=0, limit=DEFAULT_PAGE_SIZE):
+        """
+        搜索名称或位置包含关键词的设备
+
+        Args:
+            keyword (str): 关键词
+            offset (int): 跳过的结果数
+            limit (int): 最多返回的结果数
+
+        Returns:
+            tuple: (匹配的设备总数, 本页的设备行列表)
+        """
+        keyword = normalize(keyword)
+        names = self.names
+        sites = self.sites
+        # 匹配档次：名称完全相同、名称以关键词开头、位置完全相同、位置以关键词开头、名称包含、位置包含
+        tiers = ([], [], [], [], [], [])
+        for doc in self.candidates(keyword):
+            name = names[doc]
+            if keyword in name:
+                if name.startswith(keyword):
+                    tiers[0 if name == keyword else 1].append(doc)
+                else:
+                    site = sites[doc]
+                    if site.startswith(keyword):
+                        tiers[2 if site == keyword else 3].append(doc)
+                    else:
+                        tiers[4].append(doc)
+            else:
+                site = sites[doc]
+                if keyword in site:
+                    if site.startswith(keyword):
+                        tiers[2 if site == keyword else 3].append(doc)
+                    else:
+                        tiers[5].append(doc)
+        # 候选按文档编号递增，各档次内已经是预排好的顺序
+        total = sum(len(tier) for tier in tiers)
+        page = []
+        for tier in tiers:
+            if offset >= len(tier):
+                offset -= len(tier)
+                continue
+            page.extend(tier[offset:offset + limit - len(page)])
+            offset = 0
+            if len(page) >= limit:
+                break
+        rows = self.rows
+        return total, [rows[doc] for doc in page]
+
+    def suggest(self, prefix, limit=DEFAULT_SUGGEST_LIMIT):
+        """
+        安装位置的前缀联想
+
+        Args:
+            prefix (str): 用户已输入的前缀
+            limit (int): 最多返回的位置数
+
+        Returns:
+            tuple: (是否还有更多匹配, [(位置, 设备数)])，按规范化后的字典序排列
+        """
+        prefix = suggest_key(prefix)
+        if not prefix:
+            return False, []
+        keys = self.site_keys
+        start = bisect.bisect_left(keys, prefix)
+        end = start
+        # 最多多看一项，用来判断是否还有更多匹配
+        while end < len(keys) and end - start <= limit and keys[end].startswith(prefix):
+            end += 1
+        more = end - start > limit
+        return more, self.site_entries[start:min(end, start + limit)]
@@ -9,16 +9,17 @@ import uuid
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 from datetime import datetime, timedelta
-import sys
 import os
 import traceback
-import time
-from concurrent.futures import ThreadPoolExecutor
 import atexit
-from queue import Queue
-import threading
 from decimal import Decimal
 
+from aoksend_client import AoksendClient
+from email_outbox import EmailOutbox, make_idempotency_key
+from db_pool import create_pool
+from request_metrics import (TimedCursor, phase, start_request, finish_request, render_prometheus, render_gauges,
+                             set_log_level, log_debug, log_info, log_warn, log_error)
+
 # 读取配置文件
 config = configparser.ConfigParser()
 config.read(os.path.join(os.path.dirname(__file__), 'email_api.ini'))
@@ -46,175 +47,80 @@ NEW_CELEBRATE_DEVICE_CHECK_TIME_FIELD = config.get('aoksender', 'new_celebrate_d
 NEW_CELEBRATE_DEVICE_STATU_FIELD = config.get('aoksender', 'new_celebrate_device_statu', fallback='equipmentStatus')
 NEW_CELEBRATE_DEVICE_LATEST_READ_FIELD = config.get('aoksender', 'new_celebrate_device_latest_read', fallback='equipmentLatestLarge')
 
-# 创建线程池
-executor = ThreadPoolExecutor(max_workers=10)
-
-# 连接池设置
-CONNECTION_POOL_SIZE = int(config.get('mysql', 'connection_pool_size', fallback=30))
-connection_pool = Queue(maxsize=CONNECTION_POOL_SIZE)
-connection_lock = threading.Lock()
-
-# 创建初始连接池
-def create_connection_pool():
-    print(f"[INFO] 初始化数据库连接池，大小: {CONNECTION_POOL_SIZE}")
-    for _ in range(CONNECTION_POOL_SIZE):
-        try:
-            conn = pymysql.connect(
-                host=DB_HOST,
-                port=DB_PORT,
-                user=DB_USER,
-                password=DB_PASSWORD,
-                database=DB_NAME,
-                charset='utf8mb4',
-                connect_timeout=30,
-                read_timeout=30,
-                write_timeout=30,
-                autocommit=True,
-                init_command='SET SESSION sql_mode = "STRICT_TRANS_TABLES,NO_ZERO_DATE,NO_ZERO_IN_DATE,ERROR_FOR_DIVISION_BY_ZERO"'
-            )
-            # 验证连接是否有效
-            cursor = conn.cursor()
-            cursor.execute('SELECT 1')
-            cursor.fetchone()
-            cursor.close()
-            connection_pool.put(conn)
-        except Exception as e:
-            print(f"[ERROR] 创建连接池失败: {str(e)}")
-            traceback.print_exc()
+# Aoksend发送客户端：复用HTTP会话，由发送队列的工作线程调用
+aoksend = AoksendClient(
+    app_key=config.get('aoksender', 'app_key'),
+    api_url=config.get('aoksender', 'server', fallback=''),
+    reply_to=config.get('aoksender', 'reply_to', fallback=None),
+    alias=config.get('aoksender', 'alias', fallback='新毛云'),
+    attachment=config.get('aoksender', 'attachment', fallback=None),
+    max_workers=config.getint('aoksender', 'send_concurrency', fallback=4)
+)
+atexit.register(aoksend.close)
+
+# 日志级别：DEBUG 输出连接池和请求的处理过程，INFO 每个请求只输出一行耗时汇总
+set_log_level(config.get('log', 'level', fallback='INFO'))
+
+# 分别统计耗时的接口（请求体中的 mode），其他请求计入 other
+ENDPOINTS = ('reg', 'enter_code', 'change_code', 'enter_change')
+
+# 新建数据库连接
+def create_db_connection():
+    return pymysql.connect(
+        host=DB_HOST,
+        port=DB_PORT,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        database=DB_NAME,
+        charset='utf8mb4',
+        connect_timeout=10,
+        read_timeout=30,
+        write_timeout=30,
+        autocommit=True,
+        cursorclass=TimedCursor,
+        init_command='SET SESSION sql_mode = "STRICT_TRANS_TABLES,NO_ZERO_DATE,NO_ZERO_IN_DATE,ERROR_FOR_DIVISION_BY_ZERO"'
+    )
+
+# 连接池：按需建立连接，启动时不连接数据库
+db_pool = create_pool(config, create_db_connection, default_size=30, default_timeout=2)
+CONNECTION_POOL_SIZE = db_pool.max_size
 
 # 关闭所有连接
 def close_all_connections():
-    print("[INFO] 关闭所有数据库连接")
-    with connection_lock:
-        while not connection_pool.empty():
-            try:
-                conn = connection_pool.get_nowait()
-                if conn:
-                    conn.close()
-            except:
-                pass
+    log_info("关闭所有数据库连接")
+    db_pool.close()
 
 # 注册退出处理
 atexit.register(close_all_connections)
 
-# 初始化连接池
-create_connection_pool()
-
 # 数据库连接函数（使用连接池）
 def get_db_connection():
-    # 获取连接池中的连接
     try:
-        conn = connection_pool.get(timeout=2)  # 减少超时时间到2秒
-        print("[INFO] 从连接池获取数据库连接")
-        # 检查连接是否有效
-        try:
-            # 使用更严格的连接验证方法
-            if not conn.open:
-                print("[WARN] 连接已关闭，创建新连接")
-                conn = pymysql.connect(
-                    host=DB_HOST,
-                    port=DB_PORT,
-                    user=DB_USER,
-                    password=DB_PASSWORD,
-                    database=DB_NAME,
-                    charset='utf8mb4',
-                    connect_timeout=10,
-                    read_timeout=30,
-                    write_timeout=30,
-                    autocommit=True,
-                    init_command='SET SESSION sql_mode = "STRICT_TRANS_TABLES,NO_ZERO_DATE,NO_ZERO_IN_DATE,ERROR_FOR_DIVISION_BY_ZERO"'
-                )
-            else:
-                # 发送简单查询测试连接是否有效
-                cursor = conn.cursor()
-                cursor.execute('SELECT 1')
-                cursor.fetchone()
-                cursor.close()
-        except (pymysql.OperationalError, pymysql.InterfaceError, AttributeError) as e:
-            print(f"[WARN] 连接已失效，创建新连接: {str(e)}")
-            # 连接失效，关闭旧连接并创建新连接
-            try:
-                conn.close()
-            except:
-                pass
-            conn = pymysql.connect(
-                host=DB_HOST,
-                port=DB_PORT,
-                user=DB_USER,
-                password=DB_PASSWORD,
-                database=DB_NAME,
-                charset='utf8mb4',
-                connect_timeout=10,
-                read_timeout=30,
-                write_timeout=30,
-                autocommit=True,
-                init_command='SET SESSION sql_mode = "STRICT_TRANS_TABLES,NO_ZERO_DATE,NO_ZERO_IN_DATE,ERROR_FOR_DIVISION_BY_ZERO"'
-            )
-        return conn
-    except:
-        print("[WARN] 连接池获取连接超时或连接无效，创建新连接")
-        # 如果无法从连接池获取连接，创建新连接
-        try:
-            return pymysql.connect(
-                host=DB_HOST,
-                port=DB_PORT,
-                user=DB_USER,
-                password=DB_PASSWORD,
-                database=DB_NAME,
-                charset='utf8mb4',
-                connect_timeout=10,
-                read_timeout=30,
-                write_timeout=30,
-                autocommit=True,
-                init_command='SET SESSION sql_mode = "STRICT_TRANS_TABLES,NO_ZERO_DATE,NO_ZERO_IN_DATE,ERROR_FOR_DIVISION_BY_ZERO"'
-            )
-        except Exception as e:
-            print(f"[ERROR] 创建新连接失败: {str(e)}")
-            traceback.print_exc()
-            return None
+        return db_pool.acquire()
+    except Exception as e:
+        log_error(f"获取数据库连接失败: {str(e)}")
+        traceback.print_exc()
+        return None
 
 # 释放数据库连接
 def release_db_connection(conn):
-    if conn is None:
-        return
-    try:
-        # 检查连接是否有效
-        if conn.open:
-            # 发送简单查询测试连接是否有效
-            cursor = conn.cursor()
-            cursor.execute('SELECT 1')
-            cursor.fetchone()
-            cursor.close()
-            # 将连接放回连接池
-            if not connection_pool.full():
-                connection_pool.put_nowait(conn)
-                print("[INFO] 数据库连接已返回连接池")
-            else:
-                # 如果连接池已满，关闭连接
-                conn.close()
-                print("[INFO] 连接池已满，直接关闭连接")
-        else:
-            print("[WARN] 连接已关闭，不再返回连接池")
-            try:
-                conn.close()
-            except:
-                pass
-    except (pymysql.OperationalError, pymysql.InterfaceError) as e:
-        print(f"[WARN] 连接无效，连接已关闭: {str(e)}")
-        try:
-            conn.close()
-        except:
-            pass
-    except Exception as e:
-        print(f"[WARN] 释放连接时发生未知错误: {str(e)}")
-        try:
-            conn.close()
-        except:
-            pass
+    db_pool.release(conn)
 
 # 保持向后兼容的别名
 connect_db = get_db_connection
 
+# 邮件发送队列：请求处理只把邮件写入 email_outbox 表，由后台工作线程发送并在失败时重试；
+# email_checker.py 共用同一张表，这里只认领本服务入队的邮件类型
+OUTBOX_KINDS = ("验证码", "解绑验证码", "注册庆祝")
+outbox = EmailOutbox(
+    get_db_connection,
+    release_db_connection,
+    aoksend,
+    workers=config.getint('aoksender', 'send_concurrency', fallback=4),
+    max_attempts=config.getint('aoksender', 'max_attempts', fallback=8),
+    kinds=OUTBOX_KINDS
+)
+
 def validate_email_format(email):
     """验证邮箱格式"""
     import re
@@ -248,7 +154,7 @@ def check_device_exists(device_id):
             else:
                 return False, None
     except Exception as e:
-        print(f"[ERROR] 检查设备存在性时出错: {str(e)}")
+        log_error(f"检查设备存在性时出错: {str(e)}")
         traceback.print_exc()
         return False, None
     finally:
@@ -272,7 +178,7 @@ def check_device_type_match(device_id, expected_type):
             actual_type = result[0]
             return actual_type == expected_type
     except Exception as e:
-        print(f"[ERROR] 检查设备类型匹配时出错: {str(e)}")
+        log_error(f"检查设备类型匹配时出错: {str(e)}")
         return False
     finally:
         release_db_connection(conn)
@@ -290,7 +196,7 @@ def count_email_records(email):
             result = cursor.fetchone()
             return result[0] if result else 0
     except Exception as e:
-        print(f"[ERROR] 统计邮箱记录数时出错: {str(e)}")
+        log_error(f"统计邮箱记录数时出错: {str(e)}")
         return -1
     finally:
         release_db_connection(conn)
@@ -308,63 +214,11 @@ def count_active_user_records(email, equipment_type):
             result = cursor.fetchone()
             return result[0] if result else 0
     except Exception as e:
-        print(f"[ERROR] 统计用户特定设备类型记录数时出错: {str(e)}")
+        log_error(f"统计用户特定设备类型记录数时出错: {str(e)}")
         return -1
     finally:
         release_db_connection(conn)
 
-# 使用内存字典存储每日邮件发送次数，格式为 {email: {date: count}}
-daily_email_counts = {}
-
-def count_emails_sent_today(email):
-    """统计用户今天发送的邮件数量"""
-    today = datetime.now().date().isoformat()
-    
-    # 检查是否是今天的新日期，如果是则清理旧日期
-    cleanup_old_dates()
-    
-    # 获取该邮箱今天的邮件发送次数
-    if email not in daily_email_counts:
-        daily_email_counts[email] = {}
-    
-    if today not in daily_email_counts[email]:
-        daily_email_counts[email][today] = 0
-    
-    return daily_email_counts[email][today]
-
-def cleanup_old_dates():
-    """清理过期的日期数据（保留最近3天的数据）"""
-    today = datetime.now().date()
-    cutoff_date = (today - timedelta(days=3)).isoformat()
-    
-    # 遍历所有邮箱的记录
-    for email in list(daily_email_counts.keys()):
-        # 删除超过3天的日期记录
-        for date_str in list(daily_email_counts[email].keys()):
-            if date_str < cutoff_date:
-                del daily_email_counts[email][date_str]
-        
-        # 如果邮箱没有有效记录，删除该邮箱
-        if not daily_email_counts[email]:
-            del daily_email_counts[email]
-
-def record_email_sent(email):
-    """记录邮件发送"""
-    today = datetime.now().date().isoformat()
-    
-    # 清理旧日期数据
-    cleanup_old_dates()
-    
-    # 增加该邮箱今天的邮件发送次数
-    if email not in daily_email_counts:
-        daily_email_counts[email] = {}
-    
-    if today not in daily_email_counts[email]:
-        daily_email_counts[email][today] = 0
-    
-    daily_email_counts[email][today] += 1
-    return True
-
 def check_verification_records(email, equipment_type):
     """检查用户特定设备类型的验证记录状态"""
     conn = get_db_connection()
@@ -378,7 +232,7 @@ def check_verification_records(email, equipment_type):
             results = cursor.fetchall()
             return results
     except Exception as e:
-        print(f"[ERROR] 检查验证记录状态时出错: {str(e)}")
+        log_error(f"检查验证记录状态时出错: {str(e)}")
         return None
     finally:
         release_db_connection(conn)
@@ -402,7 +256,7 @@ def check_active_subscription(email, device_id, equipment_type):
             result = cursor.fetchone()
             return result is not None
     except Exception as e:
-        print(f"[ERROR] 检查活跃订阅时出错: {str(e)}")
+        log_error(f"检查活跃订阅时出错: {str(e)}")
         return False
     finally:
         release_db_connection(conn)
@@ -442,7 +296,7 @@ def verify_change_code(email, device_id, equipment_type, change_code):
             else:
                 return {"code": 418, "error_text": "解绑验证码错误"}
     except Exception as e:
-        print(f"[ERROR] 验证解绑验证码时出错: {str(e)}")
+        log_error(f"验证解绑验证码时出错: {str(e)}")
         return {"code": 500, "error_text": "服务器内部错误"}
     finally:
         release_db_connection(conn)
@@ -497,7 +351,7 @@ def verify_code(email, code):
             # 所有活跃条目的验证码都不匹配
             return {"code": 418, "error_text": "验证码错误，请重新输入"}
     except Exception as e:
-        print(f"[ERROR] 验证验证码时出错: {str(e)}")
+        log_error(f"验证验证码时出错: {str(e)}")
         return {"code": 500, "error_text": "服务器内部错误"}
     finally:
         release_db_connection(conn)
@@ -520,7 +374,7 @@ def get_device_info(device_id):
                 }
             return None
     except Exception as e:
-        print(f"[ERROR] 获取设备信息时出错: {str(e)}")
+        log_error(f"获取设备信息时出错: {str(e)}")
         return None
     finally:
         release_db_connection(conn)
@@ -533,13 +387,11 @@ def get_latest_device_data(device_id):
     
     try:
         with conn.cursor() as cursor:
-            # 获取设备最新的数据记录
+            # 获取设备最新的数据记录（device_latest 由入库程序维护，按主键查询）
             sql = """
                 SELECT total_reading, remainingBalance, equipmentStatus, read_time
-                FROM data 
-                WHERE device_id = %s 
-                ORDER BY read_time DESC 
-                LIMIT 1
+                FROM device_latest 
+                WHERE device_id = %s
             """
             cursor.execute(sql, (str(device_id),))
             result = cursor.fetchone()
@@ -552,7 +404,7 @@ def get_latest_device_data(device_id):
                 }
             return None
     except Exception as e:
-        print(f"[ERROR] 获取设备最新数据时出错: {str(e)}")
+        log_error(f"获取设备最新数据时出错: {str(e)}")
         return None
     finally:
         release_db_connection(conn)
@@ -577,7 +429,7 @@ def check_unsubscribe_request_limit(email, device_id, equipment_type):
             result = cursor.fetchone()
             return result is not None
     except Exception as e:
-        print(f"[ERROR] 检查解绑请求时间限制时出错: {str(e)}")
+        log_error(f"检查解绑请求时间限制时出错: {str(e)}")
         return False
     finally:
         release_db_connection(conn)
@@ -617,7 +469,7 @@ def request_unsubscribe(email, device_id, equipment_type):
             
             email_sent = send_change_email(email, change_code, device_info)
             if not email_sent:
-                print(f"[WARNING] 解绑验证码邮件发送失败，但记录已更新: {email}")
+                log_warn(f"解绑验证码邮件发送失败，但记录已更新: {email}")
             
             # 更新记录的updated_time为当前时间
             sql = """UPDATE email 
@@ -631,81 +483,30 @@ def request_unsubscribe(email, device_id, equipment_type):
             cursor.execute(sql, (email, device_id, equipment_type))
             return cursor.rowcount > 0
     except Exception as e:
-        print(f"[ERROR] 请求解绑时出错: {str(e)}")
+        log_error(f"请求解绑时出错: {str(e)}")
         return False
     finally:
         release_db_connection(conn)
 
-def _send_email_via_aoksend(email, template_data, template_id, template_type):
-    """通过Aoksend发送邮件的通用函数"""
-    import subprocess
-    import json
+def _send_email_via_aoksend(email, template_data, template_id, template_type, idempotency_key):
+    """
+    通过Aoksend发送邮件的通用函数
     
-    # 检查邮件发送频率限制
-    emails_sent_today = count_emails_sent_today(email)
-    if emails_sent_today >= EMAIL_DAILY_LIMIT:
-        print(f"[WARN] 邮件发送频率超限，邮箱 {email} 今日已发送 {emails_sent_today} 封邮件")
-        return False
+    邮件写入发送队列后立即返回，由队列的工作线程发送，失败时按指数退避重试。同一幂等键的邮件只会发送一次。
+    当日发送上限在入队时按 email_outbox 表中该邮箱当日已入队的邮件数检查（与插入在同一事务中），
+    多个进程或同一时刻的多个请求也不会超过上限。
     
-    def _send_email():
-        try:
-            # 从配置文件读取Aoksend配置
-            config = configparser.ConfigParser()
-            config.read(os.path.join(os.path.dirname(__file__), 'email_api.ini'))
-            
-            aoksend_config = {
-                'api_url': config.get('aoksender', 'server', fallback='https://www.aoksend.com/index/api/send_email'),
-                'app_key': config.get('aoksender', 'app_key'),
-                'template_id': template_id,
-                'reply_to': config.get('aoksender', 'reply_to', fallback=None),
-                'alias': config.get('aoksender', 'alias', fallback='新毛云'),
-                'attachment': config.get('aoksender', 'attachment', fallback=None)
-            }
-            
-            if not aoksend_config['api_url'] or aoksend_config['api_url'].strip() == '':
-                aoksend_config['api_url'] = 'https://www.aoksend.com/index/api/send_email'
-            
-            # 构建命令行参数
-            cmd = [
-                sys.executable, 'aoksend-api-cli.py',
-                '--api-url', aoksend_config['api_url'],
-                '--app-key', aoksend_config['app_key'],
-                '--template-id', aoksend_config['template_id'],
-                '--to', email
-            ]
-            
-            if aoksend_config['reply_to']:
-                cmd.extend(['--reply-to', aoksend_config['reply_to']])
-            
-            if aoksend_config['alias']:
-                cmd.extend(['--alias', aoksend_config['alias']])
-            
-            cmd.extend(['--data', json.dumps(template_data, ensure_ascii=False, default=str)])
-            
-            if aoksend_config['attachment']:
-                cmd.extend(['--attachment', aoksend_config['attachment']])
-            
-            # 执行命令
-            result = subprocess.run(cmd, capture_output=True, text=True, cwd=os.path.dirname(__file__))
-            
-            if result.returncode == 0:
-                print(f"[INFO] {template_type}邮件发送成功到 {email}")
-                # 记录邮件发送
-                record_email_sent(email)
-                return True
-            else:
-                print(f"[ERROR] {template_type}邮件发送失败: {result.stderr}")
-                return False
-        except Exception as e:
-            print(f"[ERROR] 发送邮件时出错: {str(e)}")
-            return False
-    
-    # 使用线程池并发处理邮件发送
-    future = executor.submit(_send_email)
-    return future.result()
+    Returns:
+        bool: 是否已加入发送队列（超过当日发送上限或入队失败时返回False）
+    """
+    if not outbox.enqueue(idempotency_key, template_type, email, template_id, template_data,
+                          daily_limit=EMAIL_DAILY_LIMIT):
+        log_warn(f"{template_type}邮件未加入发送队列（超过当日发送上限或数据库出错）: {email}")
+        return False
+    return True
 
-def send_verification_email(email, verifi_code, device_info):
-    """发送验证码邮件"""
+def send_verification_email(email, verifi_code, device_info, record_uuid):
+    """发送验证码邮件，每条订阅记录（record_uuid）只发送一次"""
     # 从配置文件读取Aoksend配置
     config = configparser.ConfigParser()
     config.read(os.path.join(os.path.dirname(__file__), 'email_api.ini'))
@@ -726,10 +527,11 @@ def send_verification_email(email, verifi_code, device_info):
         'equipment_type': '电表' if device_info and device_info.get('equipmentType') == 0 else '水表'
     }
     
-    return _send_email_via_aoksend(email, template_data, aoksend_config['template_id'], "验证码")
+    return _send_email_via_aoksend(email, template_data, aoksend_config['template_id'], "验证码",
+                                   make_idempotency_key("验证码", record_uuid))
 
 def send_change_email(email, change_code, device_info):
-    """发送解绑验证码邮件"""
+    """发送解绑验证码邮件，每次解绑请求都发送一封（受当日发送上限限制）"""
     # 从配置文件读取Aoksend配置
     config = configparser.ConfigParser()
     config.read(os.path.join(os.path.dirname(__file__), 'email_api.ini'))
@@ -750,14 +552,15 @@ def send_change_email(email, change_code, device_info):
         'equipment_type': '电表' if device_info and device_info.get('equipmentType') == 0 else '水表'
     }
     
-    return _send_email_via_aoksend(email, template_data, aoksend_config['change_template_id'], "解绑验证码")
+    return _send_email_via_aoksend(email, template_data, aoksend_config['change_template_id'], "解绑验证码",
+                                   make_idempotency_key("解绑验证码", email, change_code, uuid.uuid4().hex))
 
 def send_celebration_email(email, device_id, device_info):
-    """发送注册庆祝邮件"""
+    """发送注册庆祝邮件，同一邮箱和设备每天只发送一次"""
     # 获取设备最新数据
     latest_data = get_latest_device_data(device_id)
     if not latest_data:
-        print(f"[WARNING] 无法获取设备 {device_id} 的最新数据")
+        log_warn(f"无法获取设备 {device_id} 的最新数据")
         latest_data = {
             'total_reading': 'N/A',
             'remainingBalance': 'N/A',
@@ -789,7 +592,8 @@ def send_celebration_email(email, device_id, device_info):
         aoksend_config['device_latest_read_field']: float(latest_data['total_reading']) if isinstance(latest_data['total_reading'], Decimal) else latest_data['total_reading']
     }
     
-    return _send_email_via_aoksend(email, template_data, aoksend_config['celebrate_template_id'], "注册庆祝")
+    return _send_email_via_aoksend(email, template_data, aoksend_config['celebrate_template_id'], "注册庆祝",
+                                   make_idempotency_key("注册庆祝", email, device_id, datetime.now().date()))
 
 def generate_change_code():
     """生成6位解绑验证码"""
@@ -823,14 +627,14 @@ def insert_email_record(email, device_id, equipment_type, alarm_num, ip_address)
             device_info = get_device_info(device_id)
             
             # 发送验证邮件
-            email_sent = send_verification_email(email, verifi_code, device_info)
+            email_sent = send_verification_email(email, verifi_code, device_info, uuid_value)
             
             if not email_sent:
-                print(f"[WARNING] 邮件发送失败，但记录已插入: {email}")
+                log_warn(f"邮件发送失败，但记录已插入: {email}")
             
             return True
     except Exception as e:
-        print(f"[ERROR] 插入邮箱记录时出错: {str(e)}")
+        log_error(f"插入邮箱记录时出错: {str(e)}")
         return False
     finally:
         release_db_connection(conn)
@@ -846,10 +650,73 @@ class RequestHandler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
         self.end_headers()
 
+    def log_message(self, format, *args):
+        """访问日志只在 DEBUG 级别输出，每个请求的汇总由 finish_request 输出"""
+        log_debug("%s - %s", self.address_string(), format % args)
+
+    def send_json(self, response_data):
+        """序列化并发送 JSON 响应，记录序列化和写响应的耗时"""
+        with phase('serialize'):
+            body = json.dumps(response_data, ensure_ascii=False).encode('utf-8')
+        with phase('write'):
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(body)
+        self.response_code = response_data.get('code', 'N/A')
+        self.response_bytes = len(body)
+
+    def metrics_text(self):
+        """Prometheus 文本格式的请求耗时指标、邮件发送队列指标和连接池指标"""
+        stats = outbox.metrics()
+        lines = render_gauges('email_outbox_depth', '发送队列中各状态的记录数',
+                              [((('status', name),), value) for name, value in sorted(stats['depth'].items())])
+        lines += render_gauges('email_outbox_events_total', '本进程的入队、发送、重试和死信次数',
+                               [((('event', name),), value) for name, value in sorted(stats['counters'].items())],
+                               metric_type='counter')
+        lines += render_gauges('email_outbox_sent_last_minute', '最近一分钟发送的邮件数',
+                               [((), stats['throughput_per_minute'])])
+        return render_prometheus(lines + db_pool.metric_lines())
+
+    def do_GET(self):
+        timer = start_request('metrics')
+        self.response_code = 404
+        self.response_bytes = 0
+        try:
+            params = parse_qs(urlparse(self.path).query)
+            if urlparse(self.path).path != '/metrics':
+                self.send_json({"code": 404, "error_text": "接口不存在"})
+            elif params.get('format', [None])[0] == 'json':
+                # 邮件发送队列和连接池指标
+                self.send_json({"code": 200, "outbox": outbox.metrics(), "pool": db_pool.stats()})
+            else:
+                # 请求耗时、邮件发送队列和连接池指标
+                body = self.metrics_text()
+                with phase('write'):
+                    self.send_response(200)
+                    self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+                    self.end_headers()
+                    self.wfile.write(body)
+                self.response_code = 200
+                self.response_bytes = len(body)
+        finally:
+            finish_request(timer, self.response_code, f"bytes={self.response_bytes}")
+
     def do_POST(self):
+        self.timer = start_request()
+        self.response_code = 'N/A'
+        self.response_bytes = 0
+        try:
+            self.handle_post()
+        finally:
+            # 每个请求输出一行耗时汇总，并计入 /metrics 的直方图
+            finish_request(self.timer, self.response_code, f"bytes={self.response_bytes}")
+
+    def handle_post(self):
         # 获取真实客户端IP
         real_ip = get_real_ip(self)
-        print(f"[INFO] 收到POST请求 from {real_ip}: {self.path}")
+        log_debug("收到POST请求 from %s: %s", real_ip, self.path)
         
         try:
             # 读取请求体
@@ -861,15 +728,12 @@ class RequestHandler(BaseHTTPRequestHandler):
                 data = json.loads(post_data)
             except json.JSONDecodeError:
                 response_data = {"code": 400, "error_text": "请求数据格式错误"}
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                self.send_json(response_data)
                 return
             
             # 获取参数
             mode = data.get('mode')
+            self.timer.endpoint = mode if mode in ENDPOINTS else 'other'
             email = str(data.get('email', '')) if data.get('email') is not None else ''
             equipment_type = int(data.get('equipment_type', -1)) if data.get('equipment_type') is not None else -1
             device_id = str(data.get('device_id', '')) if data.get('device_id') is not None else ''
@@ -879,29 +743,17 @@ class RequestHandler(BaseHTTPRequestHandler):
                 alarm_num = int(data.get('alarm_num', 20)) if data.get('alarm_num') is not None else 20
                 if alarm_num <= 0:
                     response_data = {"code": 400, "error_text": "预警值必须大于0"}
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                    self.send_json(response_data)
                     return
             except (ValueError, TypeError):
                 response_data = {"code": 400, "error_text": "预警值必须是有效的整数"}
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                self.send_json(response_data)
                 return
             
             # 验证必需参数
             if not mode:
                 response_data = {"code": 400, "error_text": "缺少必需参数mode"}
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                self.send_json(response_data)
                 return
             
             # 处理不同的模式
@@ -910,64 +762,40 @@ class RequestHandler(BaseHTTPRequestHandler):
                 # 验证邮箱格式
                 if not validate_email_format(email):
                     response_data = {"code": 400, "error_text": "邮箱格式不正确"}
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                    self.send_json(response_data)
                     return
                 
                 # 验证设备类型
                 if equipment_type not in [0, 1]:  # 0为电表，1为水表
                     response_data = {"code": 400, "error_text": "设备类型不正确"}
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                    self.send_json(response_data)
                     return
                 
                 # 验证设备是否存在
                 device_exists, actual_type = check_device_exists(device_id)
                 if not device_exists:
                     response_data = {"code": 403, "error_text": "设备不存在"}
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                    self.send_json(response_data)
                     return
                 
                 # 验证设备类型是否匹配
                 if actual_type != equipment_type:
                     response_data = {"code": 403, "error_text": "绑定的设备和类型不一致"}
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                    self.send_json(response_data)
                     return
                 
                 # 统计邮箱记录数量
                 email_count = count_email_records(email)
                 if email_count >= EMAIL_LIMIT:
                     response_data = {"code": 418, "error_text": "该账号使用次数超过限制，不予注册"}
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                    self.send_json(response_data)
                     return
                 
                 # 统计用户特定设备类型的记录数量
                 user_equipment_count = count_active_user_records(email, equipment_type)
                 if user_equipment_count < 0:
                     response_data = {"code": 500, "error_text": "服务器内部错误"}
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                    self.send_json(response_data)
                     return
                 
                 if user_equipment_count == 0:
@@ -1025,21 +853,13 @@ class RequestHandler(BaseHTTPRequestHandler):
                 # 验证必需参数
                 if not email or not code:
                     response_data = {"code": 400, "error_text": "缺少必需参数"}
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                    self.send_json(response_data)
                     return
                 
                 # 验证邮箱格式
                 if not validate_email_format(email):
                     response_data = {"code": 400, "error_text": "邮箱格式不正确"}
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                    self.send_json(response_data)
                     return
                 
                 # 处理验证码验证逻辑
@@ -1071,15 +891,11 @@ class RequestHandler(BaseHTTPRequestHandler):
                                     # 发送注册庆祝邮件
                                     send_celebration_email(email, device_id, device_info)
                         except Exception as e:
-                            print(f"[ERROR] 获取设备信息发送庆祝邮件时出错: {str(e)}")
+                            log_error(f"获取设备信息发送庆祝邮件时出错: {str(e)}")
                         finally:
                             release_db_connection(conn)
                 
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                self.send_json(response_data)
                 return
             elif mode == 'change_code':
                 # 解绑请求模式
@@ -1089,31 +905,19 @@ class RequestHandler(BaseHTTPRequestHandler):
                     equipment_type = int(data.get('equipment_type', -1)) if data.get('equipment_type') is not None else -1
                 except (ValueError, TypeError):
                     response_data = {"code": 400, "error_text": "设备类型必须是有效的整数"}
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                    self.send_json(response_data)
                     return
                 
                 # 验证必需参数
                 if not email or not device_id or equipment_type not in [0, 1]:
                     response_data = {"code": 400, "error_text": "缺少必需参数"}
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                    self.send_json(response_data)
                     return
                 
                 # 验证邮箱格式
                 if not validate_email_format(email):
                     response_data = {"code": 400, "error_text": "邮箱格式不正确"}
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                    self.send_json(response_data)
                     return
                 
                 # 检查用户是否有正在使用的订阅
@@ -1129,11 +933,7 @@ class RequestHandler(BaseHTTPRequestHandler):
                         request_unsubscribe(email, device_id, equipment_type)
                         response_data = {"code": 200, "set_client_mode": "wait_user_change"}
                 
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                self.send_json(response_data)
                 return
             elif mode == 'enter_change':
                 # 输入解绑验证码模式
@@ -1143,78 +943,54 @@ class RequestHandler(BaseHTTPRequestHandler):
                     equipment_type = int(data.get('equipment_type', -1)) if data.get('equipment_type') is not None else -1
                 except (ValueError, TypeError):
                     response_data = {"code": 400, "error_text": "设备类型必须是有效的整数"}
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                    self.send_json(response_data)
                     return
                 change_code = str(data.get('change_code', '')) if data.get('change_code') is not None else ''
                 
                 # 验证必需参数
                 if not email or not device_id or equipment_type not in [0, 1] or not change_code:
                     response_data = {"code": 400, "error_text": "缺少必需参数"}
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                    self.send_json(response_data)
                     return
                 
                 # 验证邮箱格式
                 if not validate_email_format(email):
                     response_data = {"code": 400, "error_text": "邮箱格式不正确"}
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                    self.send_json(response_data)
                     return
                 
                 # 验证解绑验证码
                 response_data = verify_change_code(email, device_id, equipment_type, change_code)
                 
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                self.send_json(response_data)
                 return
             else:
                 response_data = {"code": 400, "error_text": "未知的模式"}
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+                self.send_json(response_data)
                 return
             
             # 发送响应
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+            self.send_json(response_data)
             
         except Exception as e:
-            print(f"[ERROR] 处理请求时出错: {str(e)}")
+            log_error(f"处理请求时出错: {str(e)}")
             traceback.print_exc()
             response_data = {"code": 500, "error_text": "服务器内部错误"}
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(response_data, ensure_ascii=False).encode('utf-8'))
+            self.send_json(response_data)
 
 def main():
+    # 启动邮件发送队列的工作线程，退出时等待正在发送的邮件
+    outbox.start()
+    atexit.register(outbox.stop, 10)
+    
     server = HTTPServer(('', SERVER_PORT), RequestHandler)
-    print(f"[INFO] 邮箱API服务器启动，监听端口 {SERVER_PORT}")
-    print(f"[INFO] 邮箱限制: {EMAIL_LIMIT}")
-    print(f"[INFO] 邮箱每日发送限制: {EMAIL_DAILY_LIMIT}")
-    print(f"[INFO] 连接池大小: {CONNECTION_POOL_SIZE}")
-    print(f"[INFO] 线程池大小: 10")
-    print(f"[INFO] 数据库: {DB_HOST}:{DB_PORT}/{DB_NAME}")
-    print(f"[INFO] 服务器就绪，等待请求...")
+    log_info(f"邮箱API服务器启动，监听端口 {SERVER_PORT}")
+    log_info(f"邮箱限制: {EMAIL_LIMIT}")
+    log_info(f"邮箱每日发送限制: {EMAIL_DAILY_LIMIT}")
+    log_info(f"连接池大小: {CONNECTION_POOL_SIZE}")
+    log_info(f"邮件发送线程数: {outbox.workers}")
+    log_info(f"数据库: {DB_HOST}:{DB_PORT}/{DB_NAME}")
+    log_info(f"服务器就绪，等待请求...")
     server.serve_forever()
 
 if __name__ == '__main__':
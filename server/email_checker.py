@@ -1,27 +1,33 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import json
 import configparser
 import pymysql
 import time
-import subprocess
-import sys
 import os
 import traceback
 from datetime import datetime
-from queue import Queue
-import threading
-from concurrent.futures import ThreadPoolExecutor
 import atexit
 from decimal import Decimal
 
+from aoksend_client import AoksendClient
+from email_outbox import EmailOutbox, make_idempotency_key
+from db_pool import create_pool
+
 # 读取配置文件
 config = configparser.ConfigParser()
 config.read(os.path.join(os.path.dirname(__file__), 'email_checker.ini'))
 
 # 服务配置
 ROUND_TIME = int(config.get('service', 'round_time'))
+# 新读数事件的轮询间隔，单位为秒
+EVENT_POLL_INTERVAL = config.getfloat('service', 'event_poll_interval', fallback=5)
+# 每次读取的新读数事件数
+EVENT_BATCH_SIZE = 500
+
+# 预警状态配置：同一订阅两次预警的最短间隔（秒），以及余额回升到阈值以上多少才重新进入待触发状态
+ALERT_COOLDOWN = config.getint('alert', 'cooldown', fallback=86400)
+ALERT_REARM_MARGIN = config.getfloat('alert', 'rearm_margin', fallback=5)
 
 # MySQL配置
 DB_HOST = config.get('mysql', 'mysql_server')
@@ -46,330 +52,416 @@ CHECKER_DEVICE_CHECK_TIME_FIELD = config.get('email', 'checker_device_check_time
 CHECKER_DEVICE_STATU_FIELD = config.get('email', 'checker_device_statu', fallback='equipmentStatus')
 CHECKER_DEVICE_LATEST_READ_FIELD = config.get('email', 'checker_device_latest_read', fallback='equipmentLatestLarge')
 
-# 创建线程池
-executor = ThreadPoolExecutor(max_workers=10)
+# Aoksend发送客户端：复用HTTP会话，由发送队列的工作线程调用
+aoksend = AoksendClient(
+    app_key=AOKSEND_APP_KEY,
+    api_url=AOKSEND_API_URL,
+    reply_to=AOKSEND_REPLY_TO,
+    alias=AOKSEND_ALIAS,
+    attachment=AOKSEND_ATTACHMENT,
+    max_workers=config.getint('aoksender', 'send_concurrency', fallback=4)
+)
+atexit.register(aoksend.close)
 
-# 连接池设置
-CONNECTION_POOL_SIZE = 10
-connection_pool = Queue(maxsize=CONNECTION_POOL_SIZE)
-connection_lock = threading.Lock()
+# 新建数据库连接
+def create_db_connection():
+    return pymysql.connect(
+        host=DB_HOST,
+        port=DB_PORT,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        database=DB_NAME,
+        charset='utf8mb4',
+        connect_timeout=30,
+        read_timeout=30,
+        write_timeout=30,
+        autocommit=True,
+        init_command='SET SESSION sql_mode = "STRICT_TRANS_TABLES,NO_ZERO_DATE,NO_ZERO_IN_DATE,ERROR_FOR_DIVISION_BY_ZERO"'
+    )
 
-# 创建初始连接池
-def create_connection_pool():
-    print(f"[INFO] 初始化数据库连接池，大小: {CONNECTION_POOL_SIZE}")
-    for _ in range(CONNECTION_POOL_SIZE):
-        try:
-            conn = pymysql.connect(
-                host=DB_HOST,
-                port=DB_PORT,
-                user=DB_USER,
-                password=DB_PASSWORD,
-                database=DB_NAME,
-                charset='utf8mb4',
-                connect_timeout=30,
-                read_timeout=30,
-                write_timeout=30,
-                autocommit=True,
-                init_command='SET SESSION sql_mode = "STRICT_TRANS_TABLES,NO_ZERO_DATE,NO_ZERO_IN_DATE,ERROR_FOR_DIVISION_BY_ZERO"'
-            )
-            connection_pool.put(conn)
-        except Exception as e:
-            print(f"[ERROR] 创建连接池失败: {str(e)}")
-            traceback.print_exc()
+# 连接池：按需建立连接，启动时不连接数据库
+db_pool = create_pool(config, create_db_connection, default_size=10, default_timeout=10)
 
 # 关闭所有连接
 def close_all_connections():
     print("[INFO] 关闭所有数据库连接")
-    with connection_lock:
-        while not connection_pool.empty():
-            try:
-                conn = connection_pool.get_nowait()
-                conn.close()
-            except:
-                pass
+    db_pool.close()
 
 # 注册退出处理
 atexit.register(close_all_connections)
 
-# 初始化连接池
-create_connection_pool()
-
 # 数据库连接函数（使用连接池）
 def get_db_connection():
-    # 获取连接池中的连接
+    """获取数据库连接，失败时返回 None"""
     try:
-        conn = connection_pool.get(timeout=10)
-        print("[INFO] 从连接池获取数据库连接")
-        # 检查连接是否有效
-        try:
-            conn.ping(reconnect=True)
-        except Exception as e:
-            print(f"[WARN] 连接已失效，创建新连接: {str(e)}")
-            # 连接失效，创建新连接
-            conn = pymysql.connect(
-                host=DB_HOST,
-                port=DB_PORT,
-                user=DB_USER,
-                password=DB_PASSWORD,
-                database=DB_NAME,
-                charset='utf8mb4',
-                connect_timeout=30,
-                read_timeout=30,
-                write_timeout=30,
-                autocommit=True,
-                init_command='SET SESSION sql_mode = "STRICT_TRANS_TABLES,NO_ZERO_DATE,NO_ZERO_IN_DATE,ERROR_FOR_DIVISION_BY_ZERO"'
-            )
-        return conn
-    except:
-        print("[WARN] 连接池获取连接超时，创建新连接")
-        # 如果无法从连接池获取连接，创建新连接
-        try:
-            return pymysql.connect(
-                host=DB_HOST,
-                port=DB_PORT,
-                user=DB_USER,
-                password=DB_PASSWORD,
-                database=DB_NAME,
-                charset='utf8mb4',
-                connect_timeout=30,
-                read_timeout=30,
-                write_timeout=30,
-                autocommit=True,
-                init_command='SET SESSION sql_mode = "STRICT_TRANS_TABLES,NO_ZERO_DATE,NO_ZERO_IN_DATE,ERROR_FOR_DIVISION_BY_ZERO"'
-            )
-        except Exception as e:
-            print(f"[ERROR] 创建新连接失败: {str(e)}")
-            traceback.print_exc()
-            return None
+        return db_pool.acquire()
+    except Exception as e:
+        print(f"[ERROR] 数据库连接失败: {str(e)}")
+        return None
 
 # 释放数据库连接
 def release_db_connection(conn):
-    try:
-        # 检查连接是否有效
-        conn.ping(reconnect=True)
-        # 将连接放回连接池
-        if not connection_pool.full():
-            connection_pool.put(conn)
-        else:
-            # 如果连接池已满，关闭连接
-            conn.close()
-        print("[INFO] 数据库连接已返回连接池")
-    except Exception as e:
-        print(f"[WARN] 连接无效，连接已关闭: {str(e)}")
-        try:
-            conn.close()
-        except:
-            pass
+    db_pool.release(conn)
 
-def get_db_connection():
-    """获取数据库连接"""
+# 邮件发送队列：预警邮件写入 email_outbox 表，由后台工作线程发送并在失败时重试；
+# email_api.py 共用同一张表，这里只认领预警邮件
+OUTBOX_KINDS = ("预警",)
+outbox = EmailOutbox(
+    get_db_connection,
+    release_db_connection,
+    aoksend,
+    workers=config.getint('aoksender', 'send_concurrency', fallback=4),
+    max_attempts=config.getint('aoksender', 'max_attempts', fallback=8),
+    kinds=OUTBOX_KINDS
+)
+
+def device_filter(device_ids):
+    """
+    生成按设备过滤的SQL条件
+    
+    Args:
+        device_ids (list): 设备ID列表，为 None 时不过滤
+    
+    Returns:
+        tuple: (SQL条件, 参数列表)
+    """
+    if device_ids is None:
+        return "", []
+    return f"AND e.device_id IN ({', '.join(['%s'] * len(device_ids))})", list(device_ids)
+
+def rearm_recovered_subscriptions(device_ids=None):
+    """
+    余额回升的已预警订阅重新进入待触发状态
+    
+    只有余额回到预警阈值加 rearm_margin 以上（通常意味着已经充值）才重新进入待触发状态，
+    避免余额在阈值附近小幅波动时反复预警。
+    
+    Args:
+        device_ids (list): 只检查这些设备的订阅，为 None 时检查全部订阅
+    
+    Returns:
+        int: 重新进入待触发状态的订阅数，出错时返回 None
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+    
     try:
-        conn = pymysql.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            database=DB_NAME,
-            charset='utf8mb4',
-            connect_timeout=30,
-            read_timeout=30,
-            write_timeout=30,
-            autocommit=True,
-            init_command='SET SESSION sql_mode = "STRICT_TRANS_TABLES,NO_ZERO_DATE,NO_ZERO_IN_DATE,ERROR_FOR_DIVISION_BY_ZERO"'
-        )
-        return conn
+        with conn.cursor() as cursor:
+            device_sql, device_params = device_filter(device_ids)
+            sql = f"""
+                UPDATE email_alert_state s
+                JOIN email e ON e.id = s.subscription_id
+                JOIN device_latest l ON l.device_id = e.device_id
+                SET s.state = 0, s.rearmed_at = NOW()
+                WHERE s.state = 1
+                AND COALESCE(l.remainingBalance, 0) >= e.alarm_num + %s
+                {device_sql}
+            """
+            cursor.execute(sql, [ALERT_REARM_MARGIN] + device_params)
+            return cursor.rowcount
     except Exception as e:
-        print(f"[ERROR] 数据库连接失败: {str(e)}")
+        print(f"[ERROR] 更新预警状态时出错: {str(e)}")
+        traceback.print_exc()
         return None
+    finally:
+        release_db_connection(conn)
 
-def get_active_subscriptions():
-    """获取所有活跃的订阅用户"""
+def get_alert_candidates(device_ids=None):
+    """
+    获取需要发送预警的活跃订阅
+    
+    一条SQL把活跃订阅（已验证且未解绑且未过期）与 device_latest 中各设备的最新读数及
+    email_alert_state 中的预警状态关联，只返回余额低于预警阈值、处于待触发状态且距上次预警
+    超过冷却时间的订阅，已经预警过且尚未充值的订阅不会重复出现。
+    
+    Args:
+        device_ids (list): 只检查这些设备的订阅，为 None 时检查全部订阅
+    
+    Returns:
+        list: [(订阅信息字典, 最新读数字典)]，出错时返回 None
+    """
     conn = get_db_connection()
     if not conn:
-        return []
+        return None
     
     try:
         with conn.cursor() as cursor:
-            # 查询所有活跃的订阅用户（已验证且未解绑且未过期）
-            sql = """
-                SELECT e.email, e.device_id, e.alarm_num, e.equipment_type, d.equipmentName, d.installationSite
+            # 没有余额数据的设备按余额为0处理；没有状态记录的订阅视为待触发
+            device_sql, device_params = device_filter(device_ids)
+            sql = f"""
+                SELECT e.id, e.email, e.device_id, e.alarm_num, e.equipment_type, d.equipmentName, d.installationSite,
+                       l.total_reading, l.remainingBalance, l.equipmentStatus, l.read_time,
+                       COALESCE(s.alert_count, 0)
                 FROM email e
+                JOIN device_latest l ON l.device_id = e.device_id
                 LEFT JOIN device d ON e.device_id = d.id
+                LEFT JOIN email_alert_state s ON s.subscription_id = e.id
                 WHERE e.verifi_statu = 1 
                 AND e.change_device_statu = 0 
                 AND e.life_end_time > NOW()
+                AND COALESCE(l.remainingBalance, 0) < e.alarm_num
+                AND COALESCE(s.state, 0) = 0
+                AND (s.last_alert_at IS NULL OR s.last_alert_at <= NOW() - INTERVAL %s SECOND)
+                {device_sql}
             """
-            cursor.execute(sql)
+            cursor.execute(sql, [ALERT_COOLDOWN] + device_params)
             results = cursor.fetchall()
             
-            subscriptions = []
+            candidates = []
             for row in results:
-                subscriptions.append({
-                    'email': row[0],
-                    'device_id': row[1],
-                    'alarm_num': float(row[2]),
-                    'equipment_type': row[3],
-                    'equipment_name': row[4],
-                    'installation_site': row[5]
-                })
+                subscription = {
+                    'id': row[0],
+                    'email': row[1],
+                    'device_id': row[2],
+                    'alarm_num': float(row[3]),
+                    'equipment_type': row[4],
+                    'equipment_name': row[5],
+                    'installation_site': row[6],
+                    'alert_count': row[11]
+                }
+                latest_data = {
+                    'total_reading': float(row[7]) if row[7] is not None else None,
+                    'remainingBalance': float(row[8]) if row[8] is not None else 0.0,
+                    'equipmentStatus': row[9],
+                    'read_time': str(row[10]) if row[10] is not None else None
+                }
+                candidates.append((subscription, latest_data))
             
-            return subscriptions
+            return candidates
     except Exception as e:
-        print(f"[ERROR] 获取活跃订阅用户时出错: {str(e)}")
+        print(f"[ERROR] 获取预警订阅时出错: {str(e)}")
         traceback.print_exc()
-        return []
+        return None
     finally:
         release_db_connection(conn)
 
-def get_device_latest_data(device_id):
-    """获取设备最新的数据记录"""
+def mark_alerted(alerted):
+    """
+    记录已发送预警的订阅，进入已预警状态
+    
+    Args:
+        alerted (list): [(订阅信息字典, 最新读数字典)]，只包含已加入发送队列的订阅
+    
+    Returns:
+        bool: 是否记录成功
+    """
+    if not alerted:
+        return True
+    
     conn = get_db_connection()
     if not conn:
-        return None
+        return False
     
     try:
         with conn.cursor() as cursor:
-            # 获取设备最新的数据记录
             sql = """
-                SELECT total_reading, remainingBalance, equipmentStatus, read_time
-                FROM data 
-                WHERE device_id = %s 
-                ORDER BY read_time DESC 
-                LIMIT 1
+                INSERT INTO email_alert_state
+                (subscription_id, state, alert_count, last_alert_at, last_alert_balance, last_alert_read_time)
+                VALUES (%s, 1, 1, NOW(), %s, %s)
+                ON DUPLICATE KEY UPDATE
+                state = 1,
+                alert_count = alert_count + 1,
+                last_alert_at = NOW(),
+                last_alert_balance = VALUES(last_alert_balance),
+                last_alert_read_time = VALUES(last_alert_read_time)
             """
-            cursor.execute(sql, (str(device_id),))
-            result = cursor.fetchone()
-            if result:
-                return {
-                    'total_reading': float(result[0]) if result[0] is not None else None,
-                    'remainingBalance': float(result[1]) if result[1] is not None else 0.0,
-                    'equipmentStatus': result[2],
-                    'read_time': str(result[3]) if result[3] is not None else None
-                }
-            return None
+            cursor.executemany(sql, [
+                (subscription['id'], latest_data['remainingBalance'], latest_data['read_time'])
+                for subscription, latest_data in alerted
+            ])
+            return True
     except Exception as e:
-        print(f"[ERROR] 获取设备最新数据时出错: {str(e)}")
-        return None
+        print(f"[ERROR] 记录预警状态时出错: {str(e)}")
+        traceback.print_exc()
+        return False
     finally:
         release_db_connection(conn)
 
 def send_alert_email(email, device_info, latest_data, alarm_num):
-    """发送预警邮件"""
+    """
+    预警邮件加入发送队列
+    
+    幂等键由收件人、设备、读表时间和订阅的累计预警次数组成：同一条读数在同一轮预警中只会产生一封
+    预警邮件（入队后记录状态失败时重新入队会被去重）；订阅重新进入待触发状态后即使没有新读数，
+    累计预警次数已经增加，下一次预警也会发送。
+    
+    Returns:
+        bool: 是否已加入发送队列
+    """
+    # 构造模板数据，处理Decimal类型
+    template_data = {
+        CHECKER_TITLE_FIELD: '注意注意！设备数值低于预警阀值！',
+        CHECKER_DEVICE_NAME_FIELD: device_info.get('equipment_name', '未知设备'),
+        CHECKER_DEVICE_BALANCE_FIELD: float(latest_data['remainingBalance']) if isinstance(latest_data['remainingBalance'], Decimal) else latest_data['remainingBalance'],
+        CHECKER_DEVICE_CHECK_TIME_FIELD: latest_data['read_time'],
+        CHECKER_DEVICE_STATU_FIELD: latest_data['equipmentStatus'],
+        CHECKER_DEVICE_LATEST_READ_FIELD: float(latest_data['total_reading']) if latest_data['total_reading'] is not None and isinstance(latest_data['total_reading'], Decimal) else latest_data['total_reading']
+    }
+    
+    idempotency_key = make_idempotency_key("预警", email, device_info.get('device_id'), latest_data['read_time'],
+                                           device_info.get('alert_count', 0))
+    return outbox.enqueue(idempotency_key, "预警", email, CHECKER_TEMPLATE_ID, template_data)
+
+def fetch_reading_events(limit=EVENT_BATCH_SIZE):
+    """
+    读取最早的一批新读数事件
+    
+    Returns:
+        tuple: (本批事件ID列表, 涉及的设备ID列表)，没有事件或出错时均为空列表
+    """
+    conn = get_db_connection()
+    if not conn:
+        return [], []
+    
     try:
-        # 构造模板数据，处理Decimal类型
-        template_data = {
-            CHECKER_TITLE_FIELD: '注意注意！设备数值低于预警阀值！',
-            CHECKER_DEVICE_NAME_FIELD: device_info.get('equipment_name', '未知设备'),
-            CHECKER_DEVICE_BALANCE_FIELD: float(latest_data['remainingBalance']) if isinstance(latest_data['remainingBalance'], Decimal) else latest_data['remainingBalance'],
-            CHECKER_DEVICE_CHECK_TIME_FIELD: latest_data['read_time'],
-            CHECKER_DEVICE_STATU_FIELD: latest_data['equipmentStatus'],
-            CHECKER_DEVICE_LATEST_READ_FIELD: float(latest_data['total_reading']) if latest_data['total_reading'] is not None and isinstance(latest_data['total_reading'], Decimal) else latest_data['total_reading']
-        }
-        
-        # 构建命令行参数
-        cmd = [
-            sys.executable, 'aoksend-api-cli.py',
-            '--api-url', AOKSEND_API_URL,
-            '--app-key', AOKSEND_APP_KEY,
-            '--template-id', CHECKER_TEMPLATE_ID,
-            '--to', email
-        ]
-        
-        if AOKSEND_REPLY_TO:
-            cmd.extend(['--reply-to', AOKSEND_REPLY_TO])
-        
-        if AOKSEND_ALIAS:
-            cmd.extend(['--alias', AOKSEND_ALIAS])
-        
-        # 使用default=str来处理不能序列化的对象
-        cmd.extend(['--data', json.dumps(template_data, ensure_ascii=False, default=str)])
-        
-        if AOKSEND_ATTACHMENT:
-            cmd.extend(['--attachment', AOKSEND_ATTACHMENT])
-        
-        # 执行命令
-        result = subprocess.run(cmd, capture_output=True, text=True, cwd=os.path.dirname(__file__))
-        
-        if result.returncode == 0:
-            print(f"[INFO] 预警邮件发送成功到 {email}")
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT id, device_id FROM reading_event ORDER BY id LIMIT %s", (limit,))
+            rows = cursor.fetchall()
+            return [row[0] for row in rows], sorted({row[1] for row in rows})
+    except Exception as e:
+        print(f"[ERROR] 读取新读数事件时出错: {str(e)}")
+        traceback.print_exc()
+        return [], []
+    finally:
+        release_db_connection(conn)
+
+def delete_reading_events(event_ids):
+    """
+    删除已处理的新读数事件
+    
+    按读取到的事件ID逐个删除，不按最大ID删除：自增ID按插入顺序分配，但并行入库的事务提交顺序不定，
+    ID较小的事件可能在读取之后才提交，按最大ID删除会把它当作已处理删掉。
+    
+    Args:
+        event_ids (list): fetch_reading_events 返回的事件ID
+    """
+    conn = get_db_connection()
+    if not conn:
+        return False
+    
+    try:
+        with conn.cursor() as cursor:
+            placeholders = ', '.join(['%s'] * len(event_ids))
+            cursor.execute(f"DELETE FROM reading_event WHERE id IN ({placeholders})", event_ids)
             return True
-        else:
-            print(f"[ERROR] 预警邮件发送失败: {result.stderr}")
-            return False
     except Exception as e:
-        print(f"[ERROR] 发送预警邮件时出错: {str(e)}")
+        print(f"[ERROR] 删除已处理的新读数事件时出错: {str(e)}")
+        traceback.print_exc()
         return False
+    finally:
+        release_db_connection(conn)
+
+def alert_subscriptions(device_ids=None):
+    """
+    更新预警状态并把新跌破阈值的订阅的预警邮件加入发送队列
+    
+    Args:
+        device_ids (list): 只检查这些设备的订阅，为 None 时检查全部订阅
+    
+    Returns:
+        int: 本次加入发送队列的预警邮件数，任何一步出错时返回 None（调用方据此保留新读数事件）
+    """
+    # 发送队列的工作线程在第一次检查时启动（由 scheduler.py 在进程内调用时同样适用）
+    outbox.start()
+    
+    # 已预警的订阅在余额回升（充值）后重新进入待触发状态
+    rearmed_count = rearm_recovered_subscriptions(device_ids)
+    if rearmed_count is None:
+        return None
+    if rearmed_count:
+        print(f"[INFO] {rearmed_count} 个订阅余额已回升，重新进入待触发状态")
+    
+    # 一次查询得到新跌破预警阈值的订阅
+    candidates = get_alert_candidates(device_ids)
+    if candidates is None:
+        return None
+    print(f"[INFO] 找到 {len(candidates)} 个新跌破预警阈值的订阅")
+    
+    # 入队是唯一的单条操作，邮件由发送队列在后台发送
+    alerted = []
+    failed = False
+    for subscription, latest_data in candidates:
+        print(f"[ALERT] 设备 {subscription['device_id']} ({subscription['equipment_name']}) 余额 "
+              f"{latest_data['remainingBalance']} 低于预警阈值 {subscription['alarm_num']}，加入预警邮件发送队列")
+        if send_alert_email(subscription['email'], subscription, latest_data, subscription['alarm_num']):
+            alerted.append((subscription, latest_data))
+        else:
+            failed = True
+    
+    # 入队成功后才进入已预警状态；记录失败时下一轮会重新入队，由幂等键去重
+    if not mark_alerted(alerted):
+        failed = True
+    
+    metrics = outbox.metrics()
+    print(f"[INFO] 本次加入发送队列 {len(alerted)}/{len(candidates)} 封预警邮件，"
+          f"队列状态: {metrics['depth']}，最近一分钟发送 {metrics['throughput_per_minute']} 封，"
+          f"平均发送耗时 {metrics['send_latency_ms']['avg']} ms")
+    return None if failed else len(alerted)
 
 def check_and_alert():
-    """检查并发送预警邮件"""
+    """全量检查：检查所有活跃订阅并把预警邮件加入发送队列"""
     print(f"[INFO] 开始检查预警阈值，当前时间: {datetime.now()}")
-    
-    # 获取所有活跃订阅
-    subscriptions = get_active_subscriptions()
-    print(f"[INFO] 找到 {len(subscriptions)} 个活跃订阅")
-    
-    # 使用线程池并发处理多个用户
-    futures = []
-    for subscription in subscriptions:
-        future = executor.submit(process_subscription, subscription)
-        futures.append(future)
-    
-    # 等待所有任务完成
-    for future in futures:
-        try:
-            future.result()
-        except Exception as e:
-            print(f"[ERROR] 处理订阅时出错: {str(e)}")
-            traceback.print_exc()
+    alert_subscriptions()
 
-def process_subscription(subscription):
-    """处理单个订阅用户"""
-    email = subscription['email']
-    device_id = subscription['device_id']
-    alarm_num = subscription['alarm_num']
-    equipment_name = subscription['equipment_name']
-    
-    print(f"[INFO] 检查设备 {device_id} ({equipment_name}) 的数据")
-    
-    # 获取设备最新数据
-    latest_data = get_device_latest_data(device_id)
-    if not latest_data:
-        print(f"[WARNING] 无法获取设备 {device_id} 的最新数据")
-        return
-    
-    # 检查余额是否低于预警阈值
-    balance = latest_data['remainingBalance']
-    if balance < alarm_num:
-        print(f"[ALERT] 设备 {device_id} 余额 {balance} 低于预警阈值 {alarm_num}，发送预警邮件")
-        # 发送预警邮件
-        send_alert_email(email, subscription, latest_data, alarm_num)
-    else:
-        print(f"[INFO] 设备 {device_id} 余额 {balance} 高于预警阈值 {alarm_num}，无需预警")
+def process_reading_events():
+    """
+    事件驱动检查：只检查有新读数的设备的订阅
+    
+    data2sql.py 入库时为每台有新读数的设备写入 reading_event，这里按批读取事件，检查相关订阅后
+    删除已处理的事件。没有事件时只执行一次主键查询。检查中任何一步出错时保留本批事件，
+    下次轮询重新处理；检查后、删除前退出时事件同样会被再次处理，预警状态和发送队列的幂等键
+    保证不会重复发送。
+    
+    Returns:
+        int: 处理的事件涉及的设备数
+    """
+    device_count = 0
+    while True:
+        event_ids, device_ids = fetch_reading_events()
+        if not event_ids:
+            break
+        
+        print(f"[INFO] 收到 {len(device_ids)} 台设备的新读数事件，当前时间: {datetime.now()}")
+        if alert_subscriptions(device_ids) is None:
+            print(f"[WARN] 检查出错，保留本批 {len(event_ids)} 个新读数事件，下次轮询重新处理")
+            break
+        device_count += len(device_ids)
+        if not delete_reading_events(event_ids):
+            break
+    return device_count
 
 def main():
     """主函数"""
     print(f"[INFO] 邮件检查服务启动")
-    print(f"[INFO] 检查间隔: {ROUND_TIME} 秒")
+    print(f"[INFO] 全量检查间隔: {ROUND_TIME} 秒，新读数事件轮询间隔: {EVENT_POLL_INTERVAL:g} 秒")
+    print(f"[INFO] 预警冷却时间: {ALERT_COOLDOWN} 秒，重新触发需余额回升至阈值以上 {ALERT_REARM_MARGIN}")
     print(f"[INFO] 数据库: {DB_HOST}:{DB_PORT}/{DB_NAME}")
     print(f"[INFO] Aoksend API: {AOKSEND_API_URL}")
     print(f"[INFO] Aoksend Template ID: {CHECKER_TEMPLATE_ID}")
     
+    # 新读数由事件触发检查；全量检查按 round_time 兜底，覆盖新验证的订阅和冷却期结束的订阅
+    next_full_check = time.monotonic()
     try:
         while True:
             try:
-                check_and_alert()
-                print(f"[INFO] 等待 {ROUND_TIME} 秒后进行下一次检查...")
-                time.sleep(ROUND_TIME)
+                if time.monotonic() >= next_full_check:
+                    check_and_alert()
+                    next_full_check = time.monotonic() + ROUND_TIME
+                    print(f"[INFO] {ROUND_TIME} 秒后进行下一次全量检查，期间按新读数事件检查")
+                process_reading_events()
+                time.sleep(EVENT_POLL_INTERVAL)
             except KeyboardInterrupt:
                 print("[INFO] 收到中断信号，服务退出")
                 break
             except Exception as e:
                 print(f"[ERROR] 服务运行时出错: {str(e)}")
                 traceback.print_exc()
-                print(f"[INFO] 等待 {ROUND_TIME} 秒后重试...")
-                time.sleep(ROUND_TIME)
+                print(f"[INFO] 等待 {EVENT_POLL_INTERVAL:g} 秒后重试...")
+                time.sleep(EVENT_POLL_INTERVAL)
     finally:
-        # 程序退出时关闭所有连接
+        # 等待正在发送的邮件，然后关闭所有连接
+        outbox.stop(10)
         close_all_connections()
 
 if __name__ == '__main__':
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+持久化邮件发送队列
+
+请求处理和预警检查只把邮件写入 email_outbox 表（幂等键去重）就返回，由后台工作线程取出发送。
+工作线程用带认领令牌的 UPDATE 认领待发送记录，多个进程同时消费也不会重复发送；发送失败按
+指数退避重试，超过最大次数或遇到不可重试的错误（配置错误、收件人格式错误等）时进入死信状态。
+认领后长时间没有结果的记录（进程崩溃）在认领超时后会被重新认领。每条记录发送前换成新的认领令牌并
+刷新认领时间，认领超时只需覆盖单封邮件的发送；同一批中排在后面、已被其他进程重新认领的记录不再发送。
+email_api.py 和 email_checker.py 共用同一张表，各自只认领自己入队的邮件类型（kinds），发送成功后的
+统计和回调由入队的进程完成。入队时可以按收件人限制当日入队数，计数和插入在同一事务中完成。
+"""
+
+import json
+import time
+import uuid
+import random
+import hashlib
+import threading
+from collections import deque
+
+from aoksend_client import describe_result
+
+# 记录状态
+STATUS_PENDING = 0
+STATUS_SENDING = 1
+STATUS_SENT = 2
+STATUS_DEAD = 3
+
+STATUS_NAMES = {
+    STATUS_PENDING: 'pending',
+    STATUS_SENDING: 'sending',
+    STATUS_SENT: 'sent',
+    STATUS_DEAD: 'dead'
+}
+
+# 重试多少次后进入死信状态
+DEFAULT_MAX_ATTEMPTS = 8
+
+# 第一次重试的等待时间和最长等待时间，单位为秒
+DEFAULT_BASE_DELAY = 30
+DEFAULT_MAX_DELAY = 3600
+
+# 认领后超过该时间仍未完成的记录可以被重新认领，单位为秒
+DEFAULT_CLAIM_TIMEOUT = 300
+
+# 认领超时至少比单封邮件的发送超时（连接和读取各计一次）多出的秒数
+CLAIM_TIMEOUT_MARGIN = 30
+
+# 每次认领的记录数
+DEFAULT_BATCH_SIZE = 10
+
+# 队列为空时的轮询间隔，单位为秒；本进程入队时会立即唤醒工作线程
+DEFAULT_POLL_INTERVAL = 5
+
+# 重试也不会成功的Aoksend返回码（密钥、模板、收件人、数据格式、附件错误）
+NON_RETRYABLE_CODES = {40001, 40002, 40003, 40004, 40005, 40006, 40008, 40009}
+
+# 同一收件人并发入队时计数锁可能死锁，死锁后重试的次数
+ENQUEUE_DEADLOCK_RETRIES = 3
+MYSQL_DEADLOCK_ERROR = 1213
+
+# 发送耗时和吞吐量统计的窗口
+LATENCY_WINDOW = 1000
+THROUGHPUT_WINDOW = 60
+
+def make_idempotency_key(*parts):
+    """由邮件类型、收件人等组成部分生成幂等键"""
+    return hashlib.md5(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+class EmailOutbox:
+    """基于 email_outbox 表的邮件发送队列"""
+
+    def __init__(self, get_connection, release_connection, sender, workers=4,
+                 batch_size=DEFAULT_BATCH_SIZE, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 claim_timeout=DEFAULT_CLAIM_TIMEOUT, poll_interval=DEFAULT_POLL_INTERVAL, kinds=None):
+        """
+        Args:
+            get_connection (callable): 获取数据库连接（autocommit）的函数
+            release_connection (callable): 归还数据库连接的函数
+            sender (AoksendClient): 邮件发送客户端
+            workers (int): 工作线程数
+            batch_size (int): 每次认领的记录数
+            max_attempts (int): 最大发送次数
+            base_delay (int): 第一次重试前的等待时间（秒）
+            max_delay (int): 重试等待时间上限（秒）
+            claim_timeout (int): 认领超时时间（秒），不小于单封邮件发送超时的两倍加 CLAIM_TIMEOUT_MARGIN
+            poll_interval (float): 队列为空时的轮询间隔（秒）
+            kinds (tuple): 本进程认领、统计和限额计数的邮件类型，为 None 时不区分类型
+        """
+        self.get_connection = get_connection
+        self.release_connection = release_connection
+        self.sender = sender
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # 发送中的记录不能在本次发送结束前被重新认领，否则会发送两次
+        min_claim_timeout = getattr(sender, 'timeout', 0) * 2 + CLAIM_TIMEOUT_MARGIN
+        if claim_timeout < min_claim_timeout:
+            print(f"[WARN] 认领超时 {claim_timeout} 秒不足以覆盖一次发送，改为 {min_claim_timeout} 秒")
+            claim_timeout = min_claim_timeout
+        self.claim_timeout = claim_timeout
+        self.poll_interval = poll_interval
+        self.kinds = tuple(kinds) if kinds else None
+
+        self.wakeup = threading.Event()
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.start_lock = threading.Lock()
+
+        self.lock = threading.Lock()
+        self.counters = {'enqueued': 0, 'duplicates': 0, 'sent': 0, 'retried': 0, 'dead': 0}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.sent_times = deque()
+
+    def kind_filter(self):
+        """
+        生成按本进程邮件类型过滤的SQL条件
+
+        Returns:
+            tuple: (SQL条件, 参数列表)，不区分类型时为 ("", [])
+        """
+        if not self.kinds:
+            return "", []
+        return f"AND kind IN ({', '.join(['%s'] * len(self.kinds))})", list(self.kinds)
+
+    def enqueue(self, idempotency_key, kind, to_email, template_id, template_data, daily_limit=None):
+        """
+        邮件入队
+
+        Args:
+            idempotency_key (str): 幂等键（make_idempotency_key 的返回值），重复入队会被忽略
+            kind (str): 邮件类型
+            to_email (str): 收件人
+            template_id (str): 模板ID
+            template_data (dict): 模板数据
+            daily_limit (int): 同一收件人当日最多入队的邮件数（按本进程的邮件类型计数，不含死信），为 None 时不限制
+
+        Returns:
+            bool: 是否已在队列中（新入队或重复入队都返回True，超过当日上限或数据库出错时返回False）
+        """
+        conn = self.get_connection()
+        if not conn:
+            return False
+
+        try:
+            for attempt in range(ENQUEUE_DEADLOCK_RETRIES + 1):
+                try:
+                    result = self._insert(conn, idempotency_key, kind, to_email, template_id, template_data,
+                                          daily_limit)
+                    break
+                except Exception as e:
+                    conn.rollback()
+                    if e.args[:1] != (MYSQL_DEADLOCK_ERROR,) or attempt == ENQUEUE_DEADLOCK_RETRIES:
+                        raise
+            if result is None:
+                return False
+
+            with self.lock:
+                self.counters['enqueued' if result else 'duplicates'] += 1
+            if result:
+                self.wakeup.set()
+            else:
+                print(f"[INFO] {kind}邮件已在发送队列中，忽略重复入队: {to_email}")
+            return True
+        except Exception as e:
+            print(f"[ERROR] 邮件入队失败: {str(e)}")
+            return False
+        finally:
+            self.release_connection(conn)
+
+    def _insert(self, conn, idempotency_key, kind, to_email, template_id, template_data, daily_limit):
+        """
+        写入一条记录，有当日上限时在同一事务中先计数
+
+        计数使用加锁读，同一收件人的并发入队依次执行，不会同时通过上限检查。
+
+        Returns:
+            bool: 是否新插入（重复入队为False），超过当日上限时返回 None
+        """
+        with conn.cursor() as cursor:
+            if daily_limit is not None:
+                conn.begin()
+                kind_sql, kind_params = self.kind_filter()
+                cursor.execute(f"""SELECT COUNT(*) FROM email_outbox
+                                   WHERE to_email = %s AND created_at >= CURDATE() AND status != %s
+                                   {kind_sql}
+                                   FOR UPDATE""", [to_email, STATUS_DEAD] + kind_params)
+                count = cursor.fetchone()[0]
+                if count >= daily_limit:
+                    cursor.execute("SELECT 1 FROM email_outbox WHERE idempotency_key = %s", (idempotency_key,))
+                    duplicate = cursor.fetchone() is not None
+                    conn.commit()
+                    if duplicate:
+                        return False
+                    print(f"[WARN] 邮件发送频率超限，邮箱 {to_email} 今日已有 {count} 封邮件加入发送队列")
+                    return None
+
+            sql = """INSERT IGNORE INTO email_outbox
+                     (idempotency_key, kind, to_email, template_id, template_data, next_attempt_at)
+                     VALUES (%s, %s, %s, %s, %s, NOW())"""
+            cursor.execute(sql, (
+                idempotency_key, kind, to_email, template_id,
+                json.dumps(template_data, ensure_ascii=False, default=str)
+            ))
+            inserted = cursor.rowcount > 0
+            if daily_limit is not None:
+                conn.commit()
+            return inserted
+
+    def claim(self):
+        """
+        认领一批本进程邮件类型的到期待发送记录（包括认领超时的记录）
+
+        Returns:
+            tuple: (认领令牌, 记录列表)
+        """
+        token = uuid.uuid4().hex
+        conn = self.get_connection()
+        if not conn:
+            return token, []
+
+        try:
+            with conn.cursor() as cursor:
+                kind_sql, kind_params = self.kind_filter()
+                sql = f"""UPDATE email_outbox
+                          SET status = %s, claim_token = %s, claimed_at = NOW()
+                          WHERE ((status = %s AND next_attempt_at <= NOW())
+                             OR (status = %s AND claimed_at < NOW() - INTERVAL %s SECOND))
+                          {kind_sql}
+                          ORDER BY next_attempt_at
+                          LIMIT %s"""
+                cursor.execute(sql, [STATUS_SENDING, token, STATUS_PENDING, STATUS_SENDING,
+                                     self.claim_timeout] + kind_params + [self.batch_size])
+                if cursor.rowcount == 0:
+                    return token, []
+
+                cursor.execute("""SELECT id, kind, to_email, template_id, template_data, attempts, created_at
+                                  FROM email_outbox WHERE claim_token = %s""", (token,))
+                rows = []
+                for row in cursor.fetchall():
+                    rows.append({
+                        'id': row[0],
+                        'kind': row[1],
+                        'to_email': row[2],
+                        'template_id': row[3],
+                        'template_data': json.loads(row[4]) if row[4] else None,
+                        'attempts': row[5],
+                        'created_at': row[6]
+                    })
+                return token, rows
+        except Exception as e:
+            print(f"[ERROR] 认领待发送邮件失败: {str(e)}")
+            return token, []
+        finally:
+            self.release_connection(conn)
+
+    def renew(self, token, row):
+        """
+        发送前续认领一条记录：换成新的令牌并刷新认领时间
+
+        令牌每次都会变化，UPDATE 的影响行数只取决于记录是否仍由本次认领持有（不依赖 FOUND_ROWS）。
+
+        Returns:
+            str: 新的认领令牌，记录已被其他进程重新认领或数据库出错时返回 None
+        """
+        new_token = uuid.uuid4().hex
+        conn = self.get_connection()
+        if not conn:
+            return None
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""UPDATE email_outbox SET claim_token = %s, claimed_at = NOW()
+                                  WHERE id = %s AND status = %s AND claim_token = %s""",
+                               (new_token, row['id'], STATUS_SENDING, token))
+                return new_token if cursor.rowcount == 1 else None
+        except Exception as e:
+            print(f"[ERROR] 续认领邮件失败: {str(e)}")
+            return None
+        finally:
+            self.release_connection(conn)
+
+    def retry_delay(self, attempts):
+        """第 attempts 次失败后的等待时间：指数退避加随机抖动"""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        return int(delay * random.uniform(0.8, 1.2))
+
+    def complete(self, token, row, result):
+        """根据发送结果更新记录状态"""
+        attempts = row['attempts'] + 1
+        conn = self.get_connection()
+        if not conn:
+            # 无法更新状态时记录保持认领状态，认领超时后会被重新发送
+            return
+
+        try:
+            with conn.cursor() as cursor:
+                if result.get('code') == 200:
+                    cursor.execute("""UPDATE email_outbox
+                                      SET status = %s, attempts = %s, sent_at = NOW(), claim_token = NULL, last_error = NULL
+                                      WHERE id = %s AND claim_token = %s""",
+                                   (STATUS_SENT, attempts, row['id'], token))
+                    return
+
+                error = describe_result(result)[:255]
+                if attempts >= self.max_attempts or result.get('code') in NON_RETRYABLE_CODES:
+                    cursor.execute("""UPDATE email_outbox
+                                      SET status = %s, attempts = %s, claim_token = NULL, last_error = %s
+                                      WHERE id = %s AND claim_token = %s""",
+                                   (STATUS_DEAD, attempts, error, row['id'], token))
+                    with self.lock:
+                        self.counters['dead'] += 1
+                    print(f"[ERROR] {row['kind']}邮件发送失败 {attempts} 次，进入死信状态: {row['to_email']}，{error}")
+                else:
+                    delay = self.retry_delay(attempts)
+                    cursor.execute("""UPDATE email_outbox
+                                      SET status = %s, attempts = %s, claim_token = NULL, last_error = %s,
+                                          next_attempt_at = NOW() + INTERVAL %s SECOND
+                                      WHERE id = %s AND claim_token = %s""",
+                                   (STATUS_PENDING, attempts, error, delay, row['id'], token))
+                    with self.lock:
+                        self.counters['retried'] += 1
+                    print(f"[WARN] {row['kind']}邮件第 {attempts} 次发送失败，{delay} 秒后重试: {row['to_email']}，{error}")
+        except Exception as e:
+            print(f"[ERROR] 更新邮件发送状态失败: {str(e)}")
+        finally:
+            self.release_connection(conn)
+
+    def send_row(self, token, row):
+        """发送一条认领到的记录，发送前续认领，记录已被重新认领时跳过"""
+        token = self.renew(token, row)
+        if token is None:
+            print(f"[WARN] {row['kind']}邮件已被重新认领或无法续认领，本次不发送: {row['to_email']}")
+            return
+
+        start = time.time()
+        result = self.sender.send_sync(row['to_email'], row['template_id'], row['template_data'])
+        latency = time.time() - start
+
+        if result.get('code') == 200:
+            now = time.time()
+            with self.lock:
+                self.counters['sent'] += 1
+                self.latencies.append(latency)
+                self.sent_times.append(now)
+            print(f"[INFO] {row['kind']}邮件发送成功到 {row['to_email']}，耗时 {latency * 1000:.0f} ms")
+
+        self.complete(token, row, result)
+
+    def drain_once(self):
+        """
+        认领并发送一批记录
+
+        Returns:
+            int: 本次处理的记录数
+        """
+        token, rows = self.claim()
+        for row in rows:
+            self.send_row(token, row)
+        return len(rows)
+
+    def _worker(self):
+        """工作线程：循环认领并发送，队列为空时等待唤醒或轮询间隔"""
+        while not self.stop_event.is_set():
+            try:
+                if self.drain_once() > 0:
+                    continue
+            except Exception as e:
+                print(f"[ERROR] 邮件发送线程出错: {str(e)}")
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+
+    def start(self):
+        """启动工作线程（重复调用只启动一次）"""
+        with self.start_lock:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'email-outbox-{i}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+            print(f"[INFO] 邮件发送队列已启动，工作线程数: {self.workers}")
+
+    def stop(self, timeout=None):
+        """停止工作线程，正在发送的邮件发送完毕后退出"""
+        self.stop_event.set()
+        self.wakeup.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def queue_depth(self):
+        """
+        按状态统计队列中本进程邮件类型的记录数
+
+        Returns:
+            dict: {'pending': 数量, 'sending': 数量, 'sent': 数量, 'dead': 数量}，数据库出错时为空字典
+        """
+        conn = self.get_connection()
+        if not conn:
+            return {}
+
+        try:
+            with conn.cursor() as cursor:
+                kind_sql, kind_params = self.kind_filter()
+                cursor.execute(f"SELECT status, COUNT(*) FROM email_outbox WHERE 1 = 1 {kind_sql} GROUP BY status",
+                               kind_params)
+                depth = {name: 0 for name in STATUS_NAMES.values()}
+                for status, count in cursor.fetchall():
+                    depth[STATUS_NAMES.get(status, str(status))] = count
+                return depth
+        except Exception as e:
+            print(f"[ERROR] 统计邮件队列失败: {str(e)}")
+            return {}
+        finally:
+            self.release_connection(conn)
+
+    def metrics(self):
+        """
+        队列指标：各状态记录数、本进程的入队/发送/重试/死信次数、发送耗时和最近一分钟的吞吐量
+
+        Returns:
+            dict: 指标字典
+        """
+        now = time.time()
+        with self.lock:
+            while self.sent_times and self.sent_times[0] < now - THROUGHPUT_WINDOW:
+                self.sent_times.popleft()
+            counters = dict(self.counters)
+            latencies = sorted(self.latencies)
+            sent_last_minute = len(self.sent_times)
+
+        return {
+            'depth': self.queue_depth(),
+            'counters': counters,
+            'send_latency_ms': {
+                'avg': round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0,
+                'p95': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1) if latencies else 0,
+                'max': round(latencies[-1] * 1000, 1) if latencies else 0
+            },
+            'throughput_per_minute': sent_last_minute
+        }
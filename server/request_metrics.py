@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+请求耗时统计、Prometheus 指标和分级日志，server.py 与 email_api.py 共用
+
+每个请求开始时调用 start_request 创建计时器并放在当前线程中，连接池取连接、连接检查、
+序列化和写响应用 phase 包起来计时，每条 SQL 由 TimedCursor（pymysql 连接的 cursorclass）
+自动计时，不需要在查询函数之间传递计时器。请求结束时 finish_request 把各阶段耗时计入按接口
+区分的直方图，并输出一行 key=value 格式的请求日志。render_prometheus 按 Prometheus 文本格式
+输出全部指标。
+
+日志沿用 "[INFO] ..." 的格式，低于 set_log_level 设置的级别的日志不输出；调试日志可以传入
+%s 格式的参数，级别未开启时不做字符串格式化。
+"""
+
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+import pymysql.cursors
+
+# 日志级别
+LOG_LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARN': 30, 'ERROR': 40}
+
+# 直方图的桶上限，单位为秒
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 请求日志中各阶段的输出顺序
+PHASES = ('pool_acquire', 'ping', 'query', 'serialize', 'compress', 'write')
+
+_log_level = LOG_LEVELS['INFO']
+_local = threading.local()
+
+def set_log_level(name):
+    """
+    设置日志级别
+
+    Args:
+        name (str): DEBUG、INFO、WARN 或 ERROR，无法识别时使用 INFO
+    """
+    global _log_level
+    _log_level = LOG_LEVELS.get(str(name).strip().upper(), LOG_LEVELS['INFO'])
+
+def log_enabled(level):
+    return LOG_LEVELS[level] >= _log_level
+
+def log(level, message, *args):
+    """输出一行日志，有参数时按 % 格式化"""
+    if LOG_LEVELS[level] < _log_level:
+        return
+    if args:
+        message = message % args
+    print(f"[{level}] {message}")
+
+def log_debug(message, *args):
+    log('DEBUG', message, *args)
+
+def log_info(message, *args):
+    log('INFO', message, *args)
+
+def log_warn(message, *args):
+    log('WARN', message, *args)
+
+def log_error(message, *args):
+    log('ERROR', message, *args)
+
+class RequestTimer:
+    """一个请求的各阶段耗时"""
+
+    __slots__ = ('endpoint', 'started', 'phases', 'queries', 'depth')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.queries = []
+        self.depth = 0
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+@contextmanager
+def phase(name):
+    """
+    统计当前请求在一个阶段中的耗时
+
+    嵌套的阶段只计入最外层，例如连接检查中执行的 SELECT 1 不会再计为一次查询。
+    当前线程没有正在处理的请求时（后台线程）不做任何统计。
+    """
+    timer = getattr(_local, 'timer', None)
+    if timer is None or timer.depth:
+        yield
+        return
+    timer.depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timer.depth -= 1
+        timer.add(name, elapsed)
+        if name == 'query':
+            timer.queries.append(elapsed)
+
+class TimedCursor(pymysql.cursors.Cursor):
+    """每次 execute/executemany 计入当前请求的 query 阶段（默认游标在 execute 中读完结果集）"""
+
+    def execute(self, query, args=None):
+        with phase('query'):
+            return super().execute(query, args)
+
+    def executemany(self, query, args):
+        with phase('query'):
+            return super().executemany(query, args)
+
+class Histogram:
+    """Prometheus 直方图：各桶计数、总和与次数"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # 最后一个计数对应 +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+class RequestMetrics:
+    """按接口区分的请求耗时直方图和请求计数"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # {(指标名, 标签元组): Histogram}
+        self.histograms = {}
+        # {(接口, 响应码): 次数}
+        self.requests = {}
+
+    def _observe(self, name, labels, value):
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            histogram = self.histograms[(name, labels)] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def record(self, timer, code, total):
+        """把一个请求的耗时计入直方图"""
+        endpoint = (('endpoint', timer.endpoint),)
+        with self.lock:
+            key = (timer.endpoint, str(code))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self._observe('http_request_duration_seconds', endpoint, total)
+            for name, seconds in timer.phases.items():
+                self._observe('http_request_phase_seconds', endpoint + (('phase', name),), seconds)
+            for seconds in timer.queries:
+                self._observe('db_query_duration_seconds', endpoint, seconds)
+
+    def render(self):
+        """
+        按 Prometheus 文本格式输出请求指标
+
+        Returns:
+            list: 文本行
+        """
+        help_texts = {
+            'http_request_duration_seconds': '请求处理总耗时',
+            'http_request_phase_seconds': '请求各阶段耗时（pool_acquire/ping/query/serialize/compress/write）',
+            'db_query_duration_seconds': '单条SQL的耗时',
+        }
+        with self.lock:
+            requests = sorted(self.requests.items())
+            histograms = sorted(
+                ((key, list(h.counts), h.sum, h.count) for key, h in self.histograms.items()),
+                key=lambda item: item[0]
+            )
+        lines = ['# HELP http_requests_total 请求次数', '# TYPE http_requests_total counter']
+        for (endpoint, code), count in requests:
+            lines.append(f'http_requests_total{_labels((("endpoint", endpoint), ("code", code)))} {count}')
+        current = None
+        for (name, labels), counts, total, count in histograms:
+            if name != current:
+                lines.append(f'# HELP {name} {help_texts.get(name, name)}')
+                lines.append(f'# TYPE {name} histogram')
+                current = name
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{_labels(labels + (("le", le),))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {total:.6f}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+        return lines
+
+metrics = RequestMetrics()
+
+def start_request(endpoint='other'):
+    """
+    开始统计当前线程正在处理的请求
+
+    Args:
+        endpoint (str): 接口名，解析请求后可以再修改 timer.endpoint
+
+    Returns:
+        RequestTimer: 计时器
+    """
+    timer = RequestTimer(endpoint)
+    _local.timer = timer
+    return timer
+
+def finish_request(timer, code, extra=''):
+    """
+    结束统计：计入直方图并输出一行请求日志
+
+    Args:
+        timer (RequestTimer): start_request 返回的计时器
+        code: 响应码
+        extra (str): 附加在请求日志末尾的 key=value 字段
+    """
+    _local.timer = None
+    total = time.perf_counter() - timer.started
+    metrics.record(timer, code, total)
+    if log_enabled('INFO'):
+        fields = [f"endpoint={timer.endpoint}", f"code={code}", f"total_ms={total * 1000:.2f}"]
+        for name in PHASES:
+            if name in timer.phases:
+                fields.append(f"{name}_ms={timer.phases[name] * 1000:.2f}")
+        fields.append(f"queries={len(timer.queries)}")
+        if extra:
+            fields.append(extra)
+        print(f"[INFO] request {' '.join(fields)}")
+
+def render_gauges(name, help_text, values, metric_type='gauge'):
+    """
+    把一组数值输出为 Prometheus 文本行，用于响应缓存、发送队列等已有的统计
+
+    Args:
+        name (str): 指标名
+        help_text (str): 说明
+        values (list): [(标签元组, 数值)]
+        metric_type (str): gauge 或 counter
+
+    Returns:
+        list: 文本行
+    """
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}']
+    for labels, value in values:
+        lines.append(f'{name}{_labels(labels)} {value}')
+    return lines
+
+def render_prometheus(extra_lines=()):
+    """
+    Prometheus 文本格式的全部指标
+
+    Args:
+        extra_lines (iterable): 调用方附加的指标行（render_gauges 的输出）
+
+    Returns:
+        bytes: 响应体
+    """
+    lines = metrics.render()
+    lines.extend(extra_lines)
+    return ('\n'.join(lines) + '\n').encode('utf-8')
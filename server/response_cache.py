@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+查询接口的进程内响应缓存
+
+按接口和参数缓存已编码的JSON响应体，LRU淘汰并限制总字节数，每条记录另有最长有效期。
+每条记录保存生成时所涉及设备的版本号（device_latest.updated_at，入库写入新读数时更新），
+读取时版本号变化的记录视为失效并重新查询。ETag 为响应体的哈希，客户端可以用
+If-None-Match / If-Modified-Since 重新验证并得到 304。
+
+客户端的 Accept-Encoding 包含 br（需要安装 brotli 模块）或 gzip 时，超过 MIN_COMPRESS_BYTES 的
+响应体压缩后发送。缓存记录第一次以某种编码发送时压缩并保存压缩结果，计入缓存字节数，之后直接复用。
+"""
+
+import time
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 缓存总字节数上限
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+# 单条记录的最长有效期，单位为秒；不依赖读数的数据（设备档案、搜索结果）靠它过期
+DEFAULT_TTL = 300
+
+# 小于该字节数的响应体不压缩，压缩节省的字节抵不过压缩耗时
+MIN_COMPRESS_BYTES = 1024
+
+# 压缩级别：gzip 1-9，brotli 0-11，取压缩率与耗时的折中
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+def choose_encoding(accept_encoding, size):
+    """
+    按请求的 Accept-Encoding 选择响应体的压缩方式
+
+    Args:
+        accept_encoding (str): 请求头 Accept-Encoding，可以为 None
+        size (int): 未压缩的响应体字节数
+
+    Returns:
+        str: 'br'、'gzip'，不压缩时返回 None
+    """
+    if not accept_encoding or size < MIN_COMPRESS_BYTES:
+        return None
+    accepted = set()
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        # q=0 表示客户端不接受该编码
+        key, _, value = params.partition('=')
+        if key.strip().lower() == 'q':
+            try:
+                if float(value) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+def compress_body(body, encoding):
+    """
+    压缩响应体
+
+    Args:
+        body (bytes): 响应体
+        encoding (str): choose_encoding 的返回值
+
+    Returns:
+        bytes: 压缩后的响应体，encoding 为 None 时原样返回
+    """
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        # mtime 固定为 0，同一响应体每次压缩的结果相同
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+class CacheEntry:
+    """一条缓存的响应"""
+
+    __slots__ = ('data', 'body', 'etag', 'versions', 'last_modified', 'created_at', 'encoded', 'cached')
+
+    def __init__(self, data, body, versions, last_modified):
+        """
+        Args:
+            data (dict): 响应数据
+            body (bytes): 编码后的响应体
+            versions (dict): {设备ID: 生成响应时的版本号}
+            last_modified (float): 数据最后修改时间的时间戳
+        """
+        self.data = data
+        self.body = body
+        self.etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        self.versions = versions
+        self.last_modified = last_modified
+        self.created_at = time.monotonic()
+        # {压缩方式: 压缩后的响应体}
+        self.encoded = {}
+        # 是否在缓存中（压缩结果只有在缓存中时才计入缓存字节数）
+        self.cached = False
+
+    def size(self):
+        """响应体与已保存的压缩结果的总字节数"""
+        return len(self.body) + sum(len(body) for body in self.encoded.values())
+
+    def etag_for(self, encoding):
+        """不同压缩方式的响应体是不同的表示，ETag 附加压缩方式以示区分"""
+        if encoding is None:
+            return self.etag
+        return self.etag[:-1] + '-' + encoding + '"'
+
+class ResponseCache:
+    """LRU + TTL 的响应缓存，总大小按响应体字节数限制"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0, 'not_modified': 0}
+
+    def get(self, key, versions):
+        """
+        读取缓存
+
+        Args:
+            key (tuple): 缓存键
+            versions (dict): {设备ID: 当前版本号}
+
+        Returns:
+            CacheEntry: 命中时返回记录，未命中、过期或版本号变化时返回 None
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            if entry.versions != versions or time.monotonic() - entry.created_at > self.ttl:
+                self._remove(key)
+                self.counters['stale'] += 1
+                self.counters['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry
+
+    def put(self, key, entry):
+        """写入缓存，超出字节上限时淘汰最久未使用的记录；超过上限八分之一的响应不缓存"""
+        size = len(entry.body)
+        if size > self.max_bytes // 8:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = entry
+            entry.cached = True
+            self.size += entry.size()
+            self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            self._remove(next(iter(self.entries)))
+            self.counters['evictions'] += 1
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        entry.cached = False
+        self.size -= entry.size()
+
+    def encoded_body(self, entry, encoding):
+        """
+        记录按指定方式压缩后的响应体，第一次使用时压缩并保存在记录中
+
+        Args:
+            entry (CacheEntry): 缓存记录
+            encoding (str): choose_encoding 的返回值
+
+        Returns:
+            bytes: 压缩后的响应体，encoding 为 None 时返回原响应体
+        """
+        if encoding is None:
+            return entry.body
+        body = entry.encoded.get(encoding)
+        if body is not None:
+            return body
+        # 在锁外压缩，并发的请求可能重复压缩同一条记录，只保存第一份
+        body = compress_body(entry.body, encoding)
+        with self.lock:
+            if encoding not in entry.encoded:
+                entry.encoded[encoding] = body
+                if entry.cached:
+                    self.size += len(body)
+                    self._evict()
+            return entry.encoded[encoding]
+
+    def record_not_modified(self):
+        """记录一次 304 响应"""
+        with self.lock:
+            self.counters['not_modified'] += 1
+
+    def stats(self):
+        """
+        缓存指标：命中率、条目数、占用字节数和各计数器
+
+        Returns:
+            dict: 指标字典
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            entries = len(self.entries)
+            size = self.size
+        lookups = counters['hits'] + counters['misses']
+        return {
+            'hit_ratio': round(counters['hits'] / lookups, 4) if lookups else 0,
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'counters': counters
+        }
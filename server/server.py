@@ -6,17 +6,23 @@ import configparser
 import pymysql
 import random
 import threading
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 import sys
 import os
 import traceback
-from concurrent.futures import ThreadPoolExecutor
 import atexit
-from queue import Queue
 import re
 from datetime import datetime, date
-from contextlib import contextmanager
+from email.utils import formatdate, parsedate_to_datetime
+
+from response_cache import (ResponseCache, CacheEntry, choose_encoding, compress_body, DEFAULT_MAX_BYTES,
+                            DEFAULT_TTL)
+from device_index import DeviceIndex, DEFAULT_PAGE_SIZE, DEFAULT_SUGGEST_LIMIT
+from db_pool import create_pool
+from request_metrics import (TimedCursor, phase, start_request, finish_request, render_prometheus, render_gauges,
+                             set_log_level, log_debug, log_info, log_warn, log_error)
 
 # 读取配置文件
 config = configparser.ConfigParser()
@@ -31,17 +37,46 @@ DB_NAME = config.get('mysql', 'db_schema')
 
 # 服务器配置
 SERVER_PORT = int(config.get('server', 'port'))
+# 同时处理的连接数上限（每个连接一个线程）
+SERVER_MAX_WORKERS = config.getint('server', 'max_workers', fallback=30)
+# keep-alive 连接的空闲超时，单位为秒
+KEEPALIVE_TIMEOUT = config.getint('server', 'keepalive_timeout', fallback=5)
 
 # 首页显示配置
 FIRST_SCREEN_COUNT = int(config.get('config', 'first_screen_count'))
+# 首屏抽样用的设备ID列表缓存有效期，单位为秒
+DEVICE_ID_CACHE_TTL = config.getint('config', 'device_id_cache_ttl', fallback=300)
+
+# 检查 device 表是否变化（决定是否重建搜索索引）的间隔，单位为秒
+SEARCH_INDEX_CHECK_INTERVAL = config.getint('config', 'search_index_check_interval', fallback=60)
+
+# 批量查询一次最多包含的设备数
+BATCH_MAX_DEVICES = 100
+
+# 搜索结果每页最多返回的设备数，与批量查询上限一致，前端一页结果只需一次批量请求
+SEARCH_MAX_PAGE_SIZE = BATCH_MAX_DEVICES
+
+# 输入联想一次最多返回的位置数
+SUGGEST_MAX_LIMIT = 20
+
+# 分别统计耗时的接口（mode 参数），其他请求计入 other
+ENDPOINTS = ('first_screen', 'check', 'check_daily_range', 'check_batch', 'search', 'suggest')
 
-# 创建线程池
-executor = ThreadPoolExecutor(max_workers=10)
+# 读数接口（format 参数）的返回格式：rows 为逐行对象（默认），columnar 为按列的数组
+DATA_MODES = ('check', 'check_daily_range', 'check_batch')
+DATA_FORMATS = ('rows', 'columnar')
 
-# 连接池设置
-CONNECTION_POOL_SIZE = int(config.get('mysql', 'connection_pool_size', fallback=30))
-connection_pool = Queue(maxsize=CONNECTION_POOL_SIZE)
-connection_lock = threading.Lock()
+# 响应缓存配置：总字节数上限、单条最长有效期（秒）、设备版本号的轮询间隔（秒）
+CACHE_MAX_BYTES = config.getint('cache', 'max_bytes', fallback=DEFAULT_MAX_BYTES)
+CACHE_TTL = config.getint('cache', 'ttl', fallback=DEFAULT_TTL)
+CACHE_VERSION_POLL_INTERVAL = config.getfloat('cache', 'version_poll_interval', fallback=5)
+
+# 轮询设备版本号时回看的秒数：updated_at 取自入库进程的时钟且在事务提交前生成，
+# 晚提交的事务可能带着比上次轮询到的最大值更早的时间
+CACHE_VERSION_LOOKBACK = 60
+
+# 日志级别：DEBUG 输出每个请求的参数和处理过程，INFO 每个请求只输出一行耗时汇总
+set_log_level(config.get('log', 'level', fallback='INFO'))
 
 class DatabaseManager:
     @staticmethod
@@ -57,112 +92,301 @@ class DatabaseManager:
             connect_timeout=5,
             read_timeout=5,
             write_timeout=5,
-            autocommit=True
+            autocommit=True,
+            # 每条SQL的耗时计入当前请求的 query 阶段
+            cursorclass=TimedCursor
         )
     
-    @staticmethod
-    def initialize_connection_pool():
-        """初始化数据库连接池"""
-        print(f"[INFO] 初始化数据库连接池，大小: {CONNECTION_POOL_SIZE}")
-        for _ in range(CONNECTION_POOL_SIZE):
-            try:
-                conn = DatabaseManager.create_connection()
-                connection_pool.put(conn)
-            except Exception as e:
-                print(f"[ERROR] 创建连接池失败: {str(e)}")
-                traceback.print_exc()
-    
     @staticmethod
     def close_all_connections():
         """关闭所有数据库连接"""
-        print("[INFO] 关闭所有数据库连接")
-        with connection_lock:
-            while not connection_pool.empty():
-                try:
-                    conn = connection_pool.get_nowait()
-                    conn.close()
-                except:
-                    pass
+        log_info("关闭所有数据库连接")
+        db_pool.close()
     
     @staticmethod
-    @contextmanager
     def get_connection():
         """获取数据库连接的上下文管理器"""
-        conn = None
+        return db_pool.connection()
+
+# 连接池：按需建立连接，启动时不连接数据库；连接数上限建议不小于 max_workers
+db_pool = create_pool(config, lambda: DatabaseManager.create_connection(), default_size=30, default_timeout=2)
+
+# 注册退出处理
+atexit.register(DatabaseManager.close_all_connections)
+
+# 设备ID缓存
+class DeviceIdCache:
+    """
+    设备ID列表的内存缓存，首屏随机抽样时不再对 device 表 ORDER BY RAND()
+    
+    列表过期后由一个请求线程重新加载，其他请求继续使用旧列表，只有首次加载时需要等待。
+    """
+    
+    def __init__(self, ttl=DEVICE_ID_CACHE_TTL):
+        self.ttl = ttl
+        self.ids = []
+        self.loaded_at = None
+        self.refresh_lock = threading.Lock()
+    
+    def refresh(self):
+        """重新加载设备ID列表，加载失败时保留旧列表，过一个有效期后再重试"""
         try:
-            # 获取连接池中的连接
-            conn = connection_pool.get(timeout=2)  # 减少超时时间到2秒
-            print("[INFO] 从连接池获取数据库连接")
-            # 检查连接是否有效
-            conn.ping(reconnect=True)
-        except:
-            print("[WARN] 连接池获取连接超时或连接无效，创建新连接")
-            # 如果无法从连接池获取连接，创建新连接
-            conn = DatabaseManager.create_connection()
-        
+            with DatabaseManager.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT id FROM device")
+                    ids = [str(row[0]) for row in cursor.fetchall()]
+            # 整体替换列表，读取方不需要加锁
+            self.ids = ids
+            log_info(f"设备ID缓存已刷新，共 {len(ids)} 个设备")
+        except Exception as e:
+            log_error(f"刷新设备ID缓存失败，继续使用旧列表: {str(e)}")
+            traceback.print_exc()
+        self.loaded_at = time.monotonic()
+    
+    def get_ids(self):
+        """返回设备ID列表，过期时刷新"""
+        if self.loaded_at is None:
+            with self.refresh_lock:
+                if self.loaded_at is None:
+                    self.refresh()
+        elif time.monotonic() - self.loaded_at > self.ttl and self.refresh_lock.acquire(blocking=False):
+            try:
+                self.refresh()
+            finally:
+                self.refresh_lock.release()
+        return self.ids
+    
+    def sample(self, count):
+        """随机抽取不超过 count 个设备ID，耗时只与 count 有关"""
+        ids = self.get_ids()
+        return random.sample(ids, min(count, len(ids)))
+
+device_id_cache = DeviceIdCache()
+
+# 设备搜索索引
+class DeviceSearch:
+    """
+    设备名称和安装位置的内存搜索索引（server/device_index.py），搜索时不再对 device 表执行 LIKE 全表扫描
+    
+    每隔 check_interval 秒由一个请求线程检查 device 表的行数和最大 updated_at，有变化时重新加载并
+    整体替换索引，其他请求继续使用旧索引，只有首次加载时需要等待。
+    """
+    
+    def __init__(self, check_interval=SEARCH_INDEX_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.index = None
+        self.signature = None
+        self.checked_at = None
+        self.refresh_lock = threading.Lock()
+    
+    def refresh(self):
+        """device 表有变化时重建索引，失败时保留旧索引，过一个检查间隔后再重试"""
         try:
-            yield conn
-        finally:
-            DatabaseManager.release_connection(conn)
+            rows = None
+            with DatabaseManager.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT COUNT(*), MAX(updated_at) FROM device")
+                    signature = tuple(cursor.fetchone())
+                    if self.index is None or signature != self.signature:
+                        cursor.execute("SELECT id, equipmentName, installationSite, equipmentType, status FROM device")
+                        rows = cursor.fetchall()
+            if rows is not None:
+                # 连接归还后再建索引；整体替换索引，读取方不需要加锁
+                start = time.perf_counter()
+                self.index = DeviceIndex(rows)
+                self.signature = signature
+                log_info(f"设备搜索索引已重建，共 {len(self.index)} 个设备，"
+                         f"耗时 {(time.perf_counter() - start) * 1000:.0f} ms")
+        except Exception as e:
+            log_error(f"重建设备搜索索引失败，继续使用旧索引: {str(e)}")
+            traceback.print_exc()
+        self.checked_at = time.monotonic()
     
-    @staticmethod
-    def release_connection(conn):
-        """释放数据库连接"""
-        if conn is None:
-            return
+    def get_index(self):
+        """返回当前索引，到期时检查是否需要重建；首次加载失败时返回 None"""
+        if self.checked_at is None:
+            with self.refresh_lock:
+                if self.checked_at is None:
+                    self.refresh()
+        elif time.monotonic() - self.checked_at > self.check_interval and self.refresh_lock.acquire(blocking=False):
+            try:
+                self.refresh()
+            finally:
+                self.refresh_lock.release()
+        return self.index
+
+device_search = DeviceSearch()
+
+# 设备数据版本号
+class DeviceVersions:
+    """
+    各设备的数据版本号（device_latest.updated_at），用于判断缓存的响应是否失效
+    
+    data2sql.py 写入新读数时在同一事务中更新 device_latest.updated_at。每隔 poll_interval 秒
+    由一个请求线程增量读取最近更新过的设备，其他请求直接使用内存中的版本号。
+    """
+    
+    def __init__(self, poll_interval=CACHE_VERSION_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.versions = {}
+        self.high_water = None
+        self.polled_at = None
+        self.poll_lock = threading.Lock()
+    
+    def poll(self):
+        """读取上次轮询以来更新过的设备版本号，首次读取全部设备"""
         try:
-            # 检查连接是否有效
-            conn.ping(reconnect=True)
-            # 将连接放回连接池
-            if not connection_pool.full():
-                connection_pool.put_nowait(conn)
-                print("[INFO] 数据库连接已返回连接池")
-            else:
-                conn.close()
-                print("[INFO] 连接池已满，直接关闭连接")
+            with DatabaseManager.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    if self.high_water is None:
+                        cursor.execute("SELECT device_id, updated_at FROM device_latest")
+                    else:
+                        cursor.execute(
+                            "SELECT device_id, updated_at FROM device_latest WHERE updated_at >= %s - INTERVAL %s SECOND",
+                            (self.high_water, CACHE_VERSION_LOOKBACK)
+                        )
+                    rows = cursor.fetchall()
+            # 复制后整体替换，读取方不需要加锁
+            versions = dict(self.versions)
+            for device_id, updated_at in rows:
+                versions[str(device_id)] = str(updated_at)
+            if rows:
+                newest = max(row[1] for row in rows)
+                self.high_water = newest if self.high_water is None else max(self.high_water, newest)
+            self.versions = versions
         except Exception as e:
-            print(f"[WARN] 连接无效，丢弃: {str(e)}")
-            # 连接无效，直接丢弃
+            log_error(f"读取设备版本号失败: {str(e)}")
+            traceback.print_exc()
+        self.polled_at = time.monotonic()
+    
+    def get(self, device_ids):
+        """
+        返回指定设备的当前版本号，到期时先轮询
+        
+        Returns:
+            dict: {设备ID: 版本号}，没有读数的设备版本号为 None
+        """
+        if self.polled_at is None:
+            with self.poll_lock:
+                if self.polled_at is None:
+                    self.poll()
+        elif time.monotonic() - self.polled_at > self.poll_interval and self.poll_lock.acquire(blocking=False):
             try:
-                conn.close()
-            except:
-                pass
+                self.poll()
+            finally:
+                self.poll_lock.release()
+        versions = self.versions
+        return {device_id: versions.get(device_id) for device_id in device_ids}
 
-# 注册退出处理
-atexit.register(DatabaseManager.close_all_connections)
+device_versions = DeviceVersions()
+response_cache = ResponseCache(CACHE_MAX_BYTES, CACHE_TTL)
+
+# 设备信息字段，与单个设备接口的返回格式一致
+def format_device_info(device_info):
+    return {
+        "equipmentName": device_info[0],
+        "device_id": str(device_info[8]),
+        "installationSite": device_info[1],
+        "equipmentType": device_info[2],
+        "ratio": str(device_info[3]),
+        "rate": str(device_info[4]),
+        "acctId": device_info[5],
+        "status": str(device_info[6]),
+        "updated_at": str(device_info[7])
+    }
+
+# 读数行 (device_id, read_time, total_reading, remainingBalance, diff_reading) 的返回格式
+def format_reading_row(row):
+    return {
+        "device_id": str(row[0]),
+        "read_time": str(row[1]),
+        "total_reading": str(row[2]),
+        "remainingBalance": str(row[3]),
+        "diff_reading": str(row[4])
+    }
+
+# data_daily 日汇总行的返回格式：当日最后读数，另附当日用量和充值金额
+def format_daily_row(row):
+    return {
+        "device_id": str(row[0]),
+        "read_time": str(row[2]),
+        "total_reading": str(row[3]),
+        "remainingBalance": str(row[4]),
+        "daily_usage": str(row[5]),
+        "topup_amount": str(row[6])
+    }
+
+# 列式返回格式（format=columnar）：每个字段一个数组，顺序与 rows 相同（读表时间倒序），不再逐行重复
+# device_id 和字段名。时间为 Unix 时间戳（秒，数据库时间按服务器本地时区解释），读数和金额为数值，缺失为 null
+def to_timestamp(value):
+    return int(value.timestamp()) if value is not None else None
+
+def to_number(value):
+    return float(value) if value is not None else None
+
+def format_reading_columns(rows):
+    return {
+        "read_time": [to_timestamp(row[1]) for row in rows],
+        "total_reading": [to_number(row[2]) for row in rows],
+        "remainingBalance": [to_number(row[3]) for row in rows],
+        "diff_reading": [to_number(row[4]) for row in rows]
+    }
 
-# 初始化连接池
-DatabaseManager.initialize_connection_pool()
+def format_daily_columns(rows):
+    return {
+        "read_time": [to_timestamp(row[2]) for row in rows],
+        "total_reading": [to_number(row[3]) for row in rows],
+        "remainingBalance": [to_number(row[4]) for row in rows],
+        "daily_usage": [to_number(row[5]) for row in rows],
+        "topup_amount": [to_number(row[6]) for row in rows]
+    }
+
+def format_device_data(device_info, rows, format_row, format_columns, columnar):
+    """
+    单个设备的返回数据：设备信息加读数
+    
+    Args:
+        device_info (tuple): 设备信息查询结果
+        rows (list): 读数查询结果，按读表时间倒序
+        format_row (callable): 逐行格式的转换函数
+        format_columns (callable): 列式格式的转换函数
+        columnar (bool): 是否使用列式格式
+    
+    Returns:
+        dict: 逐行格式为 rows 字段，列式格式为 format 和 columns 字段
+    """
+    data = format_device_info(device_info)
+    data["total"] = len(rows)
+    if columnar:
+        data["format"] = "columnar"
+        data["columns"] = format_columns(rows)
+    else:
+        data["rows"] = [format_row(row) for row in rows]
+    data["code"] = 200
+    return data
 
 # 数据查询类
 class DataQuery:
     @staticmethod
     def get_first_screen_data():
         """首屏数据接口"""
-        print(f"[INFO] 开始获取首屏数据，请求数量: {FIRST_SCREEN_COUNT}")
+        log_debug(f"开始获取首屏数据，请求数量: {FIRST_SCREEN_COUNT}")
         try:
-            with DatabaseManager.get_connection() as conn:
-                print("[INFO] 数据库连接建立成功")
-                with conn.cursor() as cursor:
-                    # 验证FIRST_SCREEN_COUNT是否在安全范围内
-                    safe_limit = min(FIRST_SCREEN_COUNT, 100)  # 限制最大返回数量
-                    # 随机获取配置数量的设备ID
-                    sql = "SELECT id FROM device ORDER BY RAND() LIMIT %s"
-                    print(f"[INFO] 执行SQL查询: {sql}")
-                    cursor.execute(sql, (safe_limit,))
-                    results = cursor.fetchall()
-                    device_ids = [str(row[0]) for row in results]
-                    print(f"[INFO] 查询完成，获取到 {len(device_ids)} 个设备ID")
-                    
-                    response = {
-                        "code": "200",
-                        "total_num": len(device_ids),
-                        "device_ids": device_ids
-                    }
-                    print(f"[INFO] 首屏数据响应: {response}")
-                    return response
+            # 验证FIRST_SCREEN_COUNT是否在安全范围内
+            safe_limit = min(FIRST_SCREEN_COUNT, 100)  # 限制最大返回数量
+            # 从缓存的设备ID列表中随机抽取配置数量的设备ID
+            device_ids = device_id_cache.sample(safe_limit)
+            log_debug(f"抽样完成，获取到 {len(device_ids)} 个设备ID")
+            
+            response = {
+                "code": "200",
+                "total_num": len(device_ids),
+                "device_ids": device_ids
+            }
+            log_debug("首屏数据响应: %s", response)
+            return response
         except Exception as e:
-            print(f"[ERROR] 获取首屏数据时出错: {str(e)}")
+            log_error(f"获取首屏数据时出错: {str(e)}")
             traceback.print_exc()
             return {"code": "500", "error": f"数据库查询错误: {str(e)}"}
 
@@ -173,255 +397,457 @@ class DataQuery:
             SELECT equipmentName, installationSite, equipmentType, ratio, rate, acctId, status, updated_at, id
             FROM device WHERE id = %s
         """
-        print(f"[INFO] 查询设备信息，SQL: {device_sql.strip()}, 参数: {device_id}")
+        log_debug("查询设备信息，参数: %s", device_id)
         cursor.execute(device_sql, (device_id,))
         return cursor.fetchone()
 
     @staticmethod
-    def get_device_data(device_id, data_num):
-        """检查设备数据接口"""
-        print(f"[INFO] 开始获取设备数据，设备ID: {device_id}, 数据数量: {data_num}")
+    def get_device_data(device_id, data_num, columnar=False):
+        """检查设备数据接口，columnar 为 True 时读数按列返回"""
+        log_debug(f"开始获取设备数据，设备ID: {device_id}, 数据数量: {data_num}")
         try:
             with DatabaseManager.get_connection() as conn:
-                print(f"[INFO] 数据库连接建立成功")
+                log_debug(f"数据库连接建立成功")
                 with conn.cursor() as cursor:
                     # 获取设备信息
                     device_info = DataQuery.get_device_info(cursor, device_id)
                     
                     if not device_info:
-                        print(f"[WARN] 未找到设备ID为 {device_id} 的设备")
+                        log_warn(f"未找到设备ID为 {device_id} 的设备")
                         return {"code": "404", "error": "设备未找到"}
-                    print(f"[INFO] 设备信息查询完成")
+                    log_debug(f"设备信息查询完成")
                     
-                    # 获取设备读数数据
-                    data_sql = """
-                        SELECT device_id, read_time, total_reading, remainingBalance
-                        FROM data WHERE device_id = %s ORDER BY read_time DESC LIMIT %s
-                    """
-                    print(f"[INFO] 查询设备读数数据，SQL: {data_sql.strip()}, 参数: ({device_id}, {data_num})")
-                    cursor.execute(data_sql, (device_id, data_num))
+                    # 获取设备读数数据，只要最新一条时直接按主键读取 device_latest
+                    if data_num == 1:
+                        data_sql = """
+                            SELECT device_id, read_time, total_reading, remainingBalance, diff_reading
+                            FROM device_latest WHERE device_id = %s
+                        """
+                        data_params = (device_id,)
+                    else:
+                        data_sql = """
+                            SELECT device_id, read_time, total_reading, remainingBalance, diff_reading
+                            FROM data WHERE device_id = %s ORDER BY read_time DESC LIMIT %s
+                        """
+                        data_params = (device_id, data_num)
+                    log_debug("查询设备读数数据，参数: %s", data_params)
+                    cursor.execute(data_sql, data_params)
                     data_results = cursor.fetchall()
-                    print(f"[INFO] 读数数据查询完成，获取到 {len(data_results)} 条记录")
+                    log_debug(f"读数数据查询完成，获取到 {len(data_results)} 条记录")
                     
                     # 构造返回数据
-                    rows = []
-                    for row in data_results:
-                        rows.append({
-                            "device_id": str(row[0]),
-                            "read_time": str(row[1]),
-                            "total_reading": str(row[2]),
-                            "remainingBalance": str(row[3])
-                        })
-                    
-                    response = {
-                        "equipmentName": device_info[0],
-                        "device_id": str(device_info[8]),
-                        "installationSite": device_info[1],
-                        "equipmentType": device_info[2],
-                        "ratio": str(device_info[3]),
-                        "rate": str(device_info[4]),
-                        "acctId": device_info[5],
-                        "status": str(device_info[6]),
-                        "updated_at": str(device_info[7]),
-                        "total": len(rows),
-                        "rows": rows,
-                        "code": 200
-                    }
-                    print(f"[INFO] 设备数据响应构建完成")
+                    response = format_device_data(device_info, data_results, format_reading_row,
+                                                  format_reading_columns, columnar)
+                    log_debug(f"设备数据响应构建完成")
                     return response
         except Exception as e:
-            print(f"[ERROR] 获取设备数据时出错: {str(e)}")
+            log_error(f"获取设备数据时出错: {str(e)}")
             traceback.print_exc()
             return {"code": "500", "error": f"数据库查询错误: {str(e)}"}
 
     @staticmethod
-    def search_devices(keyword):
-        """搜索设备接口"""
-        print(f"[INFO] 开始搜索设备，关键词: {keyword}")
+    def search_devices(keyword, page=1, page_size=DEFAULT_PAGE_SIZE):
+        """
+        搜索设备接口
+        
+        在内存搜索索引中查找名称或安装位置包含关键词的设备，按匹配程度排序后分页返回。
+        
+        Args:
+            keyword (str): 关键词
+            page (int): 页码，从1开始
+            page_size (int): 每页设备数
+        """
+        log_debug(f"开始搜索设备，关键词: {keyword}, 页码: {page}, 每页: {page_size}")
         # 检查关键词长度，2个字符以内包括两个字符不允许查询
         if len(keyword) < 2:
-            print(f"[INFO] 关键词长度不足，返回错误提示")
+            log_debug(f"关键词长度不足，返回错误提示")
             return {
                 "search_status": 1,
                 "error_talk": "请输入两个以上的字符。",
                 "code": 418
             }
         
-        try:
-            with DatabaseManager.get_connection() as conn:
-                print(f"[INFO] 数据库连接建立成功")
-                with conn.cursor() as cursor:
-                    # 搜索设备
-                    sql = """
-                        SELECT equipmentName, installationSite, id, equipmentType, status
-                        FROM device WHERE equipmentName LIKE %s OR installationSite LIKE %s
-                    """
-                    search_term = f"%{keyword}%"
-                    print(f"[INFO] 执行搜索查询，SQL: {sql.strip()}, 参数: ({search_term}, {search_term})")
-                    cursor.execute(sql, (search_term, search_term))
-                    results = cursor.fetchall()
-                    print(f"[INFO] 搜索完成，找到 {len(results)} 条记录")
-                    
-                    # 构造返回数据
-                    rows = []
-                    for row in results:
-                        rows.append({
-                            "equipmentName": row[0],
-                            "installationSite": row[1],
-                            "device_id": str(row[2]).strip(),
-                            "equipmentType": str(row[3]),
-                            "status": row[4]
-                        })
-                    
-                    response = {
-                        "search_status": 0,
-                        "total": len(rows),
-                        "rows": rows,
-                        "code": 200
-                    }
-                    print(f"[INFO] 搜索响应构建完成: total={len(rows)}")
-                    return response
-        except Exception as e:
-            print(f"[ERROR] 搜索设备时出错: {str(e)}")
-            traceback.print_exc()
-            return {"code": "500", "error": f"数据库查询错误: {str(e)}"}
+        index = device_search.get_index()
+        if index is None:
+            log_error(f"设备搜索索引尚未加载")
+            return {"code": "500", "error": "数据库查询错误: 设备搜索索引尚未加载"}
+        
+        total, results = index.search(keyword, (page - 1) * page_size, page_size)
+        log_debug(f"搜索完成，共匹配 {total} 个设备，本页 {len(results)} 个")
+        
+        # 构造返回数据
+        rows = []
+        for row in results:
+            rows.append({
+                "equipmentName": row[1],
+                "installationSite": row[2],
+                "device_id": str(row[0]).strip(),
+                "equipmentType": str(row[3]),
+                "status": row[4]
+            })
+        
+        response = {
+            "search_status": 0,
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "rows": rows,
+            "code": 200
+        }
+        log_debug(f"搜索响应构建完成: total={total}")
+        return response
 
     @staticmethod
-    def get_device_daily_range_data(device_id, start_day, end_day):
-        """检查设备每日最后数据接口"""
-        print(f"[INFO] 开始获取设备每日数据，设备ID: {device_id}, 开始日期: {start_day}, 结束日期: {end_day}")
+    def suggest_sites(prefix, limit=DEFAULT_SUGGEST_LIMIT):
+        """
+        安装位置输入联想接口
+        
+        在内存索引的有序位置数组中二分查找前缀，不访问数据库，也不经过响应缓存。
+        
+        Args:
+            prefix (str): 用户已输入的前缀
+            limit (int): 最多返回的位置数
+        """
+        index = device_search.get_index()
+        if index is None:
+            log_error(f"设备搜索索引尚未加载")
+            return {"code": "500", "error": "数据库查询错误: 设备搜索索引尚未加载"}
+        
+        more, results = index.suggest(prefix, limit)
+        log_debug(f"输入联想完成，前缀: {prefix}, 返回 {len(results)} 个位置")
+        return {
+            "prefix": prefix,
+            "more": more,
+            "rows": [{"installationSite": site, "device_count": count} for site, count in results],
+            "code": 200
+        }
+
+    @staticmethod
+    def get_device_daily_range_data(device_id, start_day, end_day, columnar=False):
+        """检查设备每日最后数据接口，columnar 为 True 时读数按列返回"""
+        log_debug(f"开始获取设备每日数据，设备ID: {device_id}, 开始日期: {start_day}, 结束日期: {end_day}")
         try:
             with DatabaseManager.get_connection() as conn:
-                print(f"[INFO] 数据库连接建立成功")
+                log_debug(f"数据库连接建立成功")
                 with conn.cursor() as cursor:
                     # 获取设备信息
                     device_info = DataQuery.get_device_info(cursor, device_id)
                     
                     if not device_info:
-                        print(f"[WARN] 未找到设备ID为 {device_id} 的设备")
+                        log_warn(f"未找到设备ID为 {device_id} 的设备")
                         return {"code": "404", "error": "设备未找到"}
-                    print(f"[INFO] 设备信息查询完成")
+                    log_debug(f"设备信息查询完成")
                     
-                    # 获取设备每日最后读数数据
+                    # 从日汇总表按主键范围读取设备每日最后读数
                     data_sql = """
-                        SELECT device_id, DATE(read_time) as read_date, 
-                               SUBSTRING_INDEX(GROUP_CONCAT(read_time ORDER BY read_time DESC), ',', 1) as last_read_time,
-                               SUBSTRING_INDEX(GROUP_CONCAT(total_reading ORDER BY read_time DESC), ',', 1) as last_total_reading,
-                               SUBSTRING_INDEX(GROUP_CONCAT(remainingBalance ORDER BY read_time DESC), ',', 1) as last_remaining_balance
-                        FROM data 
-                        WHERE device_id = %s AND DATE(read_time) BETWEEN %s AND %s
-                        GROUP BY device_id, DATE(read_time)
+                        SELECT device_id, read_date, last_read_time, last_total_reading, last_remaining_balance,
+                               daily_usage, topup_amount
+                        FROM data_daily
+                        WHERE device_id = %s AND read_date BETWEEN %s AND %s
                         ORDER BY read_date DESC
                     """
-                    print(f"[INFO] 查询设备每日最后读数数据，SQL: {data_sql.strip()}, 参数: ({device_id}, {start_day}, {end_day})")
+                    log_debug("查询设备每日最后读数数据，参数: (%s, %s, %s)", device_id, start_day, end_day)
                     cursor.execute(data_sql, (device_id, start_day, end_day))
                     data_results = cursor.fetchall()
-                    print(f"[INFO] 读数数据查询完成，获取到 {len(data_results)} 条记录")
+                    log_debug(f"读数数据查询完成，获取到 {len(data_results)} 条记录")
                     
                     # 构造返回数据
-                    rows = []
-                    for row in data_results:
-                        rows.append({
-                            "device_id": str(row[0]),
-                            "read_time": str(row[2]),
-                            "total_reading": str(row[3]),
-                            "remainingBalance": str(row[4])
-                        })
+                    response = format_device_data(device_info, data_results, format_daily_row,
+                                                  format_daily_columns, columnar)
+                    log_debug(f"设备每日数据响应构建完成")
+                    return response
+        except Exception as e:
+            log_error(f"获取设备每日数据时出错: {str(e)}")
+            traceback.print_exc()
+            return {"code": "500", "error": f"数据库查询错误: {str(e)}"}
+
+    @staticmethod
+    def get_devices_data(device_ids, data_num=None, start_day=None, end_day=None, columnar=False):
+        """
+        批量检查设备数据接口
+        
+        所有设备的信息用一条 IN 查询获取，读数也只用一条查询：最新一条读数按主键读取 device_latest，
+        多条读数把每个设备的 ORDER BY ... LIMIT 子查询用 UNION ALL 合并（每个子查询都走
+        (device_id, read_time) 唯一索引），日期模式按主键范围读取 data_daily 日汇总表。
+        
+        Args:
+            device_ids (list): 设备ID列表
+            data_num (int): 每个设备返回的读数条数，日期模式时为 None
+            start_day (str): 开始日期 YYYY-MM-DD，数据条数模式时为 None
+            end_day (str): 结束日期 YYYY-MM-DD
+            columnar (bool): 是否按列返回读数
+        
+        Returns:
+            dict: {"code": 200, "total": 找到的设备数, "devices": {设备ID: 与单个设备接口相同的数据}, "missing": [未找到的设备ID]}
+        """
+        log_debug(f"开始批量获取设备数据，设备数: {len(device_ids)}, 数据数量: {data_num}, 日期: {start_day} ~ {end_day}")
+        placeholders = ', '.join(['%s'] * len(device_ids))
+        try:
+            with DatabaseManager.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    device_sql = f"""
+                        SELECT equipmentName, installationSite, equipmentType, ratio, rate, acctId, status, updated_at, id
+                        FROM device WHERE id IN ({placeholders})
+                    """
+                    cursor.execute(device_sql, device_ids)
+                    device_infos = {str(device_info[8]): device_info for device_info in cursor.fetchall()}
+                    log_debug(f"设备信息查询完成，找到 {len(device_infos)} 个设备")
+                    
+                    found_ids = [device_id for device_id in device_ids if device_id in device_infos]
+                    devices = {}
+                    if found_ids:
+                        devices = DataQuery.fill_batch_rows(cursor, device_infos, found_ids, data_num,
+                                                            start_day, end_day, columnar)
                     
                     response = {
-                        "equipmentName": device_info[0],
-                        "device_id": str(device_info[8]),
-                        "installationSite": device_info[1],
-                        "equipmentType": device_info[2],
-                        "ratio": str(device_info[3]),
-                        "rate": str(device_info[4]),
-                        "acctId": device_info[5],
-                        "status": str(device_info[6]),
-                        "updated_at": str(device_info[7]),
-                        "total": len(rows),
-                        "rows": rows,
-                        "code": 200
+                        "code": 200,
+                        "total": len(devices),
+                        "devices": devices,
+                        "missing": [device_id for device_id in device_ids if device_id not in devices]
                     }
-                    print(f"[INFO] 设备每日数据响应构建完成")
+                    log_debug(f"批量设备数据响应构建完成")
                     return response
         except Exception as e:
-            print(f"[ERROR] 获取设备每日数据时出错: {str(e)}")
+            log_error(f"批量获取设备数据时出错: {str(e)}")
             traceback.print_exc()
             return {"code": "500", "error": f"数据库查询错误: {str(e)}"}
+    
+    @staticmethod
+    def fill_batch_rows(cursor, device_infos, device_ids, data_num, start_day, end_day, columnar=False):
+        """
+        用一条查询获取所有设备的读数
+        
+        Returns:
+            dict: {设备ID: 与单个设备接口相同的数据}，顺序与 device_ids 一致
+        """
+        placeholders = ', '.join(['%s'] * len(device_ids))
+        if start_day is not None:
+            data_sql = f"""
+                SELECT device_id, read_date, last_read_time, last_total_reading, last_remaining_balance,
+                       daily_usage, topup_amount
+                FROM data_daily
+                WHERE device_id IN ({placeholders}) AND read_date BETWEEN %s AND %s
+                ORDER BY device_id, read_date DESC
+            """
+            cursor.execute(data_sql, list(device_ids) + [start_day, end_day])
+            results = cursor.fetchall()
+            format_row, format_columns = format_daily_row, format_daily_columns
+        else:
+            if data_num == 1:
+                data_sql = f"""
+                    SELECT device_id, read_time, total_reading, remainingBalance, diff_reading
+                    FROM device_latest WHERE device_id IN ({placeholders})
+                """
+                data_params = list(device_ids)
+            else:
+                data_sql = " UNION ALL ".join(
+                    ["""(SELECT device_id, read_time, total_reading, remainingBalance, diff_reading
+                         FROM data WHERE device_id = %s ORDER BY read_time DESC LIMIT %s)"""] * len(device_ids)
+                )
+                data_params = [param for device_id in device_ids for param in (device_id, data_num)]
+            cursor.execute(data_sql, data_params)
+            # UNION ALL 不保证结果顺序，按读表时间倒序排列，与单个设备接口一致
+            results = sorted(cursor.fetchall(), key=lambda r: r[1], reverse=True)
+            format_row, format_columns = format_reading_row, format_reading_columns
+        
+        device_rows = {device_id: [] for device_id in device_ids}
+        for row in results:
+            device_rows[str(row[0])].append(row)
+        return {
+            device_id: format_device_data(device_infos[device_id], rows, format_row, format_columns, columnar)
+            for device_id, rows in device_rows.items()
+        }
 
-# 并行获取多个设备数据
-def get_multiple_device_data(device_ids, data_num):
-    def fetch_device_data(device_id):
-        return device_id, DataQuery.get_device_data(device_id, data_num)
+# 并发HTTP服务器
+class BoundedThreadingHTTPServer(ThreadingHTTPServer):
+    """
+    每个连接一个线程、线程数有上限的HTTP服务器
+    
+    处理线程都在忙时accept循环阻塞等待，新连接在内核的监听队列中排队，不会无限制地创建线程；
+    一个慢查询只占用自己的线程，不再阻塞其他访问者。
+    """
+    daemon_threads = True
+    request_queue_size = 128
+    
+    def __init__(self, server_address, handler_class, max_workers=SERVER_MAX_WORKERS):
+        self.max_workers = max_workers
+        self.worker_slots = threading.BoundedSemaphore(max_workers)
+        self.active_lock = threading.Lock()
+        self.active_connections = 0
+        super().__init__(server_address, handler_class)
+    
+    def process_request(self, request, client_address):
+        """等到有空闲的处理线程名额后再为连接启动线程"""
+        self.worker_slots.acquire()
+        with self.active_lock:
+            self.active_connections += 1
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self.release_worker()
+            raise
     
-    # 使用线程池并行获取设备数据
-    futures = [executor.submit(fetch_device_data, device_id) for device_id in device_ids]
-    results = {}
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.release_worker()
     
-    for future in futures:
-        device_id, data = future.result()
-        results[device_id] = data
+    def release_worker(self):
+        with self.active_lock:
+            self.active_connections -= 1
+        self.worker_slots.release()
     
-    return results
+    def saturated(self):
+        """处理线程名额是否已用完"""
+        with self.active_lock:
+            return self.active_connections >= self.max_workers
 
 # HTTP请求处理器
 class RequestHandler(BaseHTTPRequestHandler):
+    # 使用 HTTP/1.1 keep-alive，同一连接上的后续请求不必重新建立TCP连接
+    protocol_version = 'HTTP/1.1'
+    # 空闲连接超时后关闭，释放处理线程
+    timeout = KEEPALIVE_TIMEOUT
+    # 响应头和响应体分两次写出，keep-alive 连接上需要关闭 Nagle 算法，否则会与客户端的延迟确认叠加出约40ms的等待
+    disable_nagle_algorithm = True
+    
+    def cached_query(self, key, device_ids, func, *args, **kwargs):
+        """
+        带缓存地执行查询
+        
+        版本号在查询前读取，查询期间入库的新读数会使这条记录在下次读取时失效。
+        
+        Args:
+            key (tuple): 缓存键（接口和规范化后的参数）
+            device_ids (list): 响应涉及的设备ID，其版本号变化时缓存失效
+            func (callable): 未命中时执行的查询函数
+        
+        Returns:
+            dict: 响应数据
+        """
+        versions = device_versions.get(device_ids)
+        entry = response_cache.get(key, versions)
+        if entry is not None:
+            log_debug("命中响应缓存: %s", key)
+        else:
+            data = func(*args, **kwargs)
+            if data.get('code') != 200:
+                return data
+            with phase('serialize'):
+                body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            # 最后修改时间取涉及设备中最新的版本号，没有读数时取当前时间
+            stamps = [version for version in versions.values() if version]
+            last_modified = datetime.fromisoformat(max(stamps)).timestamp() if stamps else time.time()
+            entry = CacheEntry(data, body, versions, last_modified)
+            response_cache.put(key, entry)
+        self.cache_entry = entry
+        return entry.data
+    
+    def not_modified(self, entry, encoding):
+        """客户端缓存的版本（按 encoding 压缩的表示）是否仍然有效"""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            etag = entry.etag_for(encoding)
+            return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                return int(entry.last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+    
+    def metrics_text(self):
+        """Prometheus 文本格式的请求耗时指标、响应缓存指标和连接池指标"""
+        stats = response_cache.stats()
+        lines = render_gauges('response_cache_entries', '响应缓存条目数', [((), stats['entries'])])
+        lines += render_gauges('response_cache_bytes', '响应缓存占用字节数', [((), stats['bytes'])])
+        lines += render_gauges('response_cache_events_total', '响应缓存计数',
+                               [((('event', name),), value) for name, value in sorted(stats['counters'].items())],
+                               metric_type='counter')
+        return render_prometheus(lines + db_pool.metric_lines())
+    
+    def log_message(self, format, *args):
+        """访问日志只在 DEBUG 级别输出，每个请求的汇总由 finish_request 输出"""
+        log_debug("%s - %s", self.address_string(), format % args)
+    
     def do_GET(self):
+        timer = start_request()
         # 获取真实客户端IP
         real_ip = self.headers.get('X-Real-IP') or self.headers.get('X-Forwarded-For') or self.client_address[0]
-        print(f"[INFO] 收到GET请求 from {real_ip}: {self.path}")
+        log_debug("收到GET请求 from %s: %s", real_ip, self.path)
         response_data = {"code": "400", "error": "请求参数错误"}
+        response_body = b''
+        # 同一 keep-alive 连接上的请求共用一个处理器实例，每次请求都要重置
+        self.cache_entry = None
+        metrics_body = None
         try:
             # 解析URL和参数
             parsed_url = urlparse(self.path)
             params = parse_qs(parsed_url.query)
-            print(f"[INFO] 解析参数完成: {params}")
+            log_debug("解析参数完成: %s", params)
             
             # 处理不同模式的请求
             mode = params.get('mode', [None])[0]
-            print(f"[INFO] 请求模式: {mode}")
+            log_debug(f"请求模式: {mode}")
+            timer.endpoint = mode if mode in ENDPOINTS else 'other'
+            data_format = params.get('format', ['rows'])[0]
+            columnar = data_format == 'columnar'
             
-            if mode == 'first_screen':
+            if parsed_url.path == '/metrics':
+                # 请求耗时、响应缓存和连接池指标，默认为 Prometheus 文本格式，format=json 时返回响应缓存和连接池指标
+                timer.endpoint = 'metrics'
+                if params.get('format', [None])[0] == 'json':
+                    response_data = {"code": 200, "cache": response_cache.stats(), "pool": db_pool.stats()}
+                else:
+                    metrics_body = self.metrics_text()
+                    response_data = {"code": 200}
+            elif mode in DATA_MODES and data_format not in DATA_FORMATS:
+                log_warn(f"无效的format参数: {data_format}")
+                response_data = {"code": "400", "error": f"无效的format参数({'/'.join(DATA_FORMATS)})"}
+            elif mode == 'first_screen':
                 # 首屏数据
-                print("[INFO] 处理首屏数据请求")
+                log_debug("处理首屏数据请求")
                 response_data = DataQuery.get_first_screen_data()
             elif mode == 'check':
                 # 检查设备数据
                 device_id = params.get('device_id', [None])[0]
                 data_num = params.get('data_num', [None])[0]  # 不再设置默认值
-                print(f"[INFO] 处理设备检查请求，设备ID: {device_id}, 数据量: {data_num}")
+                log_debug(f"处理设备检查请求，设备ID: {device_id}, 数据量: {data_num}")
                 if device_id and data_num:  # 必须同时提供device_id和data_num
                     device_id = device_id.strip()  # 去除首尾空格
                     # 验证device_id格式（允许字母、数字和下划线，限制长度）
                     if not re.match(r'^[a-zA-Z0-9_]+$', device_id) or len(device_id) > 50:
-                        print(f"[WARN] 无效的device_id参数: {device_id}")
+                        log_warn(f"无效的device_id参数: {device_id}")
                         response_data = {"code": "400", "error": "无效的device_id参数"}
                     else:
                         # 验证data_num是否为有效数字
                         try:
                             num = int(data_num)
                             if num < 1 or num > 1000:  # 限制数据量范围
-                                print(f"[WARN] data_num参数超出范围: {num}")
+                                log_warn(f"data_num参数超出范围: {num}")
                                 response_data = {"code": "400", "error": "data_num参数超出范围(1-1000)"}
                             else:
-                                response_data = DataQuery.get_device_data(device_id, num)
+                                response_data = self.cached_query(('check', device_id, num, data_format), [device_id],
+                                                                  DataQuery.get_device_data, device_id, num, columnar)
                         except ValueError:
-                            print(f"[WARN] 无效的data_num参数: {data_num}")
+                            log_warn(f"无效的data_num参数: {data_num}")
                             response_data = {"code": "400", "error": "无效的data_num参数"}
                 else:
-                    print("[WARN] 缺少device_id参数")
+                    log_warn("缺少device_id参数")
                     response_data = {"code": "400", "error": "缺少device_id参数"}
             elif mode == 'check_daily_range':
                 # 检查设备每日最后数据
                 device_id = params.get('device_id', [None])[0]
                 start_day = params.get('start_day', [None])[0]
                 end_day = params.get('end_day', [None])[0]
-                print(f"[INFO] 处理设备每日数据请求，设备ID: {device_id}, 开始日期: {start_day}, 结束日期: {end_day}")
+                log_debug(f"处理设备每日数据请求，设备ID: {device_id}, 开始日期: {start_day}, 结束日期: {end_day}")
                 if device_id and start_day and end_day:
                     device_id = device_id.strip()  # 去除首尾空格
                     # 验证device_id格式（允许字母、数字和下划线，限制长度）
                     if not re.match(r'^[a-zA-Z0-9_]+$', device_id) or len(device_id) > 50:
-                        print(f"[WARN] 无效的device_id参数: {device_id}")
+                        log_warn(f"无效的device_id参数: {device_id}")
                         response_data = {"code": "400", "error": "无效的device_id参数"}
                     else:
                         # 使用datetime模块验证日期格式和有效性
@@ -431,61 +857,200 @@ class RequestHandler(BaseHTTPRequestHandler):
                             start_date = datetime.strptime(start_day, '%Y-%m-%d').date()
                             end_date = datetime.strptime(end_day, '%Y-%m-%d').date()
                             if start_date > end_date:
-                                print(f"[WARN] 开始日期 {start_day} 晚于结束日期 {end_day}")
+                                log_warn(f"开始日期 {start_day} 晚于结束日期 {end_day}")
                                 response_data = {"code": "400", "error": "开始日期不能晚于结束日期"}
                             else:
-                                response_data = DataQuery.get_device_daily_range_data(device_id, start_day, end_day)
+                                response_data = self.cached_query(('check_daily_range', device_id, start_day, end_day, data_format),
+                                                                  [device_id], DataQuery.get_device_daily_range_data,
+                                                                  device_id, start_day, end_day, columnar)
                         except ValueError:
-                            print(f"[WARN] 日期格式不正确，应为YYYY-MM-DD")
+                            log_warn(f"日期格式不正确，应为YYYY-MM-DD")
                             response_data = {"code": "400", "error": "日期格式不正确，应为YYYY-MM-DD"}
                 else:
-                    print("[WARN] 缺少必要参数 device_id, start_day 或 end_day")
+                    log_warn("缺少必要参数 device_id, start_day 或 end_day")
                     response_data = {"code": "400", "error": "缺少必要参数 device_id, start_day 或 end_day"}
+            elif mode == 'check_batch':
+                # 批量检查设备数据，提供 data_num 时按数据条数，提供 start_day 和 end_day 时按日期
+                device_ids_param = params.get('device_ids', [None])[0]
+                data_num = params.get('data_num', [None])[0]
+                start_day = params.get('start_day', [None])[0]
+                end_day = params.get('end_day', [None])[0]
+                log_debug(f"处理批量设备检查请求，设备ID: {device_ids_param}, 数据量: {data_num}, 日期: {start_day} ~ {end_day}")
+                # 去除首尾空格和重复ID，保持请求中的顺序
+                device_ids = list(dict.fromkeys(
+                    device_id.strip() for device_id in (device_ids_param or '').split(',') if device_id.strip()
+                ))
+                if not device_ids:
+                    log_warn("缺少device_ids参数")
+                    response_data = {"code": "400", "error": "缺少device_ids参数"}
+                elif len(device_ids) > BATCH_MAX_DEVICES:
+                    log_warn(f"device_ids数量超出范围: {len(device_ids)}")
+                    response_data = {"code": "400", "error": f"device_ids数量超出范围(1-{BATCH_MAX_DEVICES})"}
+                elif any(not re.match(r'^[a-zA-Z0-9_]+$', device_id) or len(device_id) > 50 for device_id in device_ids):
+                    log_warn(f"无效的device_ids参数: {device_ids_param}")
+                    response_data = {"code": "400", "error": "无效的device_ids参数"}
+                elif data_num:
+                    try:
+                        num = int(data_num)
+                        if num < 1 or num > 1000:  # 限制数据量范围
+                            log_warn(f"data_num参数超出范围: {num}")
+                            response_data = {"code": "400", "error": "data_num参数超出范围(1-1000)"}
+                        else:
+                            response_data = self.cached_query(('check_batch', tuple(device_ids), num, data_format), device_ids,
+                                                              DataQuery.get_devices_data, device_ids, data_num=num,
+                                                              columnar=columnar)
+                    except ValueError:
+                        log_warn(f"无效的data_num参数: {data_num}")
+                        response_data = {"code": "400", "error": "无效的data_num参数"}
+                elif start_day and end_day:
+                    try:
+                        start_date = datetime.strptime(start_day, '%Y-%m-%d').date()
+                        end_date = datetime.strptime(end_day, '%Y-%m-%d').date()
+                        if start_date > end_date:
+                            log_warn(f"开始日期 {start_day} 晚于结束日期 {end_day}")
+                            response_data = {"code": "400", "error": "开始日期不能晚于结束日期"}
+                        else:
+                            response_data = self.cached_query(('check_batch_daily', tuple(device_ids), start_day, end_day, data_format),
+                                                              device_ids, DataQuery.get_devices_data, device_ids,
+                                                              start_day=start_day, end_day=end_day, columnar=columnar)
+                    except ValueError:
+                        log_warn(f"日期格式不正确，应为YYYY-MM-DD")
+                        response_data = {"code": "400", "error": "日期格式不正确，应为YYYY-MM-DD"}
+                else:
+                    log_warn("缺少必要参数 data_num 或 start_day, end_day")
+                    response_data = {"code": "400", "error": "缺少必要参数 data_num 或 start_day, end_day"}
             elif mode == 'search':
                 # 搜索设备
                 keyword = params.get('key_word', [None])[0]
-                print(f"[INFO] 处理搜索设备请求，关键词: {keyword}")
+                page = params.get('page', ['1'])[0]
+                page_size = params.get('page_size', [str(DEFAULT_PAGE_SIZE)])[0]
+                log_debug(f"处理搜索设备请求，关键词: {keyword}, 页码: {page}, 每页: {page_size}")
                 if keyword:
                     # 验证keyword是否为有效格式，只允许字母、数字和中文
                     if not isinstance(keyword, str) or len(keyword) > 50 or not re.match(r'^[a-zA-Z0-9\u4e00-\u9fa5\s]+$', keyword):
-                        print(f"[WARN] 搜索关键词包含非法字符: {keyword}")
+                        log_warn(f"搜索关键词包含非法字符: {keyword}")
                         response_data = {"code": "400", "error": "搜索关键词包含非法字符"}
                     else:
-                        response_data = DataQuery.search_devices(keyword)
+                        # 验证分页参数
+                        try:
+                            page = int(page)
+                            page_size = int(page_size)
+                            if page < 1 or page_size < 1 or page_size > SEARCH_MAX_PAGE_SIZE:
+                                log_warn(f"分页参数超出范围: page={page}, page_size={page_size}")
+                                response_data = {"code": "400", "error": f"分页参数超出范围(page>=1, page_size 1-{SEARCH_MAX_PAGE_SIZE})"}
+                            else:
+                                response_data = self.cached_query(('search', keyword, page, page_size), [],
+                                                                  DataQuery.search_devices, keyword, page, page_size)
+                        except ValueError:
+                            log_warn(f"无效的分页参数: page={page}, page_size={page_size}")
+                            response_data = {"code": "400", "error": "无效的分页参数"}
                 else:
-                    print("[WARN] 缺少key_word参数")
+                    log_warn("缺少key_word参数")
                     response_data = {"code": "400", "error": "缺少key_word参数"}
+            elif mode == 'suggest':
+                # 安装位置输入联想，前端在用户输入时调用
+                prefix = params.get('prefix', [None])[0]
+                limit = params.get('limit', [str(DEFAULT_SUGGEST_LIMIT)])[0]
+                if prefix and prefix.strip():
+                    # 与搜索关键词相同的字符限制，允许单个字符
+                    if len(prefix) > 50 or not re.match(r'^[a-zA-Z0-9\u4e00-\u9fa5\s\uff10-\uff19\uff21-\uff3a\uff41-\uff5a]+$', prefix):
+                        log_warn(f"联想前缀包含非法字符: {prefix}")
+                        response_data = {"code": "400", "error": "联想前缀包含非法字符"}
+                    else:
+                        try:
+                            limit = int(limit)
+                            if limit < 1 or limit > SUGGEST_MAX_LIMIT:
+                                log_warn(f"limit参数超出范围: {limit}")
+                                response_data = {"code": "400", "error": f"limit参数超出范围(1-{SUGGEST_MAX_LIMIT})"}
+                            else:
+                                response_data = DataQuery.suggest_sites(prefix, limit)
+                        except ValueError:
+                            log_warn(f"无效的limit参数: {limit}")
+                            response_data = {"code": "400", "error": "无效的limit参数"}
+                else:
+                    log_warn("缺少prefix参数")
+                    response_data = {"code": "400", "error": "缺少prefix参数"}
             else:
-                print(f"[WARN] 无效的mode参数: {mode}")
+                log_warn(f"无效的mode参数: {mode}")
                 response_data = {"code": "400", "error": "无效的mode参数"}
             
-            print(f"[INFO] 请求处理完成，响应数据: {response_data.get('code', 'N/A')}")
+            log_debug(f"请求处理完成，响应数据: {response_data.get('code', 'N/A')}")
         except Exception as e:
-            print(f"[ERROR] 处理请求时出错: {str(e)}")
+            log_error(f"处理请求时出错: {str(e)}")
             traceback.print_exc()
             response_data = {"code": "500", "error": f"服务器内部错误: {str(e)}"}
         finally:
+            code = response_data.get('code', 'N/A')
             try:
-                # 设置响应头
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')  # 允许跨域
-                self.end_headers()
+                entry = self.cache_entry
+                content_type = 'application/json'
+                if metrics_body is not None:
+                    entry = None
+                    response_body = metrics_body
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif entry is not None and entry.data is response_data:
+                    # 缓存的响应体已经编码好，不必再次序列化
+                    response_body = entry.body
+                else:
+                    entry = None
+                    with phase('serialize'):
+                        response_body = json.dumps(response_data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+                
+                # 处理线程名额用完时本次响应后关闭连接，让排队中的新连接尽快得到处理
+                if self.server.saturated():
+                    self.close_connection = True
+                
+                # 客户端支持时压缩较大的响应体，缓存记录的压缩结果随记录一起缓存
+                encoding = choose_encoding(self.headers.get('Accept-Encoding'), len(response_body))
                 
-                # 发送响应
-                response_str = json.dumps(response_data, ensure_ascii=False)
-                print(f"[INFO] 发送响应，响应长度: {len(response_str)}")
-                self.wfile.write(response_str.encode('utf-8'))
+                # 客户端持有的版本仍然有效时返回 304，不发送响应体
+                not_modified = entry is not None and self.not_modified(entry, encoding)
+                if not_modified:
+                    response_cache.record_not_modified()
+                    response_body = b''
+                    code = 304
+                elif encoding is not None:
+                    with phase('compress'):
+                        if entry is not None:
+                            response_body = response_cache.encoded_body(entry, encoding)
+                        else:
+                            response_body = compress_body(response_body, encoding)
                 
-                # 确保数据发送完成
-                self.wfile.flush()
-                print("[INFO] 响应发送完成")
+                with phase('write'):
+                    # 设置响应头，keep-alive 需要 Content-Length 才能确定响应结束位置
+                    self.send_response(304 if not_modified else 200)
+                    self.send_header('Content-type', content_type)
+                    if not not_modified:
+                        self.send_header('Content-Length', str(len(response_body)))
+                        if encoding is not None:
+                            self.send_header('Content-Encoding', encoding)
+                    # 同一URL的响应体随 Accept-Encoding 不同，中间代理和浏览器要分别缓存
+                    self.send_header('Vary', 'Accept-Encoding')
+                    self.send_header('Access-Control-Allow-Origin', '*')  # 允许跨域
+                    if entry is not None:
+                        # 浏览器每次使用前都带 ETag 重新验证，数据未变化时只需一个 304
+                        self.send_header('ETag', entry.etag_for(encoding))
+                        self.send_header('Last-Modified', formatdate(entry.last_modified, usegmt=True))
+                        self.send_header('Cache-Control', 'no-cache')
+                    if self.close_connection:
+                        self.send_header('Connection', 'close')
+                    self.end_headers()
+                    
+                    # 发送响应
+                    log_debug("发送响应，响应长度: %s", len(response_body))
+                    self.wfile.write(response_body)
+                    
+                    # 确保数据发送完成
+                    self.wfile.flush()
+                log_debug("响应发送完成")
             except Exception as e:
-                print(f"[ERROR] 发送响应时出错: {str(e)}")
+                log_error(f"发送响应时出错: {str(e)}")
                 # 不要在这里抛出异常，避免影响连接释放
+            # 每个请求输出一行耗时汇总，并计入 /metrics 的直方图
+            finish_request(timer, code, f"bytes={len(response_body)}")
 
 # 启动服务器
 if __name__ == '__main__':
-    server = HTTPServer(('', SERVER_PORT), RequestHandler)
-    print(f"服务器启动，监听端口 {SERVER_PORT}")
+    server = BoundedThreadingHTTPServer(('', SERVER_PORT), RequestHandler)
+    print(f"服务器启动，监听端口 {SERVER_PORT}，最多同时处理 {SERVER_MAX_WORKERS} 个连接，keep-alive 空闲超时 {KEEPALIVE_TIMEOUT} 秒")
     server.serve_forever()
\ No newline at end of file
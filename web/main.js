@@ -642,6 +642,33 @@ function initSearch() {
         }
     });
     
+    // 输入时防抖请求安装位置联想
+    searchInput.addEventListener('input', function() {
+        clearTimeout(suggestTimer);
+        suggestTimer = setTimeout(() => updateSuggestions(searchInput.value), SUGGEST_DEBOUNCE_MS);
+    });
+    
+    // 上下键选择联想项，回车前把选中的位置填入搜索框，Esc 关闭列表
+    searchInput.addEventListener('keydown', function(e) {
+        const items = document.querySelectorAll('#search-suggestions li');
+        if (document.getElementById('search-suggestions').hidden || items.length === 0) {
+            return;
+        }
+        if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+            e.preventDefault();
+            const step = e.key === 'ArrowDown' ? 1 : -1;
+            suggestActiveIndex = (suggestActiveIndex + step + items.length) % items.length;
+            items.forEach((item, i) => item.classList.toggle('active', i === suggestActiveIndex));
+        } else if (e.key === 'Enter' && suggestActiveIndex >= 0) {
+            searchInput.value = items[suggestActiveIndex].dataset.site;
+        } else if (e.key === 'Escape') {
+            hideSuggestions();
+        }
+    });
+    
+    // 失去焦点时关闭列表（联想项用 mousedown 选择，先于 blur 触发）
+    searchInput.addEventListener('blur', hideSuggestions);
+    
     // 监听返回首页按钮点击
     const homeBtn = document.getElementById('home-btn');
     if (homeBtn) {
@@ -659,12 +686,135 @@ function initSearch() {
 function performSearch() {
     const keyword = document.getElementById('search-input').value.trim();
     
+    // 提交搜索后不再显示联想
+    clearTimeout(suggestTimer);
+    suggestSeq++;
+    hideSuggestions();
+    
     if (keyword) {
         // 发送搜索请求
         searchDevices(keyword);
     }
 }
 
+// 输入联想：停止输入多久后发送请求（毫秒）、每次返回的位置数、客户端缓存的前缀数上限
+const SUGGEST_DEBOUNCE_MS = 200;
+const SUGGEST_LIMIT = 10;
+const SUGGEST_CACHE_SIZE = 200;
+
+// 前缀 -> {more, rows}，按最近使用顺序排列
+const suggestCache = new Map();
+let suggestTimer = null;
+// 每次请求递增，只渲染最后一次请求的结果，先发后到的旧响应直接丢弃
+let suggestSeq = 0;
+let suggestActiveIndex = -1;
+
+// 与服务端 device_index.suggest_key 相同的规范化：全角转半角、统一大小写、去掉空白
+function normalizeSuggestKey(text) {
+    return text.normalize('NFKC').toLowerCase().replace(/\s+/g, '');
+}
+
+// 从客户端缓存取联想结果：命中同一前缀，或者命中一个已经返回全部匹配（more=false）的更短前缀时在本地过滤
+function getCachedSuggestions(key) {
+    if (suggestCache.has(key)) {
+        const result = suggestCache.get(key);
+        // 移到末尾，淘汰时保留最近使用的前缀
+        suggestCache.delete(key);
+        suggestCache.set(key, result);
+        return result;
+    }
+    for (let length = key.length - 1; length > 0; length--) {
+        const shorter = suggestCache.get(key.slice(0, length));
+        if (shorter && !shorter.more) {
+            return {
+                more: false,
+                rows: shorter.rows.filter(row => normalizeSuggestKey(row.installationSite).startsWith(key))
+            };
+        }
+    }
+    return null;
+}
+
+function cacheSuggestions(key, result) {
+    suggestCache.set(key, result);
+    if (suggestCache.size > SUGGEST_CACHE_SIZE) {
+        suggestCache.delete(suggestCache.keys().next().value);
+    }
+}
+
+// 根据输入框内容更新联想列表
+async function updateSuggestions(text) {
+    const key = normalizeSuggestKey(text);
+    const seq = ++suggestSeq;
+    if (!key || key.length > 50) {
+        hideSuggestions();
+        return;
+    }
+    
+    let result = getCachedSuggestions(key);
+    if (!result) {
+        try {
+            const apiUrl = getApiUrl('main');
+            const response = await fetchWithTimeout(`${apiUrl}/?mode=suggest&prefix=${encodeURIComponent(text.trim())}&limit=${SUGGEST_LIMIT}`);
+            const data = await response.json();
+            if (data.code !== 200) {
+                // 非法字符等情况不提示，用户仍可以直接搜索
+                hideSuggestions();
+                return;
+            }
+            result = {more: data.more, rows: data.rows};
+            cacheSuggestions(key, result);
+        } catch (error) {
+            console.error('获取输入联想失败:', error);
+            return;
+        }
+    }
+    
+    // 等待响应期间用户继续输入或已经提交搜索
+    if (seq === suggestSeq) {
+        renderSuggestions(result.rows);
+    }
+}
+
+// 渲染联想列表
+function renderSuggestions(rows) {
+    const list = document.getElementById('search-suggestions');
+    list.innerHTML = '';
+    suggestActiveIndex = -1;
+    if (rows.length === 0) {
+        list.hidden = true;
+        return;
+    }
+    rows.forEach(row => {
+        const item = document.createElement('li');
+        item.dataset.site = row.installationSite;
+        const site = document.createElement('span');
+        site.textContent = row.installationSite;
+        const count = document.createElement('span');
+        count.className = 'suggest-count';
+        count.textContent = `${row.device_count} 个设备`;
+        item.appendChild(site);
+        item.appendChild(count);
+        // 用 mousedown 而不是 click，在输入框失去焦点关闭列表之前选中
+        item.addEventListener('mousedown', function(e) {
+            e.preventDefault();
+            document.getElementById('search-input').value = row.installationSite;
+            performSearch();
+        });
+        list.appendChild(item);
+    });
+    list.hidden = false;
+}
+
+function hideSuggestions() {
+    const list = document.getElementById('search-suggestions');
+    if (list) {
+        list.hidden = true;
+        list.innerHTML = '';
+    }
+    suggestActiveIndex = -1;
+}
+
 // 初始化模态框
 function initModal() {
     const modals = document.querySelectorAll('.modal');
@@ -878,6 +1028,9 @@ async function loadFirstScreenData() {
     }
 }
 
+// 批量接口一次最多查询的设备数（与 server.py 的 BATCH_MAX_DEVICES 一致）
+const BATCH_MAX_DEVICES = 100;
+
 // 为设备ID列表加载数据
 async function loadDeviceDataForIds(deviceIds, totalNum = deviceIds.length) {
     const cardsContainer = document.getElementById('cards-container');
@@ -886,56 +1039,93 @@ async function loadDeviceDataForIds(deviceIds, totalNum = deviceIds.length) {
     // 清空缓存
     deviceDataCache = {};
     
-    // 串行请求每个设备的数据
+    // 每批设备只需要一次请求，首屏只有一批
     let loadedCount = 0;
-    for (const deviceId of deviceIds) {
-        try {
-            await loadDeviceData(deviceId);
-            loadedCount++;
-            // 更新进度显示
-            cardsContainer.innerHTML = `<p>数据查询中(${loadedCount}/${totalNum})...</p>`;
-        } catch (error) {
-            console.error(`加载设备 ${deviceId} 数据时出错:`, error);
-            loadedCount++;
-            // 更新进度显示
-            cardsContainer.innerHTML = `<p>数据查询中(${loadedCount}/${totalNum})...</p>`;
-        }
+    for (let i = 0; i < deviceIds.length; i += BATCH_MAX_DEVICES) {
+        const batchIds = deviceIds.slice(i, i + BATCH_MAX_DEVICES);
+        await loadDeviceDataBatch(batchIds);
+        loadedCount += batchIds.length;
+        // 更新进度显示
+        cardsContainer.innerHTML = `<p>数据查询中(${loadedCount}/${totalNum})...</p>`;
     }
     
     // 渲染所有卡片
     renderAllCards();
 }
 
-// 加载单个设备的数据
-async function loadDeviceData(deviceId) {
+// 一次请求加载一批设备的数据
+async function loadDeviceDataBatch(deviceIds) {
     try {
         const apiUrl = getApiUrl('main');
+        const ids = deviceIds.map(id => encodeURIComponent(id)).join(',');
         let url;
         
         if (currentDataMode === 'count') {
             // 数据点模式
-            url = `${apiUrl}/?mode=check&device_id=${deviceId}&data_num=${currentDataCount}`;
+            url = `${apiUrl}/?mode=check_batch&device_ids=${ids}&data_num=${currentDataCount}&format=columnar`;
         } else {
             // 日期模式
             const startDate = document.getElementById('start-date').value;
             const endDate = document.getElementById('end-date').value;
-            url = `${apiUrl}/?mode=check_daily_range&device_id=${deviceId}&start_day=${startDate}&end_day=${endDate}`;
+            url = `${apiUrl}/?mode=check_batch&device_ids=${ids}&start_day=${startDate}&end_day=${endDate}&format=columnar`;
         }
         
         const response = await fetchWithTimeout(url);
         const data = await response.json();
         
         if (data.code === 200) {
-            // 保存到缓存
-            deviceDataCache[deviceId] = data;
+            // 保存到缓存，按列返回的读数转换为逐行对象，供卡片和图表使用
+            for (const [deviceId, deviceData] of Object.entries(data.devices)) {
+                deviceDataCache[deviceId] = columnarToRows(deviceData);
+            }
+            if (data.missing && data.missing.length > 0) {
+                console.error('以下设备未找到:', data.missing);
+            }
         } else {
-            console.error(`获取设备 ${deviceId} 数据失败:`, data);
+            console.error('批量获取设备数据失败:', data);
         }
     } catch (error) {
-        handleError(error, `获取设备 ${deviceId} 数据`);
+        handleError(error, `批量获取 ${deviceIds.length} 个设备数据`);
     }
 }
 
+// 0-59 的两位数字符串,格式化时间时查表,一次转换上千个时间戳时比逐个 padStart 快
+const TWO_DIGITS = Array.from({ length: 60 }, (_, i) => String(i).padStart(2, '0'));
+
+// 把读表时间的Unix时间戳(秒)格式化为 YYYY-MM-DD HH:MM:SS(浏览器本地时间)
+function formatReadTime(timestamp) {
+    if (timestamp === null || timestamp === undefined) {
+        return '';
+    }
+    const date = new Date(timestamp * 1000);
+    return date.getFullYear() + '-' + TWO_DIGITS[date.getMonth() + 1] + '-' + TWO_DIGITS[date.getDate()] + ' ' +
+        TWO_DIGITS[date.getHours()] + ':' + TWO_DIGITS[date.getMinutes()] + ':' + TWO_DIGITS[date.getSeconds()];
+}
+
+// 把 format=columnar 返回的列数组转换为逐行对象: 读数和金额已是数值,缺失的值(null)转为NaN
+function columnarToRows(deviceData) {
+    const columns = deviceData.columns;
+    if (!columns) {
+        return deviceData;
+    }
+    const names = Object.keys(columns).filter(name => name !== 'read_time');
+    const rows = new Array(columns.read_time.length);
+    for (let i = 0; i < rows.length; i++) {
+        const row = {
+            device_id: deviceData.device_id,
+            read_time: formatReadTime(columns.read_time[i])
+        };
+        for (const name of names) {
+            const value = columns[name][i];
+            row[name] = value === null ? NaN : value;
+        }
+        rows[i] = row;
+    }
+    const result = Object.assign({}, deviceData, { rows: rows });
+    delete result.columns;
+    return result;
+}
+
 // 重新加载设备数据
 async function reloadDeviceData() {
     if (currentDeviceIds.length > 0) {
@@ -1015,6 +1205,15 @@ function createDeviceCard(deviceData) {
     return card;
 }
 
+// 计算一条读数的用量: 优先使用入库时计算好的diff_reading,缺失时回退为与上一条读数相减
+function readingUsage(row, olderRow) {
+    const diff = row.diff_reading;
+    if (!isNaN(diff)) {
+        return diff;
+    }
+    return row.total_reading - olderRow.total_reading;
+}
+
 // 计算显示的数据
 function calculateDisplayData(rows) {
     if (!rows || rows.length === 0) {
@@ -1026,19 +1225,18 @@ function calculateDisplayData(rows) {
     
     switch (mode) {
         case 'usage':
-            // 用量模式: 新total_reading - 旧total_reading
+            // 用量模式: 优先使用diff_reading,否则为新total_reading - 旧total_reading
             // 只计算到倒数第二个数据,避免最后一个显示N/A
             const usageData = [];
             for (let i = 0; i < rows.length - 1; i++) {
-                const currentReading = parseFloat(rows[i].total_reading);
-                const previousReading = parseFloat(rows[i + 1].total_reading);
+                const usageValue = readingUsage(rows[i], rows[i + 1]);
                 
                 // 检查数值是否有效
-                if (isNaN(currentReading) || isNaN(previousReading)) {
+                if (isNaN(usageValue)) {
                     continue; // 跳过无效数据
                 }
                 
-                const usage = (currentReading - previousReading).toFixed(2);
+                const usage = usageValue.toFixed(2);
                 
                 usageData.push({
                     time: rows[i].read_time,
@@ -1053,8 +1251,8 @@ function calculateDisplayData(rows) {
             // 只有负数才表示消耗,正数表示充值
             const costData = [];
             for (let i = 0; i < rows.length - 1; i++) {
-                const currentBalance = parseFloat(rows[i].remainingBalance);
-                const previousBalance = parseFloat(rows[i + 1].remainingBalance);
+                const currentBalance = rows[i].remainingBalance;
+                const previousBalance = rows[i + 1].remainingBalance;
                 
                 // 检查数值是否有效
                 if (isNaN(currentBalance) || isNaN(previousBalance)) {
@@ -1083,7 +1281,7 @@ function calculateDisplayData(rows) {
             // 总量模式: 直接用读表数据
             return rows.map(row => {
                 // 确保数值有效
-                const value = parseFloat(row.total_reading);
+                const value = row.total_reading;
                 return {
                     time: row.read_time,
                     value: `读数: ${isNaN(value) ? row.total_reading : value.toFixed(2)}`
@@ -1094,7 +1292,7 @@ function calculateDisplayData(rows) {
             // 余额模式: 直接显示remainingBalance
             return rows.map(row => {
                 // 确保数值有效
-                const value = parseFloat(row.remainingBalance);
+                const value = row.remainingBalance;
                 return {
                     time: row.read_time,
                     value: `余额: ${isNaN(value) ? row.remainingBalance : value.toFixed(2)}`
@@ -1105,7 +1303,7 @@ function calculateDisplayData(rows) {
             // 默认返回balance模式的数据
             return rows.map(row => {
                 // 确保数值有效
-                const value = parseFloat(row.remainingBalance);
+                const value = row.remainingBalance;
                 return {
                     time: row.read_time,
                     value: `余额: ${isNaN(value) ? row.remainingBalance : value.toFixed(2)}`
@@ -1195,14 +1393,12 @@ function prepareMiniChartData(rows) {
     
     switch (mode) {
         case 'usage':
-            // 用量模式: 新total_reading - 旧total_reading
+            // 用量模式: 优先使用diff_reading,否则为新total_reading - 旧total_reading
             const usageLabels = [];
             const usageValues = [];
             
             for (let i = 0; i < reversedRows.length - 1; i++) {
-                const currentReading = parseFloat(reversedRows[i + 1].total_reading);
-                const previousReading = parseFloat(reversedRows[i].total_reading);
-                const usage = currentReading - previousReading;
+                const usage = readingUsage(reversedRows[i + 1], reversedRows[i]);
                 
                 usageLabels.push(reversedRows[i + 1].read_time);
                 usageValues.push(usage);
@@ -1216,8 +1412,8 @@ function prepareMiniChartData(rows) {
             const costValues = [];
             
             for (let i = 0; i < reversedRows.length - 1; i++) {
-                const currentBalance = parseFloat(reversedRows[i + 1].remainingBalance);
-                const previousBalance = parseFloat(reversedRows[i].remainingBalance);
+                const currentBalance = reversedRows[i + 1].remainingBalance;
+                const previousBalance = reversedRows[i].remainingBalance;
                 const cost = previousBalance - currentBalance; // 消耗为正数
                 
                 costLabels.push(reversedRows[i + 1].read_time);
@@ -1232,7 +1428,7 @@ function prepareMiniChartData(rows) {
                 labels: reversedRows.map(row => row.read_time),
                 values: reversedRows.map(row => {
                     // 确保返回数字类型的值
-                    const value = parseFloat(row.total_reading);
+                    const value = row.total_reading;
                     return isNaN(value) ? 0 : value;
                 })
             };
@@ -1243,7 +1439,7 @@ function prepareMiniChartData(rows) {
                 labels: reversedRows.map(row => row.read_time),
                 values: reversedRows.map(row => {
                     // 确保返回数字类型的值
-                    const value = parseFloat(row.remainingBalance);
+                    const value = row.remainingBalance;
                     return isNaN(value) ? 0 : value;
                 })
             };
@@ -1254,7 +1450,7 @@ function prepareMiniChartData(rows) {
                 labels: reversedRows.map(row => row.read_time),
                 values: reversedRows.map(row => {
                     // 确保返回数字类型的值
-                    const value = parseFloat(row.remainingBalance);
+                    const value = row.remainingBalance;
                     return isNaN(value) ? 0 : value;
                 })
             };
@@ -1755,14 +1951,12 @@ function prepareChartData(rows) {
     
     switch (mode) {
         case 'usage':
-            // 用量模式: 新total_reading - 旧total_reading
+            // 用量模式: 优先使用diff_reading,否则为新total_reading - 旧total_reading
             const usageLabels = [];
             const usageValues = [];
             
             for (let i = 0; i < reversedRows.length - 1; i++) {
-                const currentReading = parseFloat(reversedRows[i + 1].total_reading);
-                const previousReading = parseFloat(reversedRows[i].total_reading);
-                const usage = currentReading - previousReading;
+                const usage = readingUsage(reversedRows[i + 1], reversedRows[i]);
                 
                 usageLabels.push(reversedRows[i + 1].read_time);
                 usageValues.push(usage);
@@ -1776,8 +1970,8 @@ function prepareChartData(rows) {
             const costValues = [];
             
             for (let i = 0; i < reversedRows.length - 1; i++) {
-                const currentBalance = parseFloat(reversedRows[i + 1].remainingBalance);
-                const previousBalance = parseFloat(reversedRows[i].remainingBalance);
+                const currentBalance = reversedRows[i + 1].remainingBalance;
+                const previousBalance = reversedRows[i].remainingBalance;
                 const cost = previousBalance - currentBalance; // 消耗为正数
                 
                 costLabels.push(reversedRows[i + 1].read_time);
@@ -1792,7 +1986,7 @@ function prepareChartData(rows) {
                 labels: reversedRows.map(row => row.read_time),
                 values: reversedRows.map(row => {
                     // 确保返回数字类型的值
-                    const value = parseFloat(row.total_reading);
+                    const value = row.total_reading;
                     return isNaN(value) ? 0 : value;
                 })
             };
@@ -1803,7 +1997,7 @@ function prepareChartData(rows) {
                 labels: reversedRows.map(row => row.read_time),
                 values: reversedRows.map(row => {
                     // 确保返回数字类型的值
-                    const value = parseFloat(row.remainingBalance);
+                    const value = row.remainingBalance;
                     return isNaN(value) ? 0 : value;
                 })
             };
@@ -1814,7 +2008,7 @@ function prepareChartData(rows) {
                 labels: reversedRows.map(row => row.read_time),
                 values: reversedRows.map(row => {
                     // 确保返回数字类型的值
-                    const value = parseFloat(row.remainingBalance);
+                    const value = row.remainingBalance;
                     return isNaN(value) ? 0 : value;
                 })
             };
@@ -1840,16 +2034,17 @@ async function searchDevices(keyword) {
         return;
     }
     
-    // 限制关键词长度为8个字符
-    if (keyword.length > 8) {
-        alert("搜索关键词不能超过8个字符.");
+    // 限制关键词长度为50个字符（与服务端一致，联想出的完整安装位置也能直接搜索）
+    if (keyword.length > 50) {
+        alert("搜索关键词不能超过50个字符.");
         return;
     }
     
     try {
         // 使用默认API地址,如果配置已加载则使用配置的地址
         const apiUrl = CONFIG && CONFIG.API_BASE_URL ? CONFIG.API_BASE_URL : 'http://localhost:8080';
-        const response = await fetchWithTimeout(`${apiUrl}/?mode=search&key_word=${encodeURIComponent(keyword)}`);
+        // 服务端按匹配程度排序并分页，只取第一页，一页正好是一次批量查询
+        const response = await fetchWithTimeout(`${apiUrl}/?mode=search&key_word=${encodeURIComponent(keyword)}&page=1&page_size=${BATCH_MAX_DEVICES}`);
         const data = await response.json();
         
         if (data.code === 418) {
@@ -1869,7 +2064,14 @@ async function searchDevices(keyword) {
                 cardsContainer.innerHTML = '<p>什么也没找到哦 ╮(╯▽╰)╭</p>';
             } else {
                 // 加载每个设备的详细数据
-                await loadDeviceDataForIds(currentDeviceIds, data.total);
+                await loadDeviceDataForIds(currentDeviceIds);
+                
+                // 匹配的设备多于一页时提示
+                if (data.total > deviceIds.length) {
+                    const note = document.createElement('p');
+                    note.textContent = `共找到 ${data.total} 个设备，仅显示最匹配的 ${deviceIds.length} 个，请输入更具体的关键词`;
+                    document.getElementById('cards-container').appendChild(note);
+                }
             }
         } else {
             console.error('搜索设备失败:', data);